@@ -0,0 +1,296 @@
+"""
+Caricamento veloce dell'audio per i modelli di riconoscimento vocale.
+
+Sostituisce librosa.load(path, sr=16000): librosa è lento da importare e
+ricampiona con un filtro di alta qualità ma costoso. Qui:
+- i WAV PCM a 16 bit o float32 vengono letti in memory-map (nessuna copia se
+  il file è già mono a 16 kHz float32, lettura pigra per file molto lunghi);
+- gli altri formati vengono decodificati con soundfile e, se non supportati,
+  con una pipe di ffmpeg che ricampiona direttamente alla frequenza richiesta;
+- il ricampionamento usa un filtro polifase (scipy.signal.resample_poly);
+- gli array decodificati vengono tenuti in una cache LRU in memoria,
+  indicizzata dall'hash del contenuto del file.
+
+load_audio() restituisce (campioni, frequenza) come librosa.load().
+"""
+
+import hashlib
+import io
+import os
+import struct
+import subprocess
+import threading
+from collections import OrderedDict
+from math import gcd
+
+import numpy as np
+
+# Frequenza di campionamento attesa da Whisper e Qwen2-Audio
+DEFAULT_SAMPLE_RATE = 16000
+
+# Codici di formato nel chunk "fmt " dei WAV
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def content_hash(source, block_size=1024 * 1024):
+    """Calcola l'hash SHA-256 del contenuto di un file (percorso) o di un buffer di byte"""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def read_wav_header(path):
+    """
+    Legge l'header di un file WAV senza caricarne i campioni.
+
+    Returns:
+        dict: offset e numero di frame dei dati, canali, frequenza, bit per campione,
+        formato ("int" o "float"); None se il file non è un WAV leggibile in memory-map
+    """
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            return None
+
+        fmt = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+            if chunk_id == b"fmt ":
+                fmt_data = f.read(chunk_size)
+                audio_format, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt_data[:16])
+                if audio_format == WAVE_FORMAT_EXTENSIBLE and len(fmt_data) >= 26:
+                    audio_format = struct.unpack("<H", fmt_data[24:26])[0]
+                fmt = (audio_format, channels, sample_rate, block_align, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    return None
+                audio_format, channels, sample_rate, block_align, bits = fmt
+                if (audio_format, bits) == (WAVE_FORMAT_PCM, 16):
+                    sample_format = "int"
+                elif (audio_format, bits) == (WAVE_FORMAT_IEEE_FLOAT, 32):
+                    sample_format = "float"
+                else:
+                    return None
+                # Alcuni encoder in streaming scrivono una dimensione fittizia: si usa quella del file
+                available = os.path.getsize(path) - f.tell()
+                return {
+                    "offset": f.tell(),
+                    "frames": min(chunk_size, available) // block_align,
+                    "channels": channels,
+                    "sample_rate": sample_rate,
+                    "bits": bits,
+                    "format": sample_format
+                }
+            else:
+                # I chunk hanno dimensione pari: un byte di padding se dispari
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def memmap_wav(path, header=None):
+    """
+    Mappa in memoria i campioni di un WAV PCM a 16 bit o float32.
+
+    Returns:
+        numpy.memmap: Array di sola lettura di forma (frame, canali)
+
+    Raises:
+        ValueError: Se il file non è un WAV in un formato supportato
+    """
+    header = header or read_wav_header(path)
+    if header is None:
+        raise ValueError(f"{path}: non è un WAV PCM a 16 bit o float32")
+    dtype = np.dtype("<i2") if header["format"] == "int" else np.dtype("<f4")
+    return np.memmap(path, dtype=dtype, mode='r', offset=header["offset"],
+                     shape=(header["frames"], header["channels"]))
+
+
+def to_float_mono(samples, mono=True):
+    """Converte campioni (frame, canali) in float32, mediando i canali se mono=True"""
+    if samples.dtype == np.int16:
+        scale = np.float32(1.0 / 32768.0)
+        samples = samples.mean(axis=1, dtype=np.float32) * scale if mono else samples.astype(np.float32) * scale
+    elif mono:
+        samples = samples[:, 0] if samples.shape[1] == 1 else samples.mean(axis=1, dtype=np.float32)
+    return samples if samples.dtype == np.float32 else samples.astype(np.float32)
+
+
+def resample(audio, orig_sr, target_sr):
+    """Ricampiona con un filtro polifase; restituisce l'array invariato se le frequenze coincidono"""
+    if orig_sr == target_sr:
+        return audio
+    from scipy.signal import resample_poly
+
+    divisor = gcd(int(orig_sr), int(target_sr))
+    return resample_poly(audio, target_sr // divisor, orig_sr // divisor, axis=0).astype(np.float32, copy=False)
+
+
+def decode_ffmpeg(source, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Decodifica e ricampiona con una pipe di ffmpeg, in float32 mono.
+
+    Args:
+        source (str or bytes): Percorso del file audio oppure i suoi byte
+
+    Raises:
+        subprocess.CalledProcessError: Se ffmpeg fallisce
+        FileNotFoundError: Se ffmpeg non è installato
+    """
+    from_bytes = isinstance(source, (bytes, bytearray))
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if not from_bytes:
+        cmd.append("-nostdin")
+    cmd += ["-i", "pipe:0" if from_bytes else str(source),
+            "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "pipe:1"]
+    result = subprocess.run(cmd, input=bytes(source) if from_bytes else None, check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def _decode_soundfile(source):
+    """Decodifica con soundfile; None se il formato non è supportato da libsndfile"""
+    try:
+        import soundfile as sf
+    except ImportError:
+        return None
+    try:
+        data, sample_rate = sf.read(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source,
+                                    dtype='float32', always_2d=True)
+    except (RuntimeError, TypeError, ValueError):
+        return None
+    return data, sample_rate
+
+
+def _is_zero_copy_wav(header, sr):
+    """True se il WAV è già float32 mono alla frequenza richiesta"""
+    return (header is not None and header["format"] == "float" and header["channels"] == 1
+            and sr in (None, header["sample_rate"]))
+
+
+def decode_audio(source, sr=DEFAULT_SAMPLE_RATE, mono=True):
+    """
+    Decodifica l'audio senza usare la cache.
+
+    Args:
+        source (str or bytes): Percorso del file audio oppure i suoi byte
+        sr (int, optional): Frequenza di destinazione; None per mantenere quella originale
+        mono (bool): Se True restituisce un array 1-D mediando i canali
+
+    Returns:
+        tuple: (campioni float32, frequenza di campionamento)
+    """
+    if not isinstance(source, (bytes, bytearray)):
+        header = read_wav_header(source)
+        if header is not None:
+            samples = memmap_wav(source, header)
+            if _is_zero_copy_wav(header, sr):
+                # Già nel formato richiesto: si restituisce la vista sul file, senza copie
+                return (samples[:, 0] if mono else samples), header["sample_rate"]
+            audio = to_float_mono(samples, mono)
+            return resample(audio, header["sample_rate"], sr or header["sample_rate"]), sr or header["sample_rate"]
+
+    decoded = _decode_soundfile(source)
+    if decoded is not None:
+        data, file_sr = decoded
+        audio = to_float_mono(data, mono)
+        return resample(audio, file_sr, sr or file_sr), sr or file_sr
+
+    if sr is None or not mono:
+        raise ValueError("Formato non supportato da soundfile: ffmpeg richiede mono e una frequenza di destinazione")
+    return decode_ffmpeg(source, sr), sr
+
+
+class AudioCache:
+    """Cache LRU in memoria degli array decodificati, limitata in byte"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, audio, sample_rate):
+        if audio.nbytes > self.max_bytes:
+            return
+        # Gli array in cache sono condivisi tra i chiamanti: vengono resi di sola lettura
+        audio = np.array(audio, dtype=np.float32)
+        audio.flags.writeable = False
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[0].nbytes
+            self.entries[key] = (audio, sample_rate)
+            self.total_bytes += audio.nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.total_bytes, "hits": self.hits, "misses": self.misses}
+
+
+_default_cache = AudioCache()
+
+
+def get_audio_cache():
+    """Restituisce la cache condivisa usata da load_audio()"""
+    return _default_cache
+
+
+def load_audio(source, sr=DEFAULT_SAMPLE_RATE, mono=True, cache=True):
+    """
+    Carica l'audio come array float32, in sostituzione di librosa.load().
+
+    Args:
+        source (str or bytes): Percorso del file audio oppure i suoi byte
+        sr (int, optional): Frequenza di destinazione (default: 16 kHz); None per quella originale
+        mono (bool): Se True restituisce un array 1-D mediando i canali
+        cache (bool or AudioCache): True per la cache condivisa, False per disattivarla
+
+    Returns:
+        tuple: (campioni float32, frequenza di campionamento). Gli array provenienti
+        dalla cache o mappati in memoria sono di sola lettura.
+    """
+    if cache is True:
+        cache = _default_cache
+    if not cache:
+        return decode_audio(source, sr, mono)
+
+    if not isinstance(source, (bytes, bytearray)) and _is_zero_copy_wav(read_wav_header(source), sr):
+        # Il memory-map non richiede decodifica: inutile calcolare l'hash dell'intero file
+        return decode_audio(source, sr, mono)
+
+    key = (content_hash(source), sr, mono)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    audio, sample_rate = decode_audio(source, sr, mono)
+    cache.put(key, audio, sample_rate)
+    return audio, sample_rate
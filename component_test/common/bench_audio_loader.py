@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark del caricamento audio: audio_loader.load_audio contro librosa.load.
+
+Genera clip sintetiche da 5 s, 60 s e 10 minuti (WAV stereo a 44.1 kHz e, se
+ffmpeg è disponibile, MP3) e misura il tempo per ottenere un array mono a
+16 kHz: librosa.load, load_audio senza cache e load_audio con la cache già
+popolata. L'import di librosa viene misurato a parte.
+
+Uso:
+    python bench_audio_loader.py [--durations 5 60 600] [--repeat 3] [--output_dir test_output/bench_audio]
+"""
+
+import argparse
+import os
+import subprocess
+import time
+import wave
+
+import numpy as np
+
+from audio_loader import DEFAULT_SAMPLE_RATE, AudioCache, load_audio
+
+SOURCE_SAMPLE_RATE = 44100
+
+
+def create_clip(path, duration, sample_rate=SOURCE_SAMPLE_RATE):
+    """Crea un WAV stereo a 16 bit con un segnale simile alla voce (toni modulati e rumore)"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    signal = 0.3 * np.sin(2 * np.pi * 180 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    signal += rng.normal(0, 0.01, len(t))
+    stereo = np.stack([signal, 0.8 * signal], axis=1)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(2)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes((np.clip(stereo, -1, 1) * 32767).astype(np.int16).tobytes())
+
+
+def create_mp3(wav_path, mp3_path):
+    """Converte il WAV in MP3 con ffmpeg; False se ffmpeg non è disponibile"""
+    try:
+        subprocess.run(["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-nostdin",
+                        "-i", wav_path, "-b:a", "128k", mp3_path], check=True)
+        return True
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return False
+
+
+def best_time(func, repeat):
+    """Tempo minimo su repeat esecuzioni"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronta audio_loader.load_audio con librosa.load")
+    parser.add_argument("--durations", type=float, nargs="+", default=[5, 60, 600],
+                        help="Durate delle clip in secondi (default: 5 60 600)")
+    parser.add_argument("--repeat", type=int, default=3, help="Ripetizioni per misura (default: 3)")
+    parser.add_argument("--output_dir", default="test_output/bench_audio",
+                        help="Cartella per le clip generate (default: test_output/bench_audio)")
+
+    args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    try:
+        import librosa
+        print(f"Import di librosa: {time.perf_counter() - start:.2f} s")
+    except ImportError:
+        librosa = None
+        print("librosa non installato: il confronto mostra solo audio_loader")
+
+    clips = []
+    for duration in args.durations:
+        wav_path = os.path.join(args.output_dir, f"clip_{duration:g}s.wav")
+        if not os.path.exists(wav_path):
+            create_clip(wav_path, duration)
+        clips.append((f"{duration:g} s WAV", wav_path))
+        mp3_path = os.path.join(args.output_dir, f"clip_{duration:g}s.mp3")
+        if os.path.exists(mp3_path) or create_mp3(wav_path, mp3_path):
+            clips.append((f"{duration:g} s MP3", mp3_path))
+
+    print(f"\n{'Clip':<14} {'librosa':>10} {'load_audio':>12} {'in cache':>10} {'speedup':>9} {'diff RMS':>10}")
+    for label, path in clips:
+        cache = AudioCache()
+        fast_time = best_time(lambda: load_audio(path, DEFAULT_SAMPLE_RATE, cache=False), args.repeat)
+        load_audio(path, DEFAULT_SAMPLE_RATE, cache=cache)
+        cached_time = best_time(lambda: load_audio(path, DEFAULT_SAMPLE_RATE, cache=cache), args.repeat)
+
+        if librosa is not None:
+            librosa_time = best_time(lambda: librosa.load(path, sr=DEFAULT_SAMPLE_RATE), args.repeat)
+            reference, _ = librosa.load(path, sr=DEFAULT_SAMPLE_RATE)
+            fast, _ = load_audio(path, DEFAULT_SAMPLE_RATE, cache=False)
+            # Gli MP3 possono differire di qualche campione di ritardo del decoder
+            length = min(len(reference), len(fast))
+            diff = np.sqrt(np.mean((reference[:length] - fast[:length]) ** 2))
+            print(f"{label:<14} {librosa_time:>9.3f}s {fast_time:>11.3f}s {cached_time:>9.4f}s "
+                  f"{librosa_time / fast_time:>8.1f}x {diff:>10.4f}")
+        else:
+            print(f"{label:<14} {'-':>10} {fast_time:>11.3f}s {cached_time:>9.4f}s {'-':>9} {'-':>10}")
+
+
+if __name__ == "__main__":
+    main()
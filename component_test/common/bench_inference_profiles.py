@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark dei profili di inferenza per Whisper e Qwen2-Audio.
+
+Ogni profilo viene eseguito in un processo separato, così il picco di memoria
+(RSS) misurato è solo quello del profilo. Per ogni profilo si riportano:
+tempo di caricamento, latenza della prima inferenza e mediana delle
+successive, RTF (tempo di inferenza / durata dell'audio) e picco di RSS.
+
+Uso:
+    python bench_inference_profiles.py -a audio.wav [--target whisper|qwen] [--profiles fp32 int8 bf16]
+        [--threads 4] [--compile] [--repeat 3] [--output risultati.json]
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+COMPONENT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+DEFAULT_QWEN_PROMPT = "Trascrivi il contenuto di questo audio."
+
+
+def peak_rss_mb():
+    """Picco di memoria residente del processo corrente in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss è in KB su Linux e in byte su macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_whisper(audio_file, profile, threads, compile_model, model_size):
+    sys.path.insert(0, os.path.join(COMPONENT_DIR, "whisper"))
+    from test_whisper import WHISPER_SAMPLE_RATE, load_whisper_model, transcribe_array
+    from audio_loader import load_audio
+
+    audio_data, _ = load_audio(audio_file, sr=WHISPER_SAMPLE_RATE)
+    start = time.perf_counter()
+    processor, model, device = load_whisper_model(model_size, "cpu", profile, threads, compile_model)
+    load_time = time.perf_counter() - start
+
+    def infer():
+        return transcribe_array(audio_data, processor, model, device)
+
+    return load_time, len(audio_data) / WHISPER_SAMPLE_RATE, infer
+
+
+def run_qwen(audio_file, profile, threads, compile_model, model_id, prompt=DEFAULT_QWEN_PROMPT,
+             max_new_tokens=64):
+    sys.path.insert(0, os.path.join(COMPONENT_DIR, "qwen"))
+    import torch
+    from transformers import GenerationConfig
+    from test_qwen import load_qwen_model, prepare_qwen_inputs
+    from audio_loader import load_audio
+
+    start = time.perf_counter()
+    processor, model = load_qwen_model(model_id, profile, threads, compile_model)
+    load_time = time.perf_counter() - start
+
+    sampling_rate = processor.feature_extractor.sampling_rate
+    audio_data, _ = load_audio(audio_file, sr=sampling_rate)
+    generation_config = GenerationConfig(max_new_tokens=max_new_tokens, num_beams=1, do_sample=False,
+                                         temperature=None, top_p=None, top_k=None,
+                                         pad_token_id=processor.tokenizer.pad_token_id,
+                                         eos_token_id=processor.tokenizer.eos_token_id)
+
+    def infer():
+        inputs = prepare_qwen_inputs(audio_data, prompt, processor, model)
+        with torch.no_grad():
+            generate_ids = model.generate(**inputs, generation_config=generation_config)
+        new_tokens = generate_ids[:, inputs.input_ids.size(1):]
+        return processor.batch_decode(new_tokens, skip_special_tokens=True)[0]
+
+    return load_time, len(audio_data) / sampling_rate, infer
+
+
+def run_profile(args):
+    """Esegue un singolo profilo nel processo corrente e restituisce le misure"""
+    sys.path.insert(0, os.path.join(COMPONENT_DIR, "common"))
+    runner = run_whisper if args.target == "whisper" else run_qwen
+    model = args.model or ("small" if args.target == "whisper" else "Qwen/Qwen2-Audio-7B-Instruct")
+    load_time, duration, infer = runner(args.audio, args.worker, args.threads, args.compile, model)
+
+    start = time.perf_counter()
+    text = infer()
+    first_latency = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        infer()
+        latencies.append(time.perf_counter() - start)
+    latency = statistics.median(latencies) if latencies else first_latency
+
+    return {
+        "target": args.target,
+        "model": model,
+        "profile": args.worker,
+        "threads": args.threads,
+        "compile": args.compile,
+        "audio_duration": duration,
+        "load_time": load_time,
+        "first_latency": first_latency,
+        "latency": latency,
+        "rtf": latency / duration if duration else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "text": text
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronta i profili di inferenza di Whisper e Qwen2-Audio")
+    parser.add_argument("-a", "--audio", required=True, help="File audio di prova")
+    parser.add_argument("--target", choices=["whisper", "qwen"], default="whisper", help="Modello da misurare (default: whisper)")
+    parser.add_argument("-m", "--model", help="Dimensione di Whisper o ID del modello Qwen")
+    parser.add_argument("--profiles", nargs="+", default=["fp32", "int8", "bf16"],
+                        help="Profili da confrontare (default: fp32 int8 bf16)")
+    parser.add_argument("--threads", type=int, help="Thread di PyTorch (default: automatico)")
+    parser.add_argument("--compile", action="store_true", help="Compila il forward con torch.compile")
+    parser.add_argument("--repeat", type=int, default=3, help="Inferenze misurate dopo la prima (default: 3)")
+    parser.add_argument("--output", help="File JSON in cui salvare i risultati")
+    # Uso interno: esecuzione di un singolo profilo nel processo figlio
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_profile(args)))
+        return
+
+    results = []
+    for profile in args.profiles:
+        print(f"Profilo {profile}...", flush=True)
+        cmd = [sys.executable, os.path.abspath(__file__), "-a", args.audio, "--target", args.target,
+               "--repeat", str(args.repeat), "--worker", profile]
+        if args.model:
+            cmd += ["-m", args.model]
+        if args.threads:
+            cmd += ["--threads", str(args.threads)]
+        if args.compile:
+            cmd.append("--compile")
+        completed = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            print(f"  errore nel profilo {profile} (codice {completed.returncode})")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{'Profilo':<8} {'caricamento':>12} {'1a infer.':>10} {'latenza':>9} {'RTF':>6} {'picco RSS':>11}")
+    for result in results:
+        print(f"{result['profile']:<8} {result['load_time']:>11.2f}s {result['first_latency']:>9.2f}s "
+              f"{result['latency']:>8.2f}s {result['rtf']:>6.2f} {result['peak_rss_mb']:>8.0f} MB")
+    for result in results:
+        print(f"  {result['profile']}: {result['text'][:100]}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\nRisultati salvati in '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
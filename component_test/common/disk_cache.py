@@ -0,0 +1,160 @@
+"""
+Base comune delle cache su disco: audio sintetizzato (tts_cache.py), risultati
+di Rhubarb (lipsync_cache.py) e feature audio (feature_cache.py).
+
+Ogni voce è un gruppo di file "{chiave}{suffisso}" nella directory della cache,
+ad esempio "{chiave}.mp3" e "{chiave}.json"; la chiave è un hash SHA-256
+esadecimale. DiskCache mantiene l'indice LRU delle voci, ricostruito all'avvio
+dalle date di modifica dei file (aggiornate a ogni hit), ed elimina le voci
+usate meno di recente oltre lo spazio o il numero di voci massimo. Le
+scritture sono atomiche (file temporaneo + os.replace), così un processo
+interrotto non lascia mai voci corrotte.
+"""
+
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Prefisso dei file temporanei, eliminati all'avvio se rimasti da una scrittura interrotta
+TEMP_PREFIX = ".tmp_"
+
+_KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def atomic_write(path, data):
+    """Scrive i dati su un file temporaneo nella stessa directory e lo rinomina atomicamente"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=TEMP_PREFIX)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+class DiskCache:
+    # Suffisso del file scritto per ultimo: le voci senza questo file sono incomplete
+    required_suffix = None
+
+    def __init__(self, cache_dir, max_bytes=None, max_entries=None):
+        """
+        Inizializza la cache, ricostruendo l'indice LRU dai file già presenti su disco.
+
+        Args:
+            cache_dir (str): Directory in cui salvare le voci della cache
+            max_bytes (int, optional): Spazio massimo occupato dai file della cache
+            max_entries (int, optional): Numero massimo di voci conservate
+        """
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # chiave -> {suffisso: byte}, ordinato dal meno al più recentemente usato
+        self._index = OrderedDict()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.cache_dir, f"{key}{suffix}")
+
+    def _load_index(self):
+        entries = {}
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(TEMP_PREFIX):
+                # Residuo di una scrittura interrotta
+                os.unlink(path)
+                continue
+            key, dot, suffix = name.partition(".")
+            if not dot or not _KEY_PATTERN.fullmatch(key):
+                continue
+            mtime, files = entries.setdefault(key, [0.0, {}])
+            entries[key][0] = max(mtime, os.path.getmtime(path))
+            files[dot + suffix] = os.path.getsize(path)
+
+        for key, (_, files) in sorted(entries.items(), key=lambda item: item[1][0]):
+            self._index[key] = files
+            self.total_bytes += sum(files.values())
+            if self.required_suffix and self.required_suffix not in files:
+                self._remove(key)
+        self._evict()
+
+    def _touch(self, key):
+        """Segna la voce come usata di recente, anche per le istanze future"""
+        self._index.move_to_end(key)
+        for suffix in self._index[key]:
+            try:
+                os.utime(self._path(key, suffix))
+            except OSError:
+                pass
+
+    def _remove(self, key):
+        """Elimina una voce dall'indice e dal disco"""
+        files = self._index.pop(key, {})
+        self.total_bytes -= sum(files.values())
+        for suffix in files:
+            if os.path.exists(self._path(key, suffix)):
+                os.unlink(self._path(key, suffix))
+
+    def _store(self, key, files):
+        """
+        Scrive i file di una voce ({suffisso: dati}) nell'ordine indicato e la segna
+        come la più recente. I file della versione precedente non riscritti vengono eliminati.
+        """
+        previous = self._index.pop(key, {})
+        self.total_bytes -= sum(previous.values())
+        for suffix in previous:
+            if suffix not in files and os.path.exists(self._path(key, suffix)):
+                os.unlink(self._path(key, suffix))
+
+        sizes = {}
+        for suffix, data in files.items():
+            atomic_write(self._path(key, suffix), data)
+            sizes[suffix] = memoryview(data).nbytes
+        self._index[key] = sizes
+        self.total_bytes += sum(sizes.values())
+        self.stores += 1
+        self._evict()
+
+    def _evict(self):
+        """Elimina le voci meno recenti finché la cache non rientra nei limiti"""
+        while self._index and ((self.max_bytes is not None and self.total_bytes > self.max_bytes) or
+                               (self.max_entries is not None and len(self._index) > self.max_entries)):
+            self._remove(next(iter(self._index)))
+            self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._index
+
+    def clear(self):
+        """Svuota completamente la cache"""
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+
+    def stats(self):
+        """Restituisce le statistiche di utilizzo della cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,199 @@
+"""
+Cache su disco delle feature audio (log-mel) di Whisper e Qwen2-Audio.
+
+Il processor ricalcola lo spettrogramma log-mel a ogni chiamata, anche quando
+la stessa clip viene analizzata più volte con prompt diversi. Qui il feature
+extractor del processor viene avvolto da CachedFeatureExtractor: le feature di
+ogni clip vengono salvate in file .npy e, alle chiamate successive, rilette in
+memory-map invece di essere ricalcolate.
+
+La chiave è l'hash SHA-256 dei campioni combinato con la configurazione del
+feature extractor (numero di bande mel, hop, lunghezza della finestra, ...) e
+con le opzioni della chiamata: un modello diverso o un'opzione diversa
+producono una nuova voce. Oltre la dimensione massima vengono eliminate le
+voci usate meno di recente.
+
+Uso:
+    from feature_cache import enable_feature_cache
+    enable_feature_cache(processor, "feature_cache")
+"""
+
+import hashlib
+import io
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+# Opzioni che non cambiano il contenuto delle feature, ma solo il tipo restituito
+_IGNORED_KWARGS = ("return_tensors",)
+
+
+def array_hash(audio):
+    """Calcola l'hash SHA-256 dei campioni, del loro tipo e della loro forma"""
+    audio = np.ascontiguousarray(audio)
+    digest = hashlib.sha256(f"{audio.dtype.str}{audio.shape}".encode("ascii"))
+    digest.update(memoryview(audio).cast("B"))
+    return digest.hexdigest()
+
+
+def extractor_fingerprint(feature_extractor):
+    """Hash della configurazione del feature extractor (incluso il banco di filtri mel)"""
+    return hashlib.sha256(feature_extractor.to_json_string().encode("utf-8")).hexdigest()
+
+
+class FeatureCache(DiskCache):
+    def __init__(self, cache_dir, max_bytes=2 * 1024 * 1024 * 1024):
+        """
+        Args:
+            cache_dir (str): Directory in cui salvare le feature ("{chiave}.{campo}.npy")
+            max_bytes (int): Spazio massimo occupato dai file della cache
+        """
+        super().__init__(cache_dir, max_bytes=max_bytes)
+
+    def get(self, key):
+        """
+        Restituisce le feature salvate per la chiave, oppure None.
+
+        Returns:
+            dict: {campo: array in memory-map di sola lettura}
+        """
+        with self._lock:
+            files = self._index.get(key)
+            if files is None:
+                self.misses += 1
+                return None
+            try:
+                arrays = {suffix[1:-4]: np.load(self._path(key, suffix), mmap_mode="r") for suffix in files}
+            except (FileNotFoundError, ValueError):
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._touch(key)
+            self.hits += 1
+            return arrays
+
+    def put(self, key, arrays):
+        """Salva le feature di una clip ({campo: array}) per la chiave"""
+        files = {}
+        for field, array in arrays.items():
+            buffer = io.BytesIO()
+            np.save(buffer, np.ascontiguousarray(array), allow_pickle=False)
+            files[f".{field}.npy"] = buffer.getbuffer()
+        with self._lock:
+            self._store(key, files)
+
+
+class MemoryFeatureCache:
+    """Cache in memoria con la stessa interfaccia di FeatureCache, limitata alle voci usate più di recente"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            arrays = self.entries.get(key)
+            if arrays is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return arrays
+
+    def put(self, key, arrays):
+        with self._lock:
+            self.entries[key] = arrays
+            self.entries.move_to_end(key)
+            while self.max_entries is not None and len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+class CachedFeatureExtractor:
+    """
+    Feature extractor con cache: si usa al posto di processor.feature_extractor.
+
+    Ogni clip del batch viene cercata separatamente; solo le clip mancanti vengono
+    passate al feature extractor originale, in un'unica chiamata. La cache è usata
+    solo con padding="max_length" (il default di Whisper e l'opzione usata dal
+    processor di Qwen2-Audio): così le feature di una clip non dipendono dalle
+    altre clip del batch.
+    """
+
+    def __init__(self, feature_extractor, cache):
+        self.feature_extractor = feature_extractor
+        self.cache = cache
+        self.fingerprint = extractor_fingerprint(feature_extractor)
+
+    def __getattr__(self, name):
+        # sampling_rate, n_samples, chunk_length, ... vengono dal feature extractor originale
+        return getattr(self.feature_extractor, name)
+
+    def _key(self, audio, kwargs):
+        options = {name: value for name, value in kwargs.items() if name not in _IGNORED_KWARGS}
+        payload = json.dumps({"audio": array_hash(audio), "extractor": self.fingerprint, "options": options},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def __call__(self, raw_speech, *args, return_tensors=None, **kwargs):
+        from transformers import BatchFeature
+
+        if args or kwargs.get("padding", "max_length") != "max_length":
+            return self.feature_extractor(raw_speech, *args, return_tensors=return_tensors, **kwargs)
+
+        batch = [raw_speech] if isinstance(raw_speech, np.ndarray) and raw_speech.ndim == 1 else list(raw_speech)
+        batch = [np.asarray(audio, dtype=np.float32) for audio in batch]
+        keys = [self._key(audio, kwargs) for audio in batch]
+        items = [self.cache.get(key) for key in keys]
+
+        # La stessa clip ripetuta nel batch (es. più domande sullo stesso audio) viene calcolata una volta
+        missing = {}
+        for i, item in enumerate(items):
+            if item is None:
+                missing.setdefault(keys[i], i)
+        if missing:
+            computed = self.feature_extractor([batch[i] for i in missing.values()], return_tensors="np", **kwargs)
+            for position, key in enumerate(missing):
+                arrays = {field: np.asarray(value[position]) for field, value in computed.items()}
+                self.cache.put(key, arrays)
+                missing[key] = arrays
+            items = [item if item is not None else missing[key] for item, key in zip(items, keys)]
+        logger.debug(f"Feature audio: {len(batch)} clip, {len(missing)} calcolate")
+
+        fields = items[0].keys()
+        data = {field: np.stack([item[field] for item in items]) for field in fields}
+        return BatchFeature(data, tensor_type=return_tensors)
+
+
+def enable_feature_cache(processor, cache_dir, max_mb=2048):
+    """
+    Attiva la cache delle feature su un processor di Whisper o Qwen2-Audio.
+
+    Args:
+        processor: WhisperProcessor o processor di Qwen2-Audio
+        cache_dir (str): Directory della cache
+        max_mb (int): Spazio massimo della cache in MB
+
+    Returns:
+        FeatureCache: La cache, per leggerne le statistiche
+    """
+    feature_extractor = processor.feature_extractor
+    if isinstance(feature_extractor, CachedFeatureExtractor):
+        return feature_extractor.cache
+    cache = FeatureCache(cache_dir, max_mb * 1024 * 1024)
+    processor.feature_extractor = CachedFeatureExtractor(feature_extractor, cache)
+    logger.info(f"Cache delle feature audio in '{cache_dir}' ({cache.stats()['entries']} voci)")
+    return cache
@@ -0,0 +1,187 @@
+"""
+Livello client HTTP condiviso da tutti i componenti che parlano con servizi esterni
+(ElevenLabs, endpoint HTTP di Unity).
+
+Fornisce una requests.Session con:
+- connessioni keep-alive riutilizzate tramite pool (niente handshake TCP/TLS per ogni richiesta)
+- limite di connessioni per host
+- retry limitati con backoff esponenziale e jitter sugli errori 429/5xx (per POST solo su
+  errori di connessione e 429/503, quando la richiesta non è stata elaborata)
+- timeout di default applicato a tutte le richieste (nessuna attesa illimitata)
+
+Uso:
+    from http_client import get_session
+    session = get_session()
+    response = session.get(url)
+"""
+
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Timeout di default (connessione, lettura) in secondi
+DEFAULT_TIMEOUT = (3.05, 60)
+
+# Timeout per le richieste di inferenza (Whisper, Qwen) che su input lunghi superano il minuto
+INFERENCE_TIMEOUT = (3.05, 600)
+
+# Codici di stato per cui ha senso ritentare la richiesta
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Metodi idempotenti, ritentabili anche dopo un timeout di lettura o un errore 5xx
+RETRY_METHODS = frozenset(["HEAD", "GET", "PUT", "DELETE", "OPTIONS"])
+
+# POST non è idempotente (una sintesi ElevenLabs ripetuta viene addebitata di nuovo, un job di
+# Whisper/Qwen viene eseguito due volte): si ritenta solo quando il server non l'ha elaborato
+POST_RETRY_STATUS_CODES = (429, 503)
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+class JitteredRetry(Retry):
+    """
+    Retry di urllib3 con backoff esponenziale e jitter casuale.
+
+    Gli errori di connessione vengono ritentati per tutti i metodi (la richiesta
+    non è partita); POST, escluso da RETRY_METHODS, non viene ritentato dopo un
+    timeout di lettura e solo sui codici POST_RETRY_STATUS_CODES.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == "POST":
+            return status_code in POST_RETRY_STATUS_CODES and status_code in (self.status_forcelist or ())
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return backoff
+        # Equal jitter: metà del backoff fisso, metà casuale, per evitare retry sincronizzati
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter che applica un timeout di default quando la richiesta non ne specifica uno"""
+
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def create_session(retries=3, backoff_factor=0.5, timeout=DEFAULT_TIMEOUT,
+                   pool_connections=10, pool_maxsize=10, pool_block=True,
+                   status_forcelist=RETRY_STATUS_CODES):
+    """
+    Crea una nuova sessione HTTP con pooling delle connessioni, retry e timeout.
+
+    Args:
+        retries (int): Numero massimo di tentativi aggiuntivi per richiesta
+        backoff_factor (float): Fattore del backoff esponenziale tra i tentativi (secondi)
+        timeout (float or tuple): Timeout di default (connessione, lettura) in secondi
+        pool_connections (int): Numero di host distinti di cui mantenere il pool
+        pool_maxsize (int): Numero massimo di connessioni aperte verso lo stesso host
+        pool_block (bool): Se True, attende una connessione libera invece di superare pool_maxsize
+        status_forcelist (tuple): Codici di stato HTTP per cui ritentare
+
+    Returns:
+        requests.Session: Sessione configurata
+    """
+    retry = JitteredRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        allowed_methods=RETRY_METHODS,
+        respect_retry_after_header=True,
+        # Restituisce l'ultima risposta invece di sollevare un'eccezione: i chiamanti controllano status_code
+        raise_on_status=False
+    )
+
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeout,
+        max_retries=retry,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block
+    )
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def is_json(response):
+    """True se la risposta dichiara un corpo JSON nel Content-Type"""
+    return response.headers.get("Content-Type", "").split(";")[0].strip().lower() == "application/json"
+
+
+def json_response(response, service_name):
+    """
+    Restituisce il corpo JSON della risposta di un servizio, controllando prima lo
+    stato: un errore con corpo non JSON (es. la pagina HTML di un proxy) non deve
+    nascondere il codice di stato dietro un errore di decodifica.
+
+    Args:
+        response (requests.Response): Risposta ricevuta
+        service_name (str): Nome del servizio, per i messaggi di errore
+
+    Raises:
+        RuntimeError: Se lo stato non è 200 o il corpo non è JSON
+    """
+    if response.status_code != 200:
+        detail = None
+        if is_json(response):
+            try:
+                detail = response.json().get("error")
+            except (ValueError, AttributeError):
+                pass
+        detail = detail or response.text[:200].strip()
+        raise RuntimeError(f"Errore {response.status_code} dal {service_name}: {detail}")
+    if not is_json(response):
+        raise RuntimeError(f"Risposta non JSON dal {service_name} "
+                           f"(Content-Type: {response.headers.get('Content-Type', 'assente')})")
+    return response.json()
+
+
+def get_session():
+    """
+    Restituisce la sessione HTTP condivisa dal processo, creandola alla prima chiamata.
+
+    Returns:
+        requests.Session: Sessione condivisa
+    """
+    global _shared_session
+    if _shared_session is None:
+        with _shared_session_lock:
+            if _shared_session is None:
+                _shared_session = create_session()
+    return _shared_session
+
+
+def configure_session(**kwargs):
+    """
+    Sostituisce la sessione condivisa con una nuova configurazione.
+    Accetta gli stessi argomenti di create_session().
+
+    Returns:
+        requests.Session: La nuova sessione condivisa
+    """
+    global _shared_session
+    with _shared_session_lock:
+        old_session = _shared_session
+        _shared_session = create_session(**kwargs)
+    if old_session is not None:
+        old_session.close()
+    return _shared_session
@@ -0,0 +1,105 @@
+"""
+Profili di inferenza su CPU per Whisper e Qwen2-Audio.
+
+La maggior parte delle macchine non ha una GPU: questi profili permettono di
+scegliere, in modo uniforme per i due modelli, come eseguire l'inferenza.
+- "fp32": pesi in float32, nessuna modifica (comportamento precedente);
+- "int8": quantizzazione dinamica a int8 dei layer lineari (pesi 4 volte più
+  piccoli, matmul int8 su CPU); il modello va caricato in float32;
+- "bf16": pesi e attivazioni in bfloat16, se la CPU lo supporta in hardware
+  (AVX512-BF16 o AMX), altrimenti si ricade su fp32;
+- "fp16": mezza precisione, solo su GPU (il profilo di test_qwen_lw.py).
+
+A ogni profilo si possono aggiungere il numero di thread di PyTorch e
+torch.compile sul forward del modello.
+"""
+
+import logging
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+PROFILES = ("fp32", "int8", "bf16", "fp16")
+
+
+def cpu_supports_bf16():
+    """True se la CPU esegue le operazioni bfloat16 in hardware"""
+    try:
+        return bool(torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve_profile(profile, device="cpu"):
+    """Restituisce il profilo effettivamente applicabile sul dispositivo"""
+    if profile not in PROFILES:
+        raise ValueError(f"Profilo sconosciuto: {profile} (disponibili: {', '.join(PROFILES)})")
+    on_gpu = str(device).startswith("cuda")
+    if profile == "int8" and on_gpu:
+        logger.warning("La quantizzazione dinamica int8 è solo per CPU: uso fp16 sulla GPU")
+        return "fp16"
+    if profile == "bf16" and not on_gpu and not cpu_supports_bf16():
+        logger.warning("La CPU non supporta bfloat16 in hardware: uso fp32")
+        return "fp32"
+    if profile == "fp16" and not on_gpu:
+        logger.warning("fp16 non è efficiente su CPU: uso fp32")
+        return "fp32"
+    return profile
+
+
+def load_kwargs(profile):
+    """Argomenti per from_pretrained: i pesi vengono caricati direttamente nel tipo finale"""
+    dtype = {"bf16": torch.bfloat16, "fp16": torch.float16}.get(profile, torch.float32)
+    return {"torch_dtype": dtype, "low_cpu_mem_usage": True}
+
+
+def configure_threads(num_threads=None, num_interop_threads=None):
+    """
+    Imposta i thread di PyTorch. Con un solo processo di inferenza conviene un thread
+    per core fisico; con più processi sulla stessa macchina va diviso tra i processi.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            # Va impostato prima di qualsiasi operazione parallela
+            logger.warning("Impossibile cambiare i thread inter-op dopo l'avvio del parallelismo")
+    logger.info(f"Thread PyTorch: {torch.get_num_threads()} (inter-op: {torch.get_num_interop_threads()})")
+
+
+def apply_profile(model, profile, compile_model=False):
+    """
+    Applica al modello già caricato le trasformazioni del profilo.
+
+    Args:
+        model (torch.nn.Module): Modello caricato con load_kwargs(profile)
+        profile (str): Profilo restituito da resolve_profile()
+        compile_model (bool): Se True compila il forward con torch.compile
+
+    Returns:
+        torch.nn.Module: Il modello da usare per l'inferenza
+    """
+    model.eval()
+    if profile == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info("Layer lineari quantizzati dinamicamente a int8")
+
+    if compile_model:
+        if hasattr(torch, "compile"):
+            # Si compila solo il forward: generate() resta il metodo originale del modello
+            model.forward = torch.compile(model.forward, dynamic=True)
+            logger.info("Forward compilato con torch.compile (la prima inferenza sarà più lenta)")
+        else:
+            logger.warning("torch.compile non disponibile in questa versione di PyTorch")
+    return model
+
+
+def model_dtype(model):
+    """Tipo dei tensori in ingresso atteso dal modello (float32 per i modelli quantizzati)"""
+    for parameter in model.parameters():
+        if parameter.is_floating_point():
+            return parameter.dtype
+    return torch.float32
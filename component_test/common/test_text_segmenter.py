@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Script di test per la suddivisione in frasi delle risposte (text_segmenter),
+sia sul testo completo sia sul testo generato token per token.
+Verifica in particolare che le abbreviazioni vengano riconosciute solo come
+parole intere: "Dan." o "non." chiudono la frase, "dott." no.
+
+Uso:
+    python test_text_segmenter.py
+"""
+
+from text_segmenter import iter_sentences, split_sentences
+
+CASES = [
+    "Ieri sono uscito a cena con il mio amico Dan. Oggi invece devo lavorare fino a tardi.",
+    "Questa volta la risposta è proprio non. Ci riproverò domani con più calma.",
+    "Abbiamo parlato a lungo durante il meeting. Adesso preparo il riassunto per tutti.",
+    "Il nuovo telefono è davvero smart. Lo userò anche per gestire il calendario.",
+]
+
+
+def test_split_sentences():
+    """Verifica la divisione in frasi e il riconoscimento delle abbreviazioni"""
+
+    print("\nTest 1: Abbreviazioni come parole intere")
+    text = "Domani ho un appuntamento con il dott. Rossi in centro. Poi vado a casa a riposare un po'."
+    sentences = split_sentences(text)
+    for sentence in sentences:
+        print(f"  - {sentence}")
+    assert sentences == ["Domani ho un appuntamento con il dott. Rossi in centro.",
+                         "Poi vado a casa a riposare un po'."], "L'abbreviazione 'dott.' non deve chiudere la frase"
+
+    print("\nTest 2: Parole che terminano come un'abbreviazione")
+    for text in CASES:
+        sentences = split_sentences(text)
+        print(f"  - {len(sentences)} frasi: {sentences[0]}")
+        assert len(sentences) == 2, f"Il testo doveva essere diviso in due frasi: {text}"
+
+
+def test_sentence_stream():
+    """Verifica che il testo in streaming venga diviso come il testo completo"""
+
+    print("\nTest 3: Testo generato token per token")
+    texts = CASES + ["Domani ho un appuntamento con il dott. Rossi in centro. Poi vado a casa a riposare un po'."]
+    for text in texts:
+        # Pezzi di 3 caratteri, come i token restituiti dal modello
+        chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+        streamed = list(iter_sentences(chunks))
+        print(f"  - {len(streamed)} frasi: {streamed[0]}")
+        assert streamed == split_sentences(text), f"Lo streaming divide il testo in modo diverso: {text}"
+
+
+def main():
+    test_split_sentences()
+    test_sentence_stream()
+    print("\nTest completato con successo!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Suddivisione del testo delle risposte in frasi da sintetizzare separatamente.
+
+Frasi troppo corte vengono unite alla successiva (ogni sintesi ha un costo
+fisso di latenza), frasi troppo lunghe vengono spezzate su punto e virgola,
+due punti o virgole per non ritardare la prima parte dell'audio.
+"""
+
+import re
+
+# Fine frase: punteggiatura forte seguita da spazio (o fine testo)
+SENTENCE_END = re.compile(r'(?<=[.!?…])["»)\]]*\s+')
+
+# Punti di taglio secondari per le frasi troppo lunghe
+CLAUSE_END = re.compile(r'(?<=[;:,])\s+')
+
+# Abbreviazioni comuni dopo cui il punto non chiude la frase
+ABBREVIATIONS = ("sig.", "sigg.", "sig.ra", "dott.", "dr.", "prof.", "ing.", "avv.", "ecc.", "es.", "pag.", "n.", "art.")
+
+
+def _ends_with_abbreviation(piece):
+    """Verifica se l'ultima parola del pezzo (non un suo suffisso) è un'abbreviazione"""
+    words = piece.rsplit(None, 1)
+    return bool(words) and words[-1].lstrip("\"«([").lower() in ABBREVIATIONS
+
+
+def _split_long(sentence, max_chars):
+    """Spezza una frase più lunga di max_chars sui separatori secondari"""
+    if len(sentence) <= max_chars:
+        return [sentence]
+
+    parts = []
+    current = ""
+    for clause in CLAUSE_END.split(sentence):
+        if current and len(current) + 1 + len(clause) > max_chars:
+            parts.append(current)
+            current = clause
+        else:
+            current = f"{current} {clause}" if current else clause
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_sentences(text, min_chars=20, max_chars=250):
+    """
+    Divide il testo in frasi pronte per la sintesi vocale.
+
+    Args:
+        text (str): Testo della risposta
+        min_chars (int): Lunghezza minima di una frase; le frasi più corte vengono unite alla successiva
+        max_chars (int): Lunghezza oltre la quale una frase viene spezzata sui separatori secondari
+
+    Returns:
+        list: Frasi nell'ordine originale
+    """
+    text = " ".join(text.split())
+    if not text:
+        return []
+
+    # Ricompone i pezzi spezzati dopo un'abbreviazione
+    raw = []
+    for piece in SENTENCE_END.split(text):
+        if raw and _ends_with_abbreviation(raw[-1]):
+            raw[-1] = f"{raw[-1]} {piece}"
+        else:
+            raw.append(piece)
+
+    sentences = []
+    pending = ""
+    for piece in raw:
+        pending = f"{pending} {piece}" if pending else piece
+        if len(pending) >= min_chars:
+            sentences.extend(_split_long(pending, max_chars))
+            pending = ""
+
+    if pending:
+        # Un resto troppo corto viene unito all'ultima frase, se c'è spazio
+        if sentences and len(sentences[-1]) + 1 + len(pending) <= max_chars:
+            sentences[-1] = f"{sentences[-1]} {pending}"
+        else:
+            sentences.append(pending)
+
+    return sentences
+
+
+class SentenceStream:
+    """
+    Versione incrementale di split_sentences per il testo generato token per token.
+
+    feed() riceve i pezzi di testo man mano che arrivano e restituisce le frasi
+    già concluse, così la sintesi della prima frase può partire mentre il
+    modello sta ancora generando le successive. Una frase è conclusa quando
+    dopo la punteggiatura finale arriva uno spazio, cioè quando il modello ha
+    già iniziato la frase seguente.
+    """
+
+    def __init__(self, min_chars=20, max_chars=250):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+        self.pending = ""
+
+    def _complete(self, piece):
+        """Accoda una frase conclusa, unendola alle precedenti se ancora troppo corta"""
+        self.pending = f"{self.pending} {piece}" if self.pending else piece
+        if len(self.pending) < self.min_chars:
+            return []
+        sentences = _split_long(self.pending, self.max_chars)
+        self.pending = ""
+        return sentences
+
+    def feed(self, text):
+        """
+        Aggiunge testo e restituisce le frasi concluse.
+
+        Returns:
+            list: Frasi pronte per la sintesi (eventualmente vuota)
+        """
+        self.buffer += text
+        pieces = SENTENCE_END.split(self.buffer)
+        # L'ultimo pezzo non è ancora seguito da uno spazio: potrebbe continuare
+        self.buffer = pieces.pop()
+
+        sentences = []
+        carry = ""
+        for piece in pieces:
+            piece = " ".join(f"{carry} {piece}".split())
+            if _ends_with_abbreviation(piece):
+                carry = piece
+                continue
+            carry = ""
+            sentences.extend(self._complete(piece))
+        if carry:
+            self.buffer = f"{carry} {self.buffer}"
+
+        # Una frase molto lunga senza punto viene anticipata sui separatori secondari
+        if len(self.buffer) > self.max_chars and not self.pending:
+            clauses = _split_long(" ".join(self.buffer.split()), self.max_chars)
+            if len(clauses) > 1:
+                sentences.extend(clauses[:-1])
+                self.buffer = clauses[-1]
+        return sentences
+
+    def flush(self):
+        """Restituisce il testo rimasto alla fine della generazione"""
+        rest = " ".join(f"{self.pending} {self.buffer}".split())
+        self.buffer = ""
+        self.pending = ""
+        return _split_long(rest, self.max_chars) if rest else []
+
+
+def iter_sentences(chunks, min_chars=20, max_chars=250):
+    """
+    Restituisce le frasi man mano che i pezzi di testo le completano.
+
+    Args:
+        chunks (iterable): Pezzi di testo, ad esempio da un TextIteratorStreamer
+
+    Yields:
+        str: Frasi pronte per la sintesi vocale
+    """
+    stream = SentenceStream(min_chars, max_chars)
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    yield from stream.flush()
@@ -1,10 +1,16 @@
-import requests
+import base64
 import json
 import os
 from pathlib import Path
 
+# tts_cache aggiunge COMMON_DIR (component_test/common) a sys.path
+from tts_cache import COMMON_DIR, cache_key
+
+from http_client import get_session
+
 class ElevenLabsTTS:
-    def __init__(self, api_key, voice_id=None, model_id="eleven_multilingual_v2"):
+    def __init__(self, api_key, voice_id=None, model_id="eleven_multilingual_v2",
+                 base_url="https://api.elevenlabs.io/v1", session=None, timeout=None, cache=None):
         """
         Inizializza il client ElevenLabs TTS.
 
@@ -12,20 +18,42 @@ class ElevenLabsTTS:
             api_key (str): La chiave API di ElevenLabs
             voice_id (str, optional): L'ID della voce da utilizzare
             model_id (str, optional): Il modello da utilizzare, default è eleven_multilingual_v2 per supporto multilingua
+            base_url (str, optional): URL base dell'API (utile per puntare a un server finto nei test)
+            session (requests.Session, optional): Sessione HTTP da usare, default è quella condivisa
+            timeout (float or tuple, optional): Timeout delle richieste, default è quello della sessione
+            cache (TTSCache, optional): Cache su disco dell'audio già sintetizzato
         """
         self.api_key = api_key
         self.voice_id = voice_id
         self.model_id = model_id
-        self.base_url = "https://api.elevenlabs.io/v1"
+        self.base_url = base_url.rstrip("/")
+        self.session = session or get_session()
+        self.timeout = timeout
+        self.cache = cache
         self.headers = {
             "xi-api-key": self.api_key,
             "Content-Type": "application/json"
         }
 
+    def _cache_key(self, text, settings):
+        """Chiave della cache per il testo e le impostazioni correnti, None se la cache è disattivata"""
+        if self.cache is None:
+            return None
+        return cache_key(text, self.voice_id, self.model_id, settings)
+
+    @staticmethod
+    def _save_audio(audio, output_path):
+        """Restituisce l'audio come bytes o lo salva su file, come convert_text_to_speech"""
+        if output_path:
+            with open(output_path, 'wb') as f:
+                f.write(audio)
+            return output_path
+        return audio
+
     def list_voices(self):
         """Ottiene la lista delle voci disponibili"""
         url = f"{self.base_url}/voices"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers, timeout=self.timeout)
 
         if response.status_code == 200:
             return response.json()
@@ -62,25 +90,141 @@ class ElevenLabsTTS:
         # Utilizza le impostazioni personalizzate o quelle predefinite
         settings = voice_settings if voice_settings else default_settings
 
+        # Frasi già sintetizzate con la stessa voce e impostazioni non richiedono una nuova chiamata
+        key = self._cache_key(text, settings)
+        if key:
+            cached = self.cache.get(key)
+            if cached:
+                return self._save_audio(cached["audio"], output_path)
+
         payload = {
             "text": text,
             "model_id": self.model_id,
             "voice_settings": settings
         }
 
-        response = requests.post(url, json=payload, headers=self.headers)
+        response = self.session.post(url, json=payload, headers=self.headers, timeout=self.timeout)
 
         if response.status_code == 200:
-            if output_path:
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
-                return output_path
-            else:
-                return response.content
+            if key:
+                self.cache.put(key, response.content)
+            return self._save_audio(response.content, output_path)
         else:
             print(f"Errore {response.status_code}: {response.text}")
             return None
 
+    def stream_text_to_speech(self, text, voice_settings=None, chunk_size=4096, optimize_streaming_latency=None):
+        """
+        Converte il testo in audio in modalità streaming, restituendo i chunk MP3
+        man mano che arrivano dal server invece di attendere la sintesi completa.
+
+        Args:
+            text (str): Il testo da convertire in audio
+            voice_settings (dict, optional): Impostazioni della voce
+            chunk_size (int): Dimensione massima in byte di ciascun chunk restituito
+            optimize_streaming_latency (int, optional): Livello di ottimizzazione della latenza (0-4) lato ElevenLabs
+
+        Yields:
+            bytes: Chunk di audio MP3 nell'ordine di arrivo
+        """
+        if not self.voice_id:
+            raise ValueError("Voice ID non specificato. Utilizzare list_voices() per trovare un ID voce.")
+
+        url = f"{self.base_url}/text-to-speech/{self.voice_id}/stream"
+
+        # Impostazioni predefinite per la voce italiana
+        default_settings = {
+            "stability": 0.5,
+            "similarity_boost": 0.75,
+            "style": 0.0,
+            "use_speaker_boost": True,
+            "speed": 1.0
+        }
+
+        # Utilizza le impostazioni personalizzate o quelle predefinite
+        settings = voice_settings if voice_settings else default_settings
+
+        # L'ottimizzazione della latenza cambia l'audio restituito: fa parte della chiave, non della richiesta
+        key_settings = settings
+        if optimize_streaming_latency is not None:
+            key_settings = dict(settings, optimize_streaming_latency=optimize_streaming_latency)
+        key = self._cache_key(text, key_settings)
+        if key:
+            cached = self.cache.get(key)
+            if cached:
+                audio = cached["audio"]
+                for start in range(0, len(audio), chunk_size):
+                    yield audio[start:start + chunk_size]
+                return
+
+        payload = {
+            "text": text,
+            "model_id": self.model_id,
+            "voice_settings": settings
+        }
+
+        params = {}
+        if optimize_streaming_latency is not None:
+            params["optimize_streaming_latency"] = optimize_streaming_latency
+
+        # stream=True evita di scaricare tutta la risposta prima di restituire il primo chunk
+        with self.session.post(url, json=payload, headers=self.headers, params=params,
+                               stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                print(f"Errore {response.status_code}: {response.text}")
+                return
+
+            received = []
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    if key:
+                        received.append(chunk)
+                    yield chunk
+
+            # Salva in cache solo se lo stream è stato consumato per intero
+            if key and received:
+                self.cache.put(key, b''.join(received))
+
+    def convert_text_to_speech_stream(self, text, output_path=None, voice_settings=None, consumers=None, chunk_size=4096):
+        """
+        Converte il testo in audio in streaming, scrivendo il file in modo incrementale
+        e passando ogni chunk agli stadi successivi (es. Rhubarb, upload su Unity) appena disponibile.
+
+        Args:
+            text (str): Il testo da convertire in audio
+            output_path (str, optional): Il percorso dove salvare il file audio
+            voice_settings (dict, optional): Impostazioni della voce
+            consumers (list, optional): Funzioni chiamate con ogni chunk di audio (bytes)
+            chunk_size (int): Dimensione massima in byte di ciascun chunk
+
+        Returns:
+            bytes or str: Dati audio o percorso del file salvato, None in caso di errore
+        """
+        consumers = consumers or []
+        audio_chunks = []
+        output_handle = open(output_path, 'wb') if output_path else None
+
+        try:
+            for chunk in self.stream_text_to_speech(text, voice_settings=voice_settings, chunk_size=chunk_size):
+                if output_handle:
+                    output_handle.write(chunk)
+                else:
+                    audio_chunks.append(chunk)
+                for consumer in consumers:
+                    consumer(chunk)
+        finally:
+            if output_handle:
+                output_handle.close()
+
+        if output_path:
+            # Nessun byte ricevuto: lo stream è fallito prima di iniziare
+            if os.path.getsize(output_path) == 0:
+                os.unlink(output_path)
+                return None
+            return output_path
+
+        return b''.join(audio_chunks) if audio_chunks else None
+
     def convert_text_to_speech_with_timing(self, text, output_path=None, voice_settings=None):
         """
         Converte il testo in audio e ottiene i dati di timing per la sincronizzazione labiale.
@@ -110,13 +254,24 @@ class ElevenLabsTTS:
         # Utilizza le impostazioni personalizzate o quelle predefinite
         settings = voice_settings if voice_settings else default_settings
 
+        key = self._cache_key(text, settings)
+        if key:
+            cached = self.cache.get(key, require_alignment=True)
+            if cached:
+                if output_path:
+                    self._save_audio(cached["audio"], output_path)
+                return {
+                    "audio_data": base64.b64encode(cached["audio"]).decode("ascii"),
+                    "alignment": cached["alignment"]
+                }
+
         payload = {
             "text": text,
             "model_id": self.model_id,
             "voice_settings": settings
         }
 
-        response = requests.post(url, json=payload, headers=self.headers)
+        response = self.session.post(url, json=payload, headers=self.headers, timeout=self.timeout)
 
         if response.status_code == 200:
             response_data = response.json()
@@ -130,10 +285,13 @@ class ElevenLabsTTS:
                 "alignment": alignment_data
             }
 
-            if output_path and audio_data:
-                import base64
-                with open(output_path, 'wb') as f:
-                    f.write(base64.b64decode(audio_data))
+            if audio_data and (output_path or key):
+                audio_bytes = base64.b64decode(audio_data)
+                if output_path:
+                    self._save_audio(audio_bytes, output_path)
+                # Senza allineamento la voce non servirebbe a require_alignment=True
+                if key and alignment_data:
+                    self.cache.put(key, audio_bytes, alignment_data)
 
             return result
         else:
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Server HTTP locale che simula le API di ElevenLabs usate da ElevenLabsTTS.
+Restituisce audio MP3 finto (frame di silenzio) inviato a blocchi con
+Transfer-Encoding: chunked, così da poter misurare il time-to-first-audio
+senza consumare crediti.
+
+Uso:
+    python fake_eleven_labs_server.py [--port 8765] [--chunks 20] [--delay 0.05]
+"""
+
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Frame MPEG-1 Layer III a 128 kbps / 44.1 kHz: header + payload nullo (417 byte in totale)
+MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+
+def fake_mp3(num_frames):
+    """Genera un MP3 finto composto da frame di silenzio"""
+    return MP3_FRAME * num_frames
+
+
+def fake_alignment(text, char_duration=0.06):
+    """Genera un allineamento per carattere nello stesso formato di ElevenLabs"""
+    starts = [round(i * char_duration, 3) for i in range(len(text))]
+    ends = [round((i + 1) * char_duration, 3) for i in range(len(text))]
+    return {
+        "characters": list(text),
+        "character_start_times_seconds": starts,
+        "character_end_times_seconds": ends
+    }
+
+
+class FakeElevenLabsHandler(BaseHTTPRequestHandler):
+    """Gestisce le richieste verso gli endpoint finti di ElevenLabs"""
+
+    # Configurati da FakeElevenLabsServer
+    num_chunks = 20
+    frames_per_chunk = 4
+    chunk_delay = 0.05
+    first_chunk_delay = 0.0
+    requests_served = 0
+
+    def log_message(self, format, *args):
+        # Silenzia il log di default di BaseHTTPRequestHandler
+        pass
+
+    def _read_payload(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode("utf-8"))
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunked_audio(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(self.first_chunk_delay)
+        chunk = fake_mp3(self.frames_per_chunk)
+        for i in range(self.num_chunks):
+            if i:
+                time.sleep(self.chunk_delay)
+            self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        type(self).requests_served += 1
+        if re.match(r"^/v[12]/voices", self.path):
+            self._send_json({"voices": [{"voice_id": "fake", "name": "Fake"}], "total_count": 1})
+        else:
+            self._send_json({"detail": "not found"}, status=404)
+
+    def do_POST(self):
+        type(self).requests_served += 1
+        path = self.path.split("?")[0]
+        payload = self._read_payload()
+        text = payload.get("text", "")
+
+        if re.match(r"^/v1/text-to-speech/[^/]+/stream$", path):
+            self._send_chunked_audio()
+        elif re.match(r"^/v1/text-to-speech/[^/]+/stream-with-timing$", path):
+            # Simula la sintesi completa prima di rispondere
+            time.sleep(self.first_chunk_delay + self.chunk_delay * (self.num_chunks - 1))
+            audio = fake_mp3(self.frames_per_chunk * self.num_chunks)
+            self._send_json({
+                "audio_base64": base64.b64encode(audio).decode("ascii"),
+                "alignment": fake_alignment(text)
+            })
+        elif re.match(r"^/v1/text-to-speech/[^/]+$", path):
+            # Endpoint non in streaming: la risposta arriva solo a sintesi completata
+            time.sleep(self.first_chunk_delay + self.chunk_delay * (self.num_chunks - 1))
+            body = fake_mp3(self.frames_per_chunk * self.num_chunks)
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json({"detail": "not found"}, status=404)
+
+
+class FakeElevenLabsServer:
+    """Avvia il server finto in un thread separato, utilizzabile come context manager"""
+
+    def __init__(self, host="127.0.0.1", port=0, num_chunks=20, chunk_delay=0.05, first_chunk_delay=0.0):
+        handler = type("ConfiguredFakeElevenLabsHandler", (FakeElevenLabsHandler,), {
+            "num_chunks": num_chunks,
+            "chunk_delay": chunk_delay,
+            "first_chunk_delay": first_chunk_delay,
+            "requests_served": 0
+        })
+        self.handler = handler
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server locale che simula le API di ElevenLabs")
+    parser.add_argument("--host", default="127.0.0.1", help="Indirizzo di ascolto (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Porta di ascolto (default: 8765)")
+    parser.add_argument("--chunks", type=int, default=20, help="Numero di chunk audio per risposta (default: 20)")
+    parser.add_argument("--delay", type=float, default=0.05, help="Ritardo in secondi tra i chunk (default: 0.05)")
+
+    args = parser.parse_args()
+
+    server = FakeElevenLabsServer(args.host, args.port, num_chunks=args.chunks, chunk_delay=args.delay)
+    print(f"Server finto di ElevenLabs in ascolto su {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer interrotto dall'utente")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Script di test per la modalità streaming di ElevenLabsTTS.
+Confronta il time-to-first-audio della sintesi in streaming con quello della
+sintesi classica, usando un server locale che simula ElevenLabs (nessuna API key richiesta).
+
+Uso:
+    python test_eleven_labs_stream.py [--chunks 20] [--delay 0.05]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from eleven_labs_tts import ElevenLabsTTS
+from fake_eleven_labs_server import FakeElevenLabsServer, MP3_FRAME
+
+
+def test_eleven_labs_stream(num_chunks=20, chunk_delay=0.05):
+    """Verifica che lo streaming restituisca il primo chunk prima della fine della sintesi"""
+
+    output_dir = Path("./test_output")
+    output_dir.mkdir(exist_ok=True)
+
+    with FakeElevenLabsServer(num_chunks=num_chunks, chunk_delay=chunk_delay) as server:
+        tts_client = ElevenLabsTTS("fake_api_key", "fake_voice", base_url=server.base_url)
+        test_text = "Ciao, sono il tuo assistente personale con avatar 3D."
+
+        print("\nTest 1: Sintesi classica (attende la risposta completa)")
+        start_time = time.time()
+        audio = tts_client.convert_text_to_speech(test_text)
+        blocking_time = time.time() - start_time
+        assert audio, "Nessun audio ricevuto dalla sintesi classica"
+        print(f"Audio ricevuto dopo {blocking_time:.2f} secondi ({len(audio)} byte)")
+
+        print("\nTest 2: Sintesi in streaming")
+        start_time = time.time()
+        first_chunk_time = None
+        streamed = []
+        for chunk in tts_client.stream_text_to_speech(test_text):
+            if first_chunk_time is None:
+                first_chunk_time = time.time() - start_time
+            streamed.append(chunk)
+        stream_time = time.time() - start_time
+        streamed_audio = b''.join(streamed)
+
+        print(f"Primo chunk dopo {first_chunk_time:.3f} secondi")
+        print(f"Stream completato in {stream_time:.2f} secondi ({len(streamed_audio)} byte, {len(streamed)} chunk)")
+        assert streamed_audio == audio, "L'audio in streaming differisce da quello della sintesi classica"
+        assert streamed_audio.startswith(MP3_FRAME[:4]), "Lo stream non inizia con un frame MP3"
+        assert first_chunk_time < blocking_time / 2, "Il primo chunk non arriva prima della sintesi completa"
+
+        print("\nTest 3: Scrittura incrementale su file con consumer a valle")
+        output_path = output_dir / "test_stream.mp3"
+        received = []
+        result = tts_client.convert_text_to_speech_stream(
+            test_text, output_path=output_path, consumers=[received.append]
+        )
+        assert result == output_path, "Il file di output non è stato restituito"
+        assert output_path.read_bytes() == audio, "Il file scritto in streaming non corrisponde all'audio atteso"
+        assert b''.join(received) == audio, "Il consumer non ha ricevuto tutti i chunk"
+        print(f"File salvato in: {output_path} ({len(received)} chunk inoltrati al consumer)")
+
+    print(f"\nGuadagno sul time-to-first-audio: {blocking_time - first_chunk_time:.2f} secondi")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Testa la sintesi in streaming di ElevenLabsTTS su un server finto")
+    parser.add_argument("--chunks", type=int, default=20, help="Numero di chunk audio emessi dal server (default: 20)")
+    parser.add_argument("--delay", type=float, default=0.05, help="Ritardo in secondi tra i chunk (default: 0.05)")
+
+    args = parser.parse_args()
+
+    test_eleven_labs_stream(args.chunks, args.delay)
+    print("\nTest completato con successo!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Script di test per la cache su disco dell'audio di ElevenLabsTTS.
+Usa il server locale che simula ElevenLabs, quindi non serve una API key.
+
+Uso:
+    python test_tts_cache.py [--cache_dir test_output/tts_cache]
+"""
+
+import argparse
+import shutil
+import time
+from pathlib import Path
+
+from eleven_labs_tts import ElevenLabsTTS
+from fake_eleven_labs_server import FakeElevenLabsServer
+from tts_cache import TTSCache
+
+
+def test_tts_cache(cache_dir):
+    """Verifica hit/miss, persistenza tra istanze, eviction LRU e chiavi dello streaming"""
+
+    cache_dir = Path(cache_dir)
+    if cache_dir.exists():
+        shutil.rmtree(cache_dir)
+
+    with FakeElevenLabsServer(num_chunks=10, chunk_delay=0.05) as server:
+        cache = TTSCache(cache_dir)
+        tts_client = ElevenLabsTTS("fake_api_key", "fake_voice", base_url=server.base_url, cache=cache)
+        greeting = "Ciao, come posso aiutarti oggi?"
+
+        print("\nTest 1: Prima sintesi (miss)")
+        start_time = time.time()
+        audio = tts_client.convert_text_to_speech(greeting)
+        miss_time = time.time() - start_time
+        print(f"Audio sintetizzato in {miss_time:.3f} secondi")
+
+        print("\nTest 2: Stessa frase (hit)")
+        start_time = time.time()
+        cached_audio = tts_client.convert_text_to_speech(greeting)
+        hit_time = time.time() - start_time
+        print(f"Audio restituito dalla cache in {hit_time * 1000:.1f} ms")
+        assert cached_audio == audio, "L'audio in cache differisce da quello sintetizzato"
+        assert hit_time < miss_time / 10, "Il hit in cache non è significativamente più veloce"
+
+        print("\nTest 3: Impostazioni della voce diverse (miss)")
+        requests_before = server.handler.requests_served
+        tts_client.convert_text_to_speech(greeting, voice_settings={"stability": 0.9, "similarity_boost": 0.5})
+        assert server.handler.requests_served == requests_before + 1, "Impostazioni diverse non devono colpire la cache"
+
+        print("\nTest 4: Allineamento per carattere")
+        result = tts_client.convert_text_to_speech_with_timing(greeting)
+        requests_before = server.handler.requests_served
+        cached_result = tts_client.convert_text_to_speech_with_timing(greeting)
+        assert server.handler.requests_served == requests_before, "L'allineamento non è stato servito dalla cache"
+        assert cached_result == result, "Audio o allineamento in cache differiscono dall'originale"
+        print(f"Allineamento in cache: {len(cached_result['alignment']['characters'])} caratteri")
+
+        print("\nTest 5: Persistenza tra istanze")
+        reopened = TTSCache(cache_dir)
+        tts_client.cache = reopened
+        requests_before = server.handler.requests_served
+        assert tts_client.convert_text_to_speech(greeting) == audio
+        assert server.handler.requests_served == requests_before, "La cache non è stata ricaricata dal disco"
+
+        print("\nTest 6: Eviction LRU")
+        entry_size = len(audio)
+        small_cache = TTSCache(cache_dir / "small", max_bytes=entry_size * 2)
+        tts_client.cache = small_cache
+        tts_client.convert_text_to_speech("Prima frase.")
+        tts_client.convert_text_to_speech("Seconda frase.")
+        tts_client.convert_text_to_speech("Prima frase.")   # Prima frase diventa la più recente
+        tts_client.convert_text_to_speech("Terza frase.")   # Deve eliminare "Seconda frase."
+        requests_before = server.handler.requests_served
+        tts_client.convert_text_to_speech("Prima frase.")
+        assert server.handler.requests_served == requests_before, "La voce usata di recente è stata eliminata"
+        tts_client.convert_text_to_speech("Seconda frase.")
+        assert server.handler.requests_served == requests_before + 1, "La voce meno recente non è stata eliminata"
+        assert small_cache.stats()["bytes"] <= small_cache.max_bytes
+
+        print("\nTest 7: Streaming con ottimizzazione della latenza (miss)")
+        tts_client.cache = cache
+        requests_before = server.handler.requests_served
+        streamed = b''.join(tts_client.stream_text_to_speech(greeting))
+        assert streamed == audio and server.handler.requests_served == requests_before, \
+            "Lo streaming senza ottimizzazione deve usare la voce già in cache"
+        b''.join(tts_client.stream_text_to_speech(greeting, optimize_streaming_latency=3))
+        assert server.handler.requests_served == requests_before + 1, \
+            "Un livello di ottimizzazione della latenza diverso non deve colpire la cache"
+
+        print(f"\nStatistiche cache principale: {cache.stats()}")
+        print(f"Statistiche cache ridotta: {small_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Testa la cache dell'audio sintetizzato da ElevenLabsTTS")
+    parser.add_argument("--cache_dir", default="test_output/tts_cache",
+                        help="Directory della cache di test (default: test_output/tts_cache)")
+
+    args = parser.parse_args()
+
+    test_tts_cache(args.cache_dir)
+    print("\nTest completato con successo!")
+
+
+if __name__ == "__main__":
+    main()
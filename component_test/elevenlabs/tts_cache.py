@@ -0,0 +1,107 @@
+"""
+Cache su disco per l'audio generato da ElevenLabs.
+
+Le voci sono indirizzate per contenuto: la chiave è l'hash SHA-256 di
+(testo, voice_id, model_id, voice_settings), quindi la stessa frase con la
+stessa voce viene sintetizzata una sola volta. Per ogni voce sono salvati il
+file MP3 e, se disponibile, l'allineamento per carattere restituito da
+convert_text_to_speech_with_timing.
+
+La dimensione totale è limitata: superato il limite vengono eliminate le voci
+usate meno di recente (LRU). Indice LRU e scritture atomiche sono quelli di
+DiskCache (component_test/common/disk_cache.py).
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+# Rende importabili i moduli condivisi in component_test/common
+COMMON_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from disk_cache import DiskCache
+
+
+def cache_key(text, voice_id, model_id, voice_settings):
+    """Calcola la chiave della cache per una richiesta di sintesi"""
+    payload = json.dumps({
+        "text": text,
+        "voice_id": voice_id,
+        "model_id": model_id,
+        "voice_settings": voice_settings
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache(DiskCache):
+    # L'MP3 è scritto per ultimo: la sua presenza indica una voce completa
+    required_suffix = ".mp3"
+
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024):
+        """
+        Args:
+            cache_dir (str): Directory in cui salvare le voci della cache
+            max_bytes (int): Dimensione massima complessiva della cache in byte
+        """
+        super().__init__(cache_dir, max_bytes=max_bytes)
+
+    def get(self, key, require_alignment=False):
+        """
+        Cerca una voce nella cache.
+
+        Args:
+            key (str): Chiave calcolata con cache_key()
+            require_alignment (bool): Se True, una voce senza allineamento (o con uno vuoto) è considerata un miss
+
+        Returns:
+            dict: {"audio": bytes, "alignment": dict o None} oppure None se assente
+        """
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+
+            alignment = None
+            if ".json" in self._index[key]:
+                try:
+                    with open(self._path(key, ".json"), 'r', encoding='utf-8') as f:
+                        alignment = json.load(f)
+                except FileNotFoundError:
+                    pass
+
+            if require_alignment and not alignment:
+                self.misses += 1
+                return None
+
+            try:
+                with open(self._path(key, ".mp3"), 'rb') as f:
+                    audio = f.read()
+            except FileNotFoundError:
+                # Voce rimossa da un altro processo
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._touch(key)
+            self.hits += 1
+            return {"audio": audio, "alignment": alignment}
+
+    def put(self, key, audio, alignment=None):
+        """
+        Salva una voce nella cache, sovrascrivendo l'eventuale versione precedente
+        (compreso un allineamento che non corrisponde più al nuovo audio).
+
+        Args:
+            key (str): Chiave calcolata con cache_key()
+            audio (bytes): Dati MP3
+            alignment (dict, optional): Allineamento per carattere restituito da ElevenLabs
+        """
+        files = {}
+        if alignment is not None:
+            files[".json"] = json.dumps(alignment).encode("utf-8")
+        files[".mp3"] = audio
+        with self._lock:
+            self._store(key, files)
@@ -1,14 +1,24 @@
-import requests
 import json
+import os
+import sys
 from prettytable import PrettyTable
 
-def get_voice_list(api_key):
+# Rende importabili i moduli condivisi in component_test/common
+COMMON_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from http_client import get_session
+
+def get_voice_list(api_key, session=None):
     """
     Ottiene e visualizza l'elenco delle voci disponibili da ElevenLabs con informazioni dettagliate.
 
     Args:
         api_key (str): La tua API key di ElevenLabs
+        session (requests.Session, optional): Sessione HTTP da usare, default è quella condivisa
     """
+    session = session or get_session()
     url = "https://api.elevenlabs.io/v2/voices"
 
     headers = {
@@ -17,7 +27,7 @@ def get_voice_list(api_key):
     }
 
     try:
-        response = requests.get(url, headers=headers)
+        response = session.get(url, headers=headers)
 
         if response.status_code == 200:
             data = response.json()
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Benchmark della pipeline vocale completa, con tempi per stadio.
+
+Ogni file del corpus attraversa gli stessi passi dell'assistente:
+    replay   riproduzione del WAV come stream del microfono e segmentazione in frasi (VAD)
+    asr      trascrizione della frase con Whisper
+    llm      risposta di Qwen2-Audio all'audio della frase
+    tts      sintesi della risposta (server ElevenLabs simulato, nessun credito consumato)
+    lipsync  mouth cues dall'allineamento di ElevenLabs o con Rhubarb
+    upload   upload di audio e lipsync (server Unity simulato)
+
+Per ogni stadio vengono riportati p50/p95/p99 della latenza, RTF (tempo dello
+stadio / durata del parlato in ingresso), tempo di CPU del processo, memoria
+residente; in più il picco di memoria complessivo. I risultati possono essere
+salvati in JSON e confrontati con quelli di un'esecuzione precedente (ad
+esempio il commit prima di un'ottimizzazione).
+
+Whisper e Qwen2-Audio sono opzionali (--asr none, --llm none): senza modelli
+il testo della frase viene letto dal file .txt accanto al WAV, se presente.
+
+Uso:
+    python bench_pipeline.py [--corpus dir_wav] [--asr whisper|none] [--llm qwen|none] [--lipsync alignment|rhubarb]
+        [--repeat 3] [--output risultati.json] [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Rende importabili i moduli degli altri componenti
+COMPONENT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+for subdir in ("common", "elevenlabs", "rhubarb", "qwen", "whisper", "pipeline"):
+    path = os.path.join(COMPONENT_DIR, subdir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from eleven_labs_tts import ElevenLabsTTS
+from fake_eleven_labs_server import FakeElevenLabsServer
+from speak_pipeline import SpeakPipeline, Utterance
+from unity_stub_server import UnityStubServer
+from voice_activity import VAD_SAMPLE_RATE, EnergyVAD, stream_utterances, wav_blocks
+
+try:
+    from inference_profile import PROFILES
+except ImportError:
+    # PyTorch non installato: il benchmark gira solo senza modelli (--asr none, --llm none)
+    PROFILES = ()
+
+STAGES = ("replay", "asr", "llm", "tts", "lipsync", "upload")
+
+DEFAULT_TEXT = "Ciao, come posso aiutarti oggi?"
+DEFAULT_PROMPT = "Rispondi in italiano, in una frase, a quello che dice l'utente."
+
+
+def current_rss_mb():
+    """Memoria residente attuale del processo in MB (picco se /proc non è disponibile)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Picco di memoria residente del processo in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss è in KB su Linux e in byte su macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StageRecorder:
+    """Raccoglie latenza, tempo di CPU e memoria di ogni esecuzione di ciascuno stadio"""
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES + ("total",)}
+        self.recording = True
+
+    @contextmanager
+    def measure(self, stage, audio_seconds, enabled=True):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            if self.recording and enabled:
+                self.samples[stage].append({
+                    "latency": time.perf_counter() - wall_start,
+                    "cpu": time.process_time() - cpu_start,
+                    "audio": audio_seconds,
+                    "rss_mb": current_rss_mb()
+                })
+
+    def add(self, stage, latency, cpu, audio_seconds):
+        if self.recording:
+            self.samples[stage].append({"latency": latency, "cpu": cpu, "audio": audio_seconds,
+                                        "rss_mb": current_rss_mb()})
+
+    def summary(self):
+        """Statistiche per stadio: percentili della latenza in secondi, RTF, CPU e memoria"""
+        result = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            latencies = np.array([sample["latency"] for sample in samples])
+            cpu = sum(sample["cpu"] for sample in samples)
+            audio = sum(sample["audio"] for sample in samples)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            result[stage] = {
+                "count": len(samples),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "mean": float(latencies.mean()),
+                "total": float(latencies.sum()),
+                "rtf": float(latencies.sum() / audio) if audio else None,
+                "cpu_time": cpu,
+                # Può superare 1 se lo stadio usa più core (PyTorch, thread di upload)
+                "cpu_utilization": cpu / latencies.sum() if latencies.sum() else None,
+                "rss_mb": max(sample["rss_mb"] for sample in samples)
+            }
+        return result
+
+
+def list_corpus(corpus_dir):
+    """File WAV del corpus in ordine alfabetico, con l'eventuale testo di riferimento (.txt)"""
+    corpus = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.lower().endswith(".wav"):
+            continue
+        wav_file = os.path.join(corpus_dir, name)
+        text_file = os.path.splitext(wav_file)[0] + ".txt"
+        reference = None
+        if os.path.isfile(text_file):
+            with open(text_file, 'r', encoding='utf-8') as f:
+                reference = f.read().strip()
+        corpus.append((wav_file, reference))
+    return corpus
+
+
+def create_synthetic_corpus(corpus_dir, num_files=3):
+    """Crea un corpus fisso di WAV con frasi sintetiche (toni modulati), uguale a ogni esecuzione"""
+    from test_voice_activity import create_test_wav
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    for i in range(num_files):
+        wav_file = os.path.join(corpus_dir, f"synthetic_{i:02d}.wav")
+        if not os.path.exists(wav_file):
+            create_test_wav(wav_file, VAD_SAMPLE_RATE)
+    return list_corpus(corpus_dir)
+
+
+class PipelineBenchmark:
+    def __init__(self, tts_client, upload_url, speak_url, work_dir, asr="none", llm="none",
+                 whisper_model="small", qwen_model="Qwen/Qwen2-Audio-7B-Instruct", profile=None,
+                 num_threads=None, lipsync="alignment", rhubarb_path="./bin/rhubarb/rhubarb",
+                 prompt=DEFAULT_PROMPT, max_new_tokens=64):
+        """
+        Carica i modelli richiesti e prepara gli stadi di sintesi, lipsync e upload.
+
+        Args:
+            tts_client (ElevenLabsTTS): Client collegato al server ElevenLabs simulato
+            upload_url, speak_url (str): Endpoint del server Unity simulato
+            work_dir (str): Directory per audio e lipsync intermedi
+            asr (str): "whisper" oppure "none"
+            llm (str): "qwen" oppure "none"
+            profile (str, optional): Profilo di inferenza dei modelli (vedi inference_profile.py)
+            lipsync (str): "alignment" oppure "rhubarb"
+            max_new_tokens (int): Lunghezza massima delle risposte di Qwen2-Audio
+        """
+        self.pipeline = SpeakPipeline(tts_client, upload_url, speak_url, work_dir, lipsync=lipsync,
+                                      rhubarb_path=rhubarb_path)
+        self.asr = asr
+        self.llm = llm
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.load_times = {}
+
+        if asr == "whisper":
+            from test_whisper import load_whisper_model
+
+            start_time = time.perf_counter()
+            self.whisper = load_whisper_model(whisper_model, profile=profile or "fp32", num_threads=num_threads)
+            self.load_times["asr"] = time.perf_counter() - start_time
+
+        if llm == "qwen":
+            from test_qwen import load_qwen_model
+
+            start_time = time.perf_counter()
+            self.qwen = load_qwen_model(qwen_model, profile, num_threads)
+            self.load_times["llm"] = time.perf_counter() - start_time
+
+    def transcribe(self, segment, reference):
+        if self.asr == "whisper":
+            from test_whisper import transcribe_array
+
+            return transcribe_array(segment.audio, *self.whisper)
+        return reference or DEFAULT_TEXT
+
+    def answer(self, segment, transcript):
+        if self.llm == "qwen":
+            import torch
+            from test_qwen import prepare_qwen_inputs
+
+            processor, model = self.qwen
+            inputs = prepare_qwen_inputs(segment.audio, self.prompt, processor, model)
+            with torch.no_grad():
+                generate_ids = model.generate(**inputs, max_new_tokens=self.max_new_tokens, do_sample=False,
+                                              pad_token_id=processor.tokenizer.pad_token_id)
+            new_tokens = generate_ids[:, inputs.input_ids.size(1):]
+            return processor.batch_decode(new_tokens, skip_special_tokens=True)[0].strip() or DEFAULT_TEXT
+        return transcript
+
+    def run_file(self, wav_file, reference, recorder, name_prefix):
+        """Fa passare un file del corpus in tutti gli stadi; restituisce il numero di frasi con errori"""
+        start_time = time.perf_counter()
+        start_cpu = time.process_time()
+        segments = list(stream_utterances(wav_blocks(wav_file), EnergyVAD()))
+        # La durata del parlato è nota solo dopo la segmentazione
+        recorder.add("replay", time.perf_counter() - start_time, time.process_time() - start_cpu,
+                     sum(segment.duration for segment in segments))
+
+        errors = 0
+        for i, segment in enumerate(segments):
+            duration = segment.duration
+            total_start = time.perf_counter()
+            total_cpu = time.process_time()
+            try:
+                # Gli stadi disattivati (--asr none, --llm none) non compaiono nelle statistiche
+                with recorder.measure("asr", duration, enabled=self.asr != "none"):
+                    transcript = self.transcribe(segment, reference)
+                with recorder.measure("llm", duration, enabled=self.llm != "none"):
+                    response = self.answer(segment, transcript)
+
+                utterance = Utterance(i, response, f"{name_prefix}_{i:02d}")
+                with recorder.measure("tts", duration):
+                    self.pipeline.synthesize(utterance)
+                with recorder.measure("lipsync", duration):
+                    self.pipeline.generate_lipsync(utterance)
+                with recorder.measure("upload", duration):
+                    self.pipeline.upload(utterance)
+            except Exception as e:
+                print(f"  errore su {os.path.basename(wav_file)}, frase {i + 1}: {e}")
+                errors += 1
+                continue
+            recorder.add("total", time.perf_counter() - total_start, time.process_time() - total_cpu, duration)
+        return errors
+
+
+def git_revision():
+    """Commit corrente del repository, per identificare i risultati"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=COMPONENT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline, tolerance=0.15, min_samples=5, min_delta=0.002):
+    """
+    Confronta p50 e p95 di ogni stadio con un'esecuzione precedente.
+
+    Il p95 di poche decine di campioni dipende da una o due misure e varia molto
+    tra due esecuzioni dello stesso commit: un peggioramento è segnalato solo se
+    il p50 cresce oltre la tolleranza e di almeno min_delta secondi (gli stadi di
+    un millisecondo oscillano di decine di punti percentuali) ed entrambe le
+    esecuzioni hanno almeno min_samples campioni dello stadio.
+
+    Returns:
+        list: Stadi peggiorati oltre la tolleranza (differenza relativa del p50)
+    """
+    regressions = []
+    print(f"\nConfronto con {baseline.get('meta', {}).get('revision') or 'baseline'}:")
+    for stage, stats in results["stages"].items():
+        reference = baseline.get("stages", {}).get(stage)
+        if not reference:
+            continue
+        deltas = []
+        for metric in ("p50", "p95"):
+            delta = (stats[metric] - reference[metric]) / reference[metric] if reference[metric] else 0.0
+            deltas.append(f"{metric} {reference[metric] * 1000:8.1f} → {stats[metric] * 1000:8.1f} ms ({delta:+.0%})")
+        enough_samples = min(stats["count"], reference["count"]) >= min_samples
+        increase = stats["p50"] - reference["p50"]
+        if enough_samples and increase > min_delta and increase > tolerance * reference["p50"]:
+            regressions.append(stage)
+        if stage in regressions:
+            flag = "  PEGGIORATO"
+        elif not enough_samples:
+            flag = "  (campioni insufficienti)"
+        else:
+            flag = ""
+        print(f"  {stage:<8} " + "   ".join(deltas) + flag)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della pipeline vocale con tempi per stadio")
+    parser.add_argument("--corpus", help="Directory con i WAV del corpus (default: corpus sintetico in --work_dir)")
+    parser.add_argument("--synthetic_files", type=int, default=3, help="File del corpus sintetico (default: 3)")
+    parser.add_argument("--asr", choices=["whisper", "none"], default="none", help="Stadio ASR (default: none)")
+    parser.add_argument("--llm", choices=["qwen", "none"], default="none", help="Stadio LLM (default: none)")
+    parser.add_argument("--whisper_model", default="small", help="Dimensione del modello Whisper (default: small)")
+    parser.add_argument("--qwen_model", default="Qwen/Qwen2-Audio-7B-Instruct", help="ID del modello Qwen")
+    parser.add_argument("--profile", choices=PROFILES, help="Profilo di inferenza dei modelli (richiede PyTorch)")
+    parser.add_argument("--threads", type=int, help="Thread di PyTorch (default: automatico)")
+    parser.add_argument("--max_new_tokens", type=int, default=64, help="Lunghezza massima delle risposte (default: 64)")
+    parser.add_argument("--lipsync", choices=["alignment", "rhubarb"], default="alignment",
+                        help="Sorgente del lipsync (default: alignment)")
+    parser.add_argument("--rhubarb_path", default="./bin/rhubarb/rhubarb", help="Percorso all'eseguibile di Rhubarb")
+    parser.add_argument("--tts_chunks", type=int, default=5, help="Blocchi audio del server ElevenLabs simulato (default: 5)")
+    parser.add_argument("--tts_delay", type=float, default=0.01,
+                        help="Ritardo tra i blocchi del server ElevenLabs simulato in secondi (default: 0.01)")
+    parser.add_argument("--unity_latency", type=float, default=0.0,
+                        help="Latenza aggiunta dal server Unity simulato in secondi (default: 0)")
+    parser.add_argument("--warmup", type=int, default=1, help="Passate sul corpus escluse dalle statistiche (default: 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="Passate misurate sul corpus (default: 3)")
+    parser.add_argument("--work_dir", default="./test_output/bench_pipeline",
+                        help="Directory per corpus sintetico e file intermedi (default: ./test_output/bench_pipeline)")
+    parser.add_argument("--output", help="File JSON in cui salvare i risultati")
+    parser.add_argument("--compare", help="JSON di un'esecuzione precedente da confrontare")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Peggioramento relativo del p50 tollerato nel confronto (default: 0.15)")
+    parser.add_argument("--min_samples", type=int, default=5,
+                        help="Campioni minimi di uno stadio per segnalarne il peggioramento (default: 5)")
+    parser.add_argument("--min_delta_ms", type=float, default=2.0,
+                        help="Aumento minimo del p50 in millisecondi per segnalare un peggioramento (default: 2)")
+
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = list_corpus(args.corpus)
+    else:
+        corpus = create_synthetic_corpus(os.path.join(args.work_dir, "corpus"), args.synthetic_files)
+    if not corpus:
+        print("Nessun file WAV nel corpus")
+        sys.exit(1)
+
+    recorder = StageRecorder()
+    errors = 0
+    with FakeElevenLabsServer(num_chunks=args.tts_chunks, chunk_delay=args.tts_delay) as tts_server, \
+            UnityStubServer(latency=args.unity_latency) as unity:
+        tts_client = ElevenLabsTTS("fake_api_key", "fake_voice", base_url=tts_server.base_url)
+        benchmark = PipelineBenchmark(tts_client, unity.upload_url, unity.speak_url,
+                                      os.path.join(args.work_dir, "output"), asr=args.asr, llm=args.llm,
+                                      whisper_model=args.whisper_model, qwen_model=args.qwen_model,
+                                      profile=args.profile, num_threads=args.threads, lipsync=args.lipsync,
+                                      rhubarb_path=args.rhubarb_path, max_new_tokens=args.max_new_tokens)
+
+        for iteration in range(args.warmup + args.repeat):
+            recorder.recording = iteration >= args.warmup
+            label = "riscaldamento" if not recorder.recording else f"passata {iteration - args.warmup + 1}/{args.repeat}"
+            print(f"{label}: {len(corpus)} file")
+            for index, (wav_file, reference) in enumerate(corpus):
+                file_errors = benchmark.run_file(wav_file, reference, recorder, f"bench_{index:02d}")
+                if recorder.recording:
+                    errors += file_errors
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": [os.path.basename(wav_file) for wav_file, _ in corpus],
+            "args": vars(args)
+        },
+        "load_times": benchmark.load_times,
+        "stages": recorder.summary(),
+        "errors": errors,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+    print(f"\n{'Stadio':<8} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RTF':>7} {'CPU':>6} {'RSS MB':>8}")
+    for stage, stats in results["stages"].items():
+        rtf = f"{stats['rtf']:.3f}" if stats["rtf"] is not None else "-"
+        cpu = f"{stats['cpu_utilization']:.0%}" if stats["cpu_utilization"] is not None else "-"
+        print(f"{stage:<8} {stats['count']:>4} {stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} "
+              f"{stats['p99'] * 1000:>9.1f} {rtf:>7} {cpu:>6} {stats['rss_mb']:>8.0f}")
+    for stage, load_time in results["load_times"].items():
+        print(f"Caricamento modello {stage}: {load_time:.2f} secondi")
+    print(f"Picco di memoria: {results['peak_rss_mb']:.0f} MB, frasi con errori: {errors}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Risultati salvati in '{args.output}'")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare_results(results, json.load(f), args.tolerance, args.min_samples,
+                                          args.min_delta_ms / 1000)
+        if regressions:
+            print(f"Stadi peggiorati oltre il {args.tolerance:.0%}: {', '.join(regressions)}")
+
+    sys.exit(1 if errors or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Risposta parlata in streaming: Qwen2-Audio → frasi → ElevenLabs (→ Unity).
+
+La risposta di Qwen2-Audio viene generata token per token; ogni frase
+conclusa viene passata subito alla sintesi vocale, così l'avatar inizia a
+parlare mentre il modello sta ancora generando il resto della risposta.
+
+Per default le frasi attraversano la pipeline completa (sintesi, lipsync,
+upload e riproduzione in Unity); con --tts_only vengono solo sintetizzate
+in file MP3 in --work_dir, senza Unity.
+
+Uso:
+    python qwen_speak.py -a domanda.mp3 -p "Rispondi alla domanda" [--tts_only] [--voice_id ID]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Rende importabili i moduli degli altri componenti
+COMPONENT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+for subdir in ("common", "elevenlabs", "rhubarb", "qwen"):
+    path = os.path.join(COMPONENT_DIR, subdir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from eleven_labs_tts import ElevenLabsTTS
+from speak_pipeline import SpeakPipeline
+from inference_profile import PROFILES
+from test_qwen import load_qwen_model, stream_qwen_response
+from text_segmenter import iter_sentences
+
+
+def synthesize_sentences(tts_client, sentences, work_dir, name_prefix="answer"):
+    """
+    Sintetizza ogni frase appena arriva, senza Unity.
+
+    Returns:
+        dict: Frasi con il tempo di arrivo e di fine sintesi, e tempo al primo audio
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    start_time = time.time()
+    report = []
+    for i, sentence in enumerate(sentences):
+        arrival = time.time() - start_time
+        output_path = os.path.join(work_dir, f"{name_prefix}_{i:03d}.mp3")
+        ok = tts_client.convert_text_to_speech(sentence, output_path)
+        report.append({"index": i, "text": sentence, "arrival": arrival,
+                       "audio_ready": time.time() - start_time, "error": None if ok else "sintesi fallita"})
+        print(f"Frase {i + 1} pronta dopo {report[-1]['audio_ready']:.2f}s: {sentence}")
+    return {
+        "sentences": report,
+        "time_to_first_audio": report[0]["audio_ready"] if report else None,
+        "total_time": time.time() - start_time,
+        "failed": sum(1 for item in report if item["error"])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fa pronunciare all'avatar la risposta di Qwen2-Audio mentre viene generata")
+    parser.add_argument('-a', '--audio', required=True, help='File audio con la domanda')
+    parser.add_argument('-p', '--prompt', default="Rispondi in italiano alla domanda contenuta nell'audio.",
+                        help='Prompt testuale per il modello')
+    parser.add_argument('-m', '--model', default="Qwen/Qwen2-Audio-7B-Instruct", help='ID del modello Qwen da utilizzare')
+    parser.add_argument('--profile', choices=PROFILES,
+                        help='Profilo di inferenza: fp32, int8, bf16, fp16 su GPU (default: caricamento automatico)')
+    parser.add_argument('--threads', type=int, help='Numero di thread di PyTorch (default: automatico)')
+    parser.add_argument('--max_new_tokens', type=int, default=256, help='Lunghezza massima della risposta (default: 256)')
+    parser.add_argument('--sample', action='store_true', help='Usa il campionamento invece della generazione greedy')
+    parser.add_argument("--voice_id", default="XrExE9yKIg1WjnnlVkGX", help="ID della voce ElevenLabs (default: Matilda)")
+    parser.add_argument("--api_key", help="API key di ElevenLabs (default: da keyconfig.py)")
+    parser.add_argument("--base_url", default="https://api.elevenlabs.io/v1", help="URL base dell'API di ElevenLabs")
+    parser.add_argument('--tts_only', action='store_true', help='Solo sintesi vocale in file, senza Unity')
+    parser.add_argument("--lipsync", choices=["alignment", "rhubarb"], default="alignment",
+                        help="Sorgente del lipsync: allineamento di ElevenLabs o Rhubarb (default: alignment)")
+    parser.add_argument("--upload_url", default="http://localhost:8080/avatar/upload",
+                        help="URL dell'endpoint di upload (default: http://localhost:8080/avatar/upload)")
+    parser.add_argument("--speak_url", default="http://localhost:8080/avatar/speak",
+                        help="URL dell'endpoint speak (default: http://localhost:8080/avatar/speak)")
+    parser.add_argument("--work_dir", default="./pipeline_output", help="Directory per i file intermedi (default: ./pipeline_output)")
+    parser.add_argument("--name", default="answer", help="Prefisso dei nomi dei file (default: answer)")
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.audio):
+        print(f"File audio non trovato: {args.audio}")
+        sys.exit(1)
+
+    api_key = args.api_key
+    if not api_key:
+        try:
+            from keyconfig import ELEVEN_LABS_API_KEY
+            api_key = ELEVEN_LABS_API_KEY
+        except ImportError:
+            print("API key non specificata: usa --api_key oppure crea component_test/elevenlabs/keyconfig.py")
+            sys.exit(1)
+
+    tts_client = ElevenLabsTTS(api_key, args.voice_id, base_url=args.base_url)
+    processor, model = load_qwen_model(args.model, args.profile, args.threads)
+
+    chunks = stream_qwen_response(args.audio, args.prompt, processor, model,
+                                  max_new_tokens=args.max_new_tokens, do_sample=args.sample)
+    sentences = iter_sentences(chunks)
+
+    if args.tts_only:
+        report = synthesize_sentences(tts_client, sentences, args.work_dir, args.name)
+        first = report["time_to_first_audio"]
+        label = "Tempo al primo audio"
+    else:
+        pipeline = SpeakPipeline(tts_client, args.upload_url, args.speak_url, args.work_dir, lipsync=args.lipsync)
+        report = pipeline.speak_stream(sentences, args.name)
+        first = report["time_to_first_speech"]
+        label = "Tempo alla prima parola"
+
+    print(f"\nFrasi: {len(report['sentences']) - report['failed']}/{len(report['sentences'])}")
+    if first is not None:
+        print(f"{label}: {first:.2f} secondi")
+    print(f"Tempo totale: {report['total_time']:.2f} secondi")
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    with open(os.path.join(args.work_dir, f"{args.name}_report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    sys.exit(0 if report["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
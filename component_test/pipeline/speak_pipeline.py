@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Orchestratore end-to-end per far parlare l'avatar: TTS → lipsync → upload → riproduzione.
+
+La risposta viene divisa in frasi e ogni frase attraversa quattro stadi in
+thread separati, collegati da code limitate: mentre la frase N viene caricata
+o riprodotta da Unity, la frase N+1 è già in sintesi e in analisi labiale.
+Il tempo alla prima parola pronunciata dipende così solo dalla prima frase.
+
+Il lipsync può essere generato dall'allineamento per carattere di ElevenLabs
+(modalità "alignment", nessun processo esterno) oppure con Rhubarb
+(modalità "rhubarb", più accurato ma più lento).
+
+Uso:
+    python speak_pipeline.py --text "Ciao! Come posso aiutarti?" --voice_id XrExE9yKIg1WjnnlVkGX
+        [--lipsync alignment|rhubarb] [--upload_url URL] [--speak_url URL] [--work_dir dir]
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+# Rende importabili i moduli degli altri componenti
+COMPONENT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+for subdir in ("common", "elevenlabs", "rhubarb"):
+    path = os.path.join(COMPONENT_DIR, subdir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from eleven_labs_tts import ElevenLabsTTS
+from lipsync_cache import lipsync_key, parse_mouth_cues, write_mouth_cues
+from rhubarb_audio import memory_temp_dir, prepare_wav
+from rhubarb_client import request_speech
+from text_segmenter import split_sentences
+from text_visemes import alignment_to_mouth_cues
+from upload_to_unity import upload_utterance
+from viseme_smoothing import smooth_mouth_cues
+
+# Marcatore di fine lavoro passato tra gli stadi
+_DONE = object()
+
+
+class Utterance:
+    """Una frase che attraversa la pipeline, con i tempi di ciascuno stadio"""
+
+    def __init__(self, index, text, name):
+        self.index = index
+        self.text = text
+        self.name = name
+        self.audio_path = None
+        self.alignment = None
+        self.lipsync_path = None
+        self.duration = 0.0
+        self.error = None
+        self.arrival = None
+        self.timings = {}
+
+    def report(self):
+        return {
+            "index": self.index,
+            "name": self.name,
+            "text": self.text,
+            "duration": self.duration,
+            "error": self.error,
+            "arrival": self.arrival,
+            "timings": self.timings
+        }
+
+
+class SpeakPipeline:
+    def __init__(self, tts_client, upload_url="http://localhost:8080/avatar/upload",
+                 speak_url="http://localhost:8080/avatar/speak", work_dir="./pipeline_output",
+                 lipsync="alignment", rhubarb_path="./bin/rhubarb/rhubarb", lipsync_cache=None,
+                 queue_size=2, wait_playback=True, session=None, smooth_visemes=False):
+        """
+        Inizializza la pipeline.
+
+        Args:
+            tts_client (ElevenLabsTTS): Client di sintesi vocale
+            upload_url (str): URL dell'endpoint di upload di Unity
+            speak_url (str): URL dell'endpoint di riproduzione di Unity
+            work_dir (str): Directory in cui salvare audio e lipsync di ciascuna frase
+            lipsync (str): "alignment" per usare l'allineamento di ElevenLabs, "rhubarb" per Rhubarb
+            rhubarb_path (str): Percorso all'eseguibile di Rhubarb (solo modalità "rhubarb")
+            lipsync_cache (LipSyncCache, optional): Cache dei risultati di Rhubarb
+            queue_size (int): Numero massimo di frasi in attesa tra due stadi
+            wait_playback (bool): Se True, attende la fine della frase precedente prima di chiedere la successiva
+            session (requests.Session, optional): Sessione HTTP per le chiamate verso Unity
+            smooth_visemes (bool): Se True, elimina i cue brevi e impone la durata minima prima dell'upload
+        """
+        if lipsync not in ("alignment", "rhubarb"):
+            raise ValueError(f"Modalità di lipsync non valida: {lipsync}")
+
+        self.tts_client = tts_client
+        self.upload_url = upload_url
+        self.speak_url = speak_url
+        self.work_dir = work_dir
+        self.lipsync = lipsync
+        self.rhubarb_path = rhubarb_path
+        self.lipsync_cache = lipsync_cache
+        self.queue_size = queue_size
+        self.wait_playback = wait_playback
+        self.session = session
+        self.smooth_visemes = smooth_visemes
+
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    # --- Stadi ---------------------------------------------------------------
+
+    def synthesize(self, utterance):
+        """Stadio 1: sintesi vocale della frase (con allineamento se serve per il lipsync)"""
+        utterance.audio_path = os.path.join(self.work_dir, f"{utterance.name}.mp3")
+
+        if self.lipsync == "alignment":
+            result = self.tts_client.convert_text_to_speech_with_timing(utterance.text, output_path=utterance.audio_path)
+            if not result or not result.get("audio_data"):
+                raise RuntimeError("sintesi vocale fallita")
+            utterance.alignment = result.get("alignment") or {}
+        else:
+            if not self.tts_client.convert_text_to_speech(utterance.text, output_path=utterance.audio_path):
+                raise RuntimeError("sintesi vocale fallita")
+
+    def generate_lipsync(self, utterance):
+        """Stadio 2: generazione dei mouth cues in formato JSON di Rhubarb"""
+        utterance.lipsync_path = os.path.join(self.work_dir, f"{utterance.name}.json")
+
+        if self.lipsync == "alignment":
+            result = alignment_to_mouth_cues(utterance.alignment)
+        else:
+            result = self._run_rhubarb(utterance)
+        if self.smooth_visemes:
+            result = smooth_mouth_cues(result)
+
+        write_mouth_cues(result, utterance.lipsync_path, "json", sound_file=os.path.basename(utterance.audio_path))
+        utterance.duration = result["metadata"].get("duration") or 0.0
+
+    def _run_rhubarb(self, utterance):
+        from test_rhubarb_with_phonetic import run_rhubarb_with_phonetic
+
+        key = None
+        if self.lipsync_cache:
+            key = lipsync_key(utterance.audio_path, "phonetic", utterance.text)
+            cached = self.lipsync_cache.get(key)
+            if cached:
+                return cached
+
+        with memory_temp_dir() as temp_dir:
+            wav_file = prepare_wav(utterance.audio_path, temp_dir)
+            # Il testo della frase è noto: passarlo come dialogo migliora il riconoscimento
+            dialog_file = os.path.join(temp_dir, "dialog.txt")
+            with open(dialog_file, 'w', encoding='utf-8') as f:
+                f.write(utterance.text)
+            output_file = os.path.join(temp_dir, "output.json")
+            if not run_rhubarb_with_phonetic(wav_file, output_file, "json", self.rhubarb_path, dialog_file):
+                raise RuntimeError("Rhubarb fallito")
+            result = parse_mouth_cues(output_file, "json")
+
+        if key:
+            self.lipsync_cache.put(key, result)
+        return result
+
+    def upload(self, utterance):
+        """Stadio 3: upload in parallelo di audio e lipsync su Unity"""
+        if not upload_utterance(self.upload_url, utterance.audio_path, utterance.lipsync_path,
+                                utterance.name, session=self.session):
+            raise RuntimeError("upload di audio e lipsync fallito")
+
+    def play(self, utterance):
+        """Stadio 4: richiesta di riproduzione a Unity"""
+        if not request_speech(self.speak_url, utterance.name, session=self.session):
+            raise RuntimeError("richiesta di riproduzione fallita")
+
+    # --- Orchestrazione ------------------------------------------------------
+
+    def _stage_worker(self, stage_name, stage_fn, input_queue, output_queue):
+        """Esegue uno stadio su ogni frase in arrivo e la inoltra allo stadio successivo"""
+        while True:
+            utterance = input_queue.get()
+            if utterance is _DONE:
+                if output_queue is not None:
+                    output_queue.put(_DONE)
+                return
+
+            # Una frase fallita in uno stadio precedente viene solo inoltrata
+            if utterance.error is None:
+                start = time.time()
+                try:
+                    stage_fn(utterance)
+                except Exception as e:
+                    utterance.error = f"{stage_name}: {e}"
+                    print(f"Errore nella frase {utterance.index + 1} ({stage_name}): {e}")
+                utterance.timings[stage_name] = time.time() - start
+
+            if output_queue is not None:
+                output_queue.put(utterance)
+
+    def speak(self, text, name_prefix="utterance"):
+        """
+        Fa pronunciare all'avatar il testo, frase per frase, con gli stadi in pipeline.
+
+        Args:
+            text (str): Testo della risposta
+            name_prefix (str): Prefisso dei nomi dei file caricati su Unity
+
+        Returns:
+            dict: Rapporto con tempi per frase, tempo alla prima parola e tempo totale
+        """
+        return self.speak_stream(split_sentences(text), name_prefix)
+
+    def speak_stream(self, sentences, name_prefix="utterance"):
+        """
+        Come speak(), ma le frasi arrivano da un iterabile consumato man mano (ad esempio
+        iter_sentences() sui token generati dal modello): la prima frase entra in sintesi
+        appena è conclusa, mentre le successive sono ancora in generazione.
+
+        Returns:
+            dict: Rapporto come speak(), con in più il tempo di arrivo di ogni frase
+        """
+        utterances = []
+        start_time = time.time()
+        first_speech = {}
+        playing_until = [0.0]
+
+        def play_paced(utterance):
+            # Unity riproduce una frase alla volta: si attende la fine della precedente
+            if self.wait_playback:
+                delay = playing_until[0] - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            self.play(utterance)
+            now = time.time()
+            first_speech.setdefault("time", now - start_time)
+            playing_until[0] = now + utterance.duration
+
+        stages = [
+            ("tts", self.synthesize),
+            ("lipsync", self.generate_lipsync),
+            ("upload", self.upload),
+            ("play", play_paced),
+        ]
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in stages]
+        threads = []
+        for i, (stage_name, stage_fn) in enumerate(stages):
+            output_queue = queues[i + 1] if i + 1 < len(queues) else None
+            thread = threading.Thread(target=self._stage_worker, name=f"pipeline-{stage_name}",
+                                      args=(stage_name, stage_fn, queues[i], output_queue), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        try:
+            for i, sentence in enumerate(sentences):
+                utterance = Utterance(i, sentence, f"{name_prefix}_{i:03d}")
+                utterance.arrival = time.time() - start_time
+                utterances.append(utterance)
+                queues[0].put(utterance)
+        finally:
+            # Anche se la sorgente delle frasi fallisce, gli stadi terminano ordinatamente
+            queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+
+        return {
+            "sentences": [u.report() for u in utterances],
+            "time_to_first_speech": first_speech.get("time"),
+            "total_time": time.time() - start_time,
+            "failed": sum(1 for u in utterances if u.error)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fa parlare l'avatar: sintesi, lipsync, upload e riproduzione in pipeline")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--text", help="Testo da pronunciare")
+    source.add_argument("--text_file", help="File di testo da pronunciare")
+    parser.add_argument("--voice_id", default="XrExE9yKIg1WjnnlVkGX", help="ID della voce ElevenLabs (default: Matilda)")
+    parser.add_argument("--api_key", help="API key di ElevenLabs (default: da keyconfig.py)")
+    parser.add_argument("--base_url", default="https://api.elevenlabs.io/v1", help="URL base dell'API di ElevenLabs")
+    parser.add_argument("--lipsync", choices=["alignment", "rhubarb"], default="alignment",
+                        help="Sorgente del lipsync: allineamento di ElevenLabs o Rhubarb (default: alignment)")
+    parser.add_argument("--rhubarb_path", default="./bin/rhubarb/rhubarb", help="Percorso all'eseguibile di Rhubarb")
+    parser.add_argument("--upload_url", default="http://localhost:8080/avatar/upload",
+                        help="URL dell'endpoint di upload (default: http://localhost:8080/avatar/upload)")
+    parser.add_argument("--speak_url", default="http://localhost:8080/avatar/speak",
+                        help="URL dell'endpoint speak (default: http://localhost:8080/avatar/speak)")
+    parser.add_argument("--work_dir", default="./pipeline_output", help="Directory per i file intermedi (default: ./pipeline_output)")
+    parser.add_argument("--name", default="utterance", help="Prefisso dei nomi dei file su Unity (default: utterance)")
+    parser.add_argument("--queue_size", type=int, default=2, help="Dimensione delle code tra gli stadi (default: 2)")
+    parser.add_argument("--smooth_visemes", action="store_true",
+                        help="Elimina i mouth cue brevi e impone una durata minima prima dell'upload")
+
+    args = parser.parse_args()
+
+    if args.text_file:
+        if not os.path.isfile(args.text_file):
+            print(f"File di testo non trovato: {args.text_file}")
+            sys.exit(1)
+        with open(args.text_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = args.text
+
+    api_key = args.api_key
+    if not api_key:
+        try:
+            from keyconfig import ELEVEN_LABS_API_KEY
+            api_key = ELEVEN_LABS_API_KEY
+        except ImportError:
+            print("API key non specificata: usa --api_key oppure crea component_test/elevenlabs/keyconfig.py")
+            sys.exit(1)
+
+    tts_client = ElevenLabsTTS(api_key, args.voice_id, base_url=args.base_url)
+    pipeline = SpeakPipeline(tts_client, args.upload_url, args.speak_url, args.work_dir,
+                             lipsync=args.lipsync, rhubarb_path=args.rhubarb_path, queue_size=args.queue_size,
+                             smooth_visemes=args.smooth_visemes)
+
+    report = pipeline.speak(text, args.name)
+
+    print(f"\nFrasi pronunciate: {len(report['sentences']) - report['failed']}/{len(report['sentences'])}")
+    for sentence in report["sentences"]:
+        timings = ", ".join(f"{stage}={t:.2f}s" for stage, t in sentence["timings"].items())
+        status = f"ERRORE ({sentence['error']})" if sentence["error"] else "ok"
+        print(f"  {sentence['index'] + 1}. [{status}] {timings} - {sentence['text']}")
+    if report["time_to_first_speech"] is not None:
+        print(f"Tempo alla prima parola: {report['time_to_first_speech']:.2f} secondi")
+    print(f"Tempo totale: {report['total_time']:.2f} secondi")
+
+    with open(os.path.join(args.work_dir, f"{args.name}_report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    sys.exit(0 if report["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
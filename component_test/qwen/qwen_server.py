@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+Servizio Qwen2-Audio residente con conversazioni a più turni.
+
+Il modello viene caricato una sola volta. Ogni sessione conserva la storia
+della conversazione (testo e audio di ogni turno) e la cache dei key/value
+dell'attenzione calcolata fino all'ultimo token: a ogni nuovo turno il prompt
+completo viene tokenizzato, confrontato con i token già presenti in cache e
+solo la parte nuova (di norma la domanda appena arrivata) passa nel modello.
+Solo gli audio che cadono nella parte nuova passano nell'encoder audio, così
+l'audio dei turni precedenti non viene ricodificato.
+
+La memoria occupata dalle cache è limitata: le sessioni inattive da più di
+idle_timeout secondi perdono la cache (la storia resta, e verrà ricodificata
+al turno successivo), e se il totale supera max_cache_mb vengono svuotate per
+prime le cache delle sessioni usate meno di recente. Le sessioni inattive da
+più di session_ttl secondi vengono eliminate. Questi limiti sono applicati a
+ogni turno e da un controllo periodico, così la memoria viene liberata anche
+quando il servizio non riceve richieste. Ogni sessione conserva al più
+max_audios audio: oltre, gli audio dei turni più vecchi vengono tolti dalla
+storia (ne resta il testo).
+
+La generazione è greedy (come in test_qwen_lw.py) ed eseguita token per
+token sulla cache della sessione.
+
+Endpoint:
+    POST   /sessions                 corpo JSON opzionale {"system": "..."}; restituisce {"session_id"}
+    POST   /sessions/<id>/chat       corpo JSON {"text": "...", "audio_path": "..." | "audio_b64": "..."}
+    DELETE /sessions/<id>            chiude la sessione
+    GET    /health                   stato del servizio, sessioni e memoria delle cache
+
+Uso:
+    python qwen_server.py [--model Qwen/Qwen2-Audio-7B-Instruct] [--port 8091] [--max_cache_mb 2048]
+"""
+
+import argparse
+import base64
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+from transformers import DynamicCache
+
+# test_qwen aggiunge COMMON_DIR (component_test/common) a sys.path
+from test_qwen import COMMON_DIR, load_qwen_model
+
+from audio_loader import load_audio
+from feature_cache import enable_feature_cache
+from http_client import INFERENCE_TIMEOUT, get_session, json_response
+from inference_profile import PROFILES, model_dtype
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+
+
+def cache_nbytes(cache):
+    """Memoria occupata dai tensori key/value di una DynamicCache"""
+    if cache is None:
+        return 0
+    if hasattr(cache, "layers"):
+        tensors = [t for layer in cache.layers for t in (getattr(layer, "keys", None), getattr(layer, "values", None))]
+    else:
+        tensors = list(cache.key_cache) + list(cache.value_cache)
+    return sum(t.numel() * t.element_size() for t in tensors if t is not None)
+
+
+def common_prefix_length(cached_ids, new_ids):
+    """Numero di token iniziali identici tra due sequenze"""
+    length = 0
+    for a, b in zip(cached_ids, new_ids):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+def audio_spans(input_ids, audio_token_id):
+    """Posizioni [inizio, fine) dei segnaposto audio nel prompt, uno per audio"""
+    spans = []
+    start = None
+    for i, token in enumerate(input_ids):
+        if token == audio_token_id and start is None:
+            start = i
+        elif token != audio_token_id and start is not None:
+            spans.append((start, i))
+            start = None
+    if start is not None:
+        spans.append((start, len(input_ids)))
+    return spans
+
+
+class QwenSession:
+    """Una conversazione: storia dei turni, audio e cache dei key/value"""
+
+    def __init__(self, session_id, system_prompt=DEFAULT_SYSTEM_PROMPT):
+        self.session_id = session_id
+        self.conversation = [{"role": "system", "content": system_prompt}]
+        self.audios = []
+        self.cache = None
+        self.cached_ids = []
+        self.last_used = time.time()
+        self.turns = 0
+        self.last_prompt_tokens = 0
+        self.last_reused_tokens = 0
+
+    @property
+    def cache_bytes(self):
+        return cache_nbytes(self.cache)
+
+    def drop_cache(self):
+        self.cache = None
+        self.cached_ids = []
+
+
+class QwenService:
+    def __init__(self, model_id="Qwen/Qwen2-Audio-7B-Instruct", max_cache_mb=2048, idle_timeout=300,
+                 session_ttl=3600, max_new_tokens=256, profile=None, num_threads=None, feature_cache_dir=None,
+                 max_audios=8):
+        """
+        Carica Qwen2-Audio e prepara la gestione delle sessioni.
+
+        Args:
+            model_id (str): ID del modello Qwen da utilizzare
+            max_cache_mb (float): Memoria massima complessiva delle cache key/value in MB
+            idle_timeout (float): Secondi di inattività dopo cui una sessione perde la cache
+            session_ttl (float): Secondi di inattività dopo cui una sessione viene eliminata
+            max_new_tokens (int): Lunghezza massima di ogni risposta
+            profile (str, optional): Profilo di inferenza (fp32, int8, bf16, fp16)
+            num_threads (int, optional): Thread di PyTorch per l'inferenza su CPU
+            feature_cache_dir (str, optional): Directory della cache delle feature audio; a ogni turno
+                il processor riceve tutti gli audio della conversazione, che così non vengono ricalcolati
+            max_audios (int): Numero massimo di audio conservati nella storia di una sessione
+        """
+        self.model_id = model_id
+        self.max_cache_bytes = int(max_cache_mb * 1024 * 1024)
+        self.idle_timeout = idle_timeout
+        self.session_ttl = session_ttl
+        self.max_new_tokens = max_new_tokens
+        self.max_audios = max(1, max_audios)
+        self.sessions = OrderedDict()
+        self.sessions_lock = threading.Lock()
+        # Il modello serve una richiesta per volta
+        self.model_lock = threading.Lock()
+
+        start_time = time.time()
+        self.processor, self.model = load_qwen_model(model_id, profile, num_threads)
+        self.load_time = time.time() - start_time
+        logger.info(f"Modello caricato in {self.load_time:.2f} secondi")
+        self.feature_cache = enable_feature_cache(self.processor, feature_cache_dir) if feature_cache_dir else None
+
+        tokenizer = self.processor.tokenizer
+        audio_token = getattr(self.processor, "audio_token", "<|AUDIO|>")
+        self.audio_token_id = tokenizer.convert_tokens_to_ids(audio_token)
+        self.eos_token_ids = {tokenizer.eos_token_id, tokenizer.convert_tokens_to_ids("<|im_end|>")}
+        self.sampling_rate = self.processor.feature_extractor.sampling_rate
+
+        # Senza richieste evict() non verrebbe mai chiamato: lo si esegue anche periodicamente
+        self.sweep_interval = max(1.0, min(idle_timeout, session_ttl) / 4)
+        self.sweeper = threading.Thread(target=self._sweep_loop, name="qwen-sweeper", daemon=True)
+        self.sweeper.start()
+
+    def create_session(self, system_prompt=None):
+        session = QwenSession(uuid.uuid4().hex, system_prompt or DEFAULT_SYSTEM_PROMPT)
+        with self.sessions_lock:
+            self.sessions[session.session_id] = session
+        return session.session_id
+
+    def close_session(self, session_id):
+        with self.sessions_lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def get_session(self, session_id):
+        with self.sessions_lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def evict(self, keep=None):
+        """
+        Applica timeout di inattività e budget di memoria alle sessioni.
+        Va chiamato tenendo model_lock, perché non si svuoti la cache di una sessione in uso.
+        """
+        now = time.time()
+        with self.sessions_lock:
+            for session_id, session in list(self.sessions.items()):
+                idle = now - session.last_used
+                if session is keep:
+                    continue
+                if idle > self.session_ttl:
+                    del self.sessions[session_id]
+                    logger.info(f"Sessione {session_id} eliminata dopo {idle:.0f} s di inattività")
+                elif idle > self.idle_timeout and session.cache is not None:
+                    session.drop_cache()
+
+            total = sum(session.cache_bytes for session in self.sessions.values())
+            # OrderedDict in ordine di utilizzo: le prime sono le meno recenti
+            for session in self.sessions.values():
+                if total <= self.max_cache_bytes:
+                    break
+                if session is keep or session.cache is None:
+                    continue
+                total -= session.cache_bytes
+                session.drop_cache()
+                logger.info(f"Cache della sessione {session.session_id} liberata (budget di memoria)")
+            return total
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            with self.model_lock:
+                self.evict()
+
+    def _trim_audios(self, session):
+        """
+        Oltre max_audios toglie dalla storia gli audio dei turni più vecchi, lasciandone il
+        testo. Il prompt cambia da quel turno in poi, che al turno successivo viene ricodificato.
+        """
+        while len(session.audios) > self.max_audios:
+            session.audios.pop(0)
+            for message in session.conversation:
+                content = message["content"]
+                if isinstance(content, list) and any(item["type"] == "audio" for item in content):
+                    message["content"] = [item for item in content if item["type"] != "audio"]
+                    break
+
+    def _prepare_turn(self, session):
+        """Tokenizza il prompt completo e restituisce i soli input non ancora in cache"""
+        prompt = self.processor.apply_chat_template(session.conversation, add_generation_prompt=True, tokenize=False)
+        inputs = self.processor(text=prompt, audio=session.audios or None, sampling_rate=self.sampling_rate,
+                                return_tensors="pt", padding=True)
+        input_ids = inputs.input_ids[0].tolist()
+
+        reused = common_prefix_length(session.cached_ids, input_ids)
+        # Almeno un token nuovo per ottenere i logit del primo token della risposta
+        reused = min(reused, len(input_ids) - 1)
+
+        spans = audio_spans(input_ids, self.audio_token_id)
+        for start, end in spans:
+            # Un audio tagliato a metà dal prefisso in cache va ricodificato per intero
+            if start < reused < end:
+                reused = start
+        new_audio = [i for i, (start, _) in enumerate(spans) if start >= reused]
+
+        features = None
+        if new_audio and getattr(inputs, "input_features", None) is not None:
+            features = {
+                "input_features": inputs.input_features[new_audio],
+                "feature_attention_mask": inputs.feature_attention_mask[new_audio]
+            }
+        return input_ids, reused, features
+
+    def _forward(self, session, input_ids, features=None):
+        """Passa input_ids nel modello a partire dalla cache della sessione e restituisce gli ultimi logit"""
+        device = self.model.device
+        past_length = session.cache.get_seq_length()
+        kwargs = {
+            "input_ids": torch.tensor([input_ids], device=device),
+            "attention_mask": torch.ones((1, past_length + len(input_ids)), dtype=torch.long, device=device),
+            "past_key_values": session.cache,
+            "use_cache": True
+        }
+        if features:
+            kwargs["input_features"] = features["input_features"].to(device, dtype=model_dtype(self.model))
+            kwargs["feature_attention_mask"] = features["feature_attention_mask"].to(device)
+        with torch.no_grad():
+            outputs = self.model(**kwargs)
+        session.cache = outputs.past_key_values
+        session.cached_ids.extend(input_ids)
+        return outputs.logits[0, -1]
+
+    def generate_tokens(self, session, max_new_tokens=None):
+        """
+        Esegue il turno corrente della sessione, restituendo gli id dei token man mano.
+
+        Il prefisso già in cache viene riutilizzato; la cache resta aggiornata
+        con tutti i token generati, pronta per il turno successivo.
+        """
+        input_ids, reused, features = self._prepare_turn(session)
+        if session.cache is None or reused == 0:
+            session.cache = DynamicCache()
+            session.cached_ids = []
+            reused = 0
+        elif reused < len(session.cached_ids):
+            session.cache.crop(reused)
+            session.cached_ids = session.cached_ids[:reused]
+        session.last_prompt_tokens = len(input_ids)
+        session.last_reused_tokens = reused
+
+        logits = self._forward(session, input_ids[reused:], features)
+        for _ in range(max_new_tokens or self.max_new_tokens):
+            next_id = int(torch.argmax(logits))
+            if next_id in self.eos_token_ids:
+                break
+            yield next_id
+            logits = self._forward(session, [next_id])
+
+    def chat(self, session_id, text, audio=None, max_new_tokens=None):
+        """
+        Esegue un turno di conversazione.
+
+        Args:
+            session_id (str): Sessione creata con create_session()
+            text (str): Testo dell'utente
+            audio (numpy.ndarray, optional): Campioni float32 a 16 kHz allegati al turno
+
+        Returns:
+            dict: Risposta e statistiche del turno (token riutilizzati, tempi)
+
+        Raises:
+            KeyError: Se la sessione non esiste
+        """
+        session = self.get_session(session_id)
+        if session is None:
+            raise KeyError(session_id)
+
+        content = []
+        if audio is not None:
+            content.append({"type": "audio", "audio_url": f"turn-{session.turns}"})
+        content.append({"type": "text", "text": text})
+
+        with self.model_lock:
+            session.conversation.append({"role": "user", "content": content})
+            if audio is not None:
+                session.audios.append(audio)
+            start_time = time.time()
+            try:
+                token_ids = list(self.generate_tokens(session, max_new_tokens))
+            except Exception:
+                # Turno fallito: la storia torna allo stato precedente e la cache, forse incompleta, si scarta
+                session.conversation.pop()
+                if audio is not None:
+                    session.audios.pop()
+                session.drop_cache()
+                raise
+            generation_time = time.time() - start_time
+
+            response = self.processor.tokenizer.decode(token_ids, skip_special_tokens=True)
+            session.conversation.append({"role": "assistant", "content": response})
+            session.turns += 1
+            session.last_used = time.time()
+            self._trim_audios(session)
+            cache_total = self.evict(keep=session)
+
+        return {
+            "text": response,
+            "turn": session.turns,
+            "prompt_tokens": session.last_prompt_tokens,
+            "reused_tokens": session.last_reused_tokens,
+            "new_tokens": len(token_ids),
+            "generation_time": generation_time,
+            "cache_bytes": session.cache_bytes,
+            "total_cache_bytes": cache_total
+        }
+
+    def health(self):
+        with self.sessions_lock:
+            cached = sum(1 for session in self.sessions.values() if session.cache is not None)
+            total = sum(session.cache_bytes for session in self.sessions.values())
+            return {
+                "status": "ok",
+                "model": self.model_id,
+                "device": str(self.model.device),
+                "load_time": self.load_time,
+                "sessions": len(self.sessions),
+                "sessions_with_cache": cached,
+                "cache_bytes": total,
+                "max_cache_bytes": self.max_cache_bytes,
+                "feature_cache": self.feature_cache.stats() if self.feature_cache else None
+            }
+
+
+def make_handler(service):
+    class QwenRequestHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length).decode("utf-8")) if length else {}
+
+        def _path_parts(self):
+            return [part for part in self.path.split("?")[0].split("/") if part]
+
+        def do_GET(self):
+            if self._path_parts() == ["health"]:
+                self._send_json(service.health())
+            else:
+                self._send_json({"error": "Endpoint non trovato"}, status=404)
+
+        def do_DELETE(self):
+            parts = self._path_parts()
+            if len(parts) == 2 and parts[0] == "sessions" and service.close_session(parts[1]):
+                self._send_json({"status": "closed"})
+            else:
+                self._send_json({"error": "Sessione non trovata"}, status=404)
+
+        def do_POST(self):
+            parts = self._path_parts()
+            try:
+                request = self._read_json()
+            except ValueError as e:
+                self._send_json({"error": f"JSON non valido: {e}"}, status=400)
+                return
+
+            if parts == ["sessions"]:
+                self._send_json({"session_id": service.create_session(request.get("system"))})
+                return
+
+            if len(parts) != 3 or parts[0] != "sessions" or parts[2] != "chat":
+                self._send_json({"error": "Endpoint non trovato"}, status=404)
+                return
+
+            try:
+                audio = None
+                if request.get("audio_path"):
+                    audio, _ = load_audio(request["audio_path"], sr=service.sampling_rate)
+                elif request.get("audio_b64"):
+                    audio, _ = load_audio(base64.b64decode(request["audio_b64"]), sr=service.sampling_rate)
+            except Exception as e:
+                self._send_json({"error": f"Audio non valido: {e}"}, status=400)
+                return
+
+            try:
+                self._send_json(service.chat(parts[1], request.get("text", ""), audio, request.get("max_new_tokens")))
+            except KeyError:
+                self._send_json({"error": "Sessione non trovata"}, status=404)
+            except Exception as e:
+                logger.error(f"Errore durante la generazione: {str(e)}")
+                self._send_json({"error": str(e)}, status=500)
+
+    return QwenRequestHandler
+
+
+def create_remote_session(url, system_prompt=None, session=None):
+    """Apre una sessione sul servizio residente e ne restituisce l'id"""
+    session = session or get_session()
+    response = session.post(f"{url.rstrip('/')}/sessions", json={"system": system_prompt} if system_prompt else {})
+    return json_response(response, "servizio Qwen")["session_id"]
+
+
+def chat_remote(url, session_id, text, audio_file=None, session=None, timeout=INFERENCE_TIMEOUT):
+    """
+    Invia un turno di conversazione al servizio residente.
+
+    Args:
+        url (str): URL base del servizio, es. http://localhost:8091
+        session_id (str): Id restituito da create_remote_session()
+        text (str): Testo dell'utente
+        audio_file (str, optional): File audio da allegare al turno (inviato nel corpo)
+        session (requests.Session, optional): Sessione HTTP da usare
+        timeout (float or tuple): Timeout (connessione, lettura); la generazione su audio lunghi richiede minuti
+
+    Returns:
+        dict: Risposta del servizio (text, reused_tokens, generation_time, ...)
+    """
+    session = session or get_session()
+    payload = {"text": text}
+    if audio_file:
+        with open(audio_file, 'rb') as f:
+            payload["audio_b64"] = base64.b64encode(f.read()).decode("ascii")
+    response = session.post(f"{url.rstrip('/')}/sessions/{session_id}/chat", json=payload, timeout=timeout)
+    return json_response(response, "servizio Qwen")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Servizio Qwen2-Audio residente con sessioni a più turni')
+    parser.add_argument('-m', '--model', type=str, default="Qwen/Qwen2-Audio-7B-Instruct",
+                        help='ID del modello Qwen da utilizzare')
+    parser.add_argument('--host', default="127.0.0.1", help='Indirizzo di ascolto (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8091, help='Porta di ascolto (default: 8091)')
+    parser.add_argument('--max_cache_mb', type=float, default=2048,
+                        help='Memoria massima per le cache key/value delle sessioni in MB (default: 2048)')
+    parser.add_argument('--idle_timeout', type=float, default=300,
+                        help='Secondi di inattività dopo cui una sessione perde la cache (default: 300)')
+    parser.add_argument('--session_ttl', type=float, default=3600,
+                        help='Secondi di inattività dopo cui una sessione viene eliminata (default: 3600)')
+    parser.add_argument('--max_new_tokens', type=int, default=256,
+                        help='Lunghezza massima delle risposte in token (default: 256)')
+    parser.add_argument('--profile', choices=PROFILES,
+                        help='Profilo di inferenza: fp32, int8, bf16, fp16 su GPU (default: device_map="auto")')
+    parser.add_argument('--threads', type=int, help='Numero di thread di PyTorch (default: automatico)')
+    parser.add_argument('--feature_cache', type=str, help='Directory della cache delle feature audio (opzionale)')
+    parser.add_argument('--max_audios', type=int, default=8,
+                        help='Audio conservati nella storia di ogni sessione (default: 8)')
+
+    args = parser.parse_args()
+
+    service = QwenService(args.model, args.max_cache_mb, args.idle_timeout, args.session_ttl, args.max_new_tokens,
+                          args.profile, args.threads, args.feature_cache, args.max_audios)
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    logger.info(f"Servizio Qwen2-Audio in ascolto su http://{args.host}:{args.port}")
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Servizio interrotto dall'utente")
+    finally:
+        httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,16 +2,27 @@
 """
 Script per registrare audio dal microfono e salvarlo come file MP3.
 Supporta la registrazione con durata specificata o fino all'interruzione manuale.
+
+Con --stream la cattura è continua: ogni frase viene chiusa appena chi parla
+si ferma (rilevamento dell'attività vocale) e resa disponibile come array
+float32 a 16 kHz, senza attendere una durata fissa né passare da file MP3.
+Con --wav lo stesso percorso viene alimentato da un file WAV, per i test.
+
+record_array() restituisce direttamente i campioni a 16 kHz da passare a
+transcribe_audio() o process_audio_with_qwen(); l'MP3, se serve, viene
+scritto in background con save_mp3_async() senza rallentare il turno.
 """
 
 import argparse
 import os
+import threading
 import time
-import wave
-import tempfile
+import numpy as np
 import pyaudio
 import pydub
 
+from voice_activity import VAD_SAMPLE_RATE, EnergyVAD, stream_utterances, wav_blocks, write_wav
+
 def record_audio(output_file, duration=None, sample_rate=44100, channels=1, chunk=1024):
     """
     Registra audio dal microfono e lo salva come file MP3.
@@ -60,25 +71,111 @@ def record_audio(output_file, duration=None, sample_rate=44100, channels=1, chun
 
     print("Registrazione completata!")
 
-    # Salva prima come WAV temporaneo, poi converti in MP3
-    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_wav:
-        temp_wav_path = temp_wav.name
+    # Conversione in MP3 direttamente dai campioni PCM, senza WAV temporaneo
+    sound = pydub.AudioSegment(data=b''.join(frames),
+                               sample_width=p.get_sample_size(pyaudio.paInt16),
+                               frame_rate=sample_rate,
+                               channels=channels)
+    sound.export(output_file, format="mp3")
 
-    wf = wave.open(temp_wav_path, 'wb')
-    wf.setnchannels(channels)
-    wf.setsampwidth(p.get_sample_size(pyaudio.paInt16))
-    wf.setframerate(sample_rate)
-    wf.writeframes(b''.join(frames))
-    wf.close()
+    print(f"Audio salvato come '{output_file}'")
 
-    # Conversione in MP3
-    sound = pydub.AudioSegment.from_wav(temp_wav_path)
-    sound.export(output_file, format="mp3")
+def record_array(duration=None, sample_rate=VAD_SAMPLE_RATE, vad=None):
+    """
+    Registra dal microfono e restituisce i campioni in memoria, pronti per il riconoscimento vocale.
 
-    # Rimuovi il file WAV temporaneo
-    os.unlink(temp_wav_path)
+    Args:
+        duration (float, optional): Durata in secondi; None per fermarsi alla fine della prima frase
+        sample_rate (int): Frequenza di campionamento (quella attesa dal modello, default 16 kHz)
+        vad (EnergyVAD, optional): Rilevatore usato quando duration è None
 
-    print(f"Audio salvato come '{output_file}'")
+    Returns:
+        numpy.ndarray: Campioni float32 mono a sample_rate
+    """
+    if duration is None:
+        vad = vad or EnergyVAD(sample_rate=sample_rate)
+        print("In ascolto... la registrazione termina quando smetti di parlare")
+        for segment in stream_utterances(mic_blocks(sample_rate), vad):
+            return segment.audio
+        return np.zeros(0, dtype=np.float32)
+
+    # Durata nota: un unico array preallocato invece di una lista di blocchi
+    audio = np.empty(int(duration * sample_rate), dtype=np.float32)
+    filled = 0
+    print(f"Registrazione di {duration} secondi in corso...")
+    for block in mic_blocks(sample_rate):
+        count = min(len(block), len(audio) - filled)
+        audio[filled:filled + count] = block[:count]
+        filled += count
+        if filled >= len(audio):
+            break
+    return audio
+
+def save_mp3_async(audio, output_file, sample_rate=VAD_SAMPLE_RATE):
+    """
+    Salva campioni float32 come MP3 in un thread separato, così la codifica non
+    ritarda la trascrizione. Chiamare join() sul thread restituito per attenderne la fine.
+    """
+    def export():
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        sound = pydub.AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=sample_rate, channels=1)
+        sound.export(output_file, format="mp3")
+        print(f"Audio salvato come '{output_file}'")
+
+    thread = threading.Thread(target=export, name="mp3-export")
+    thread.start()
+    return thread
+
+def mic_blocks(sample_rate=VAD_SAMPLE_RATE, block_size=480):
+    """
+    Legge dal microfono blocchi float32 mono alla frequenza richiesta dai modelli,
+    così non serve alcun ricampionamento prima del riconoscimento vocale.
+    """
+    p = pyaudio.PyAudio()
+    stream = p.open(format=pyaudio.paInt16,
+                    channels=1,
+                    rate=sample_rate,
+                    input=True,
+                    frames_per_buffer=block_size)
+    try:
+        while True:
+            data = stream.read(block_size, exception_on_overflow=False)
+            yield np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+    finally:
+        stream.stop_stream()
+        stream.close()
+        p.terminate()
+
+def listen_utterances(wav_file=None, vad=None):
+    """
+    Restituisce le frasi pronunciate man mano che vengono concluse.
+
+    Args:
+        wav_file (str, optional): File WAV da usare al posto del microfono
+        vad (EnergyVAD, optional): Rilevatore di attività vocale configurato
+
+    Yields:
+        SpeechSegment: Frase con campioni float32 a 16 kHz (segment.audio) e tempi di inizio/fine
+    """
+    vad = vad or EnergyVAD()
+    blocks = wav_blocks(wav_file, sample_rate=vad.sample_rate) if wav_file else mic_blocks(vad.sample_rate)
+    yield from stream_utterances(blocks, vad)
+
+def stream_to_files(output_dir, wav_file=None, vad=None):
+    """Salva ogni frase rilevata come WAV a 16 kHz in output_dir"""
+    os.makedirs(output_dir, exist_ok=True)
+    if wav_file is None:
+        print("In ascolto... premi CTRL+C per interrompere")
+    count = 0
+    try:
+        for segment in listen_utterances(wav_file, vad):
+            count += 1
+            segment_file = os.path.join(output_dir, f"utterance_{count:03d}.wav")
+            write_wav(segment_file, segment.audio, segment.sample_rate)
+            print(f"Frase {count}: {segment.start:.2f}-{segment.end:.2f} s ({segment.duration:.2f} s) -> {segment_file}")
+    except KeyboardInterrupt:
+        print("\nAscolto interrotto dall'utente")
+    print(f"{count} frasi rilevate")
 
 def main():
     parser = argparse.ArgumentParser(description='Registra audio dal microfono in formato MP3')
@@ -90,10 +187,24 @@ def main():
                         help='Frequenza di campionamento (default: 44100 Hz)')
     parser.add_argument('-c', '--channels', type=int, default=1,
                         help='Numero di canali (1=mono, 2=stereo, default: 1)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Cattura continua: salva ogni frase in --segments_dir appena chi parla si ferma')
+    parser.add_argument('--wav', type=str,
+                        help='In modalità --stream, legge da questo file WAV invece che dal microfono')
+    parser.add_argument('--segments_dir', type=str, default='utterances',
+                        help='Cartella per le frasi rilevate in modalità --stream (default: utterances)')
+    parser.add_argument('--threshold_db', type=float, default=-40.0,
+                        help='Soglia minima di energia della voce in dBFS (default: -40)')
+    parser.add_argument('--hangover_ms', type=int, default=600,
+                        help='Silenzio in ms che chiude una frase (default: 600)')
 
     args = parser.parse_args()
 
-    record_audio(args.output, args.duration, args.rate, args.channels)
+    if args.stream or args.wav:
+        vad = EnergyVAD(threshold_db=args.threshold_db, hangover_ms=args.hangover_ms)
+        stream_to_files(args.segments_dir, args.wav, vad)
+    else:
+        record_audio(args.output, args.duration, args.rate, args.channels)
 
 if __name__ == '__main__':
     main()
@@ -6,69 +6,138 @@ Qwen2-Audio per generare una risposta, salvando l'output in un file di testo.
 """
 
 import argparse
+import json
 import os
+import sys
 import logging
 import torch
 import time
+import threading
 from io import BytesIO
-import librosa
 import numpy as np
-from transformers import Qwen2AudioForConditionalGeneration, AutoProcessor, GenerationConfig
+from transformers import Qwen2AudioForConditionalGeneration, AutoProcessor, GenerationConfig, TextIteratorStreamer
+
+# Rende importabili i moduli condivisi in component_test/common
+COMMON_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from audio_loader import load_audio
+from feature_cache import CachedFeatureExtractor, MemoryFeatureCache, enable_feature_cache
+from inference_profile import PROFILES, apply_profile, configure_threads, load_kwargs, model_dtype, resolve_profile
 
 # Configura logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_audio_with_qwen(audio_file, text_prompt, output_file, model_id="Qwen/Qwen2-Audio-7B-Instruct"):
+def load_qwen_model(model_id="Qwen/Qwen2-Audio-7B-Instruct", profile=None, num_threads=None, compile_model=False):
     """
-    Processa un file audio e un prompt testuale usando il modello Qwen2-Audio
+    Carica il modello Qwen2-Audio e il processor.
 
     Args:
-        audio_file (str): Percorso del file audio
-        text_prompt (str): Prompt testuale da inviare al modello
-        output_file (str): Percorso dove salvare la risposta
         model_id (str): ID del modello Qwen da utilizzare
+        profile (str, optional): Profilo di inferenza (fp32, int8, bf16, fp16), vedi inference_profile.py;
+            None per il caricamento predefinito con device_map="auto"
+        num_threads (int, optional): Thread di PyTorch per l'inferenza su CPU
+        compile_model (bool): Se True compila il forward con torch.compile
+
+    Returns:
+        tuple: (processor, model)
     """
-    try:
-        logger.info(f"Caricamento del modello {model_id}...")
-        processor = AutoProcessor.from_pretrained(model_id)
+    logger.info(f"Caricamento del modello {model_id}...")
+    processor = AutoProcessor.from_pretrained(model_id)
+    if profile is None:
         model = Qwen2AudioForConditionalGeneration.from_pretrained(model_id, device_map="auto")
+        model.eval()
+        return processor, model
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    profile = resolve_profile(profile, device)
+    configure_threads(num_threads)
+    logger.info(f"Profilo di inferenza: {profile}")
+    model = Qwen2AudioForConditionalGeneration.from_pretrained(model_id, device_map=device, **load_kwargs(profile))
+    model = apply_profile(model, profile, compile_model)
+    return processor, model
+
+def prepare_qwen_inputs(audio_file, text_prompt, processor, model):
+    """
+    Costruisce la conversazione ChatML e prepara gli input per il modello, già sul suo device.
 
+    Args:
+        audio_file (str or numpy.ndarray): Percorso del file audio o campioni float32 a 16 kHz
+        text_prompt (str): Prompt testuale da inviare al modello
+        processor, model: Modello caricato con load_qwen_model()
+
+    Returns:
+        BatchFeature: input_ids, attention_mask, input_features e feature_attention_mask
+    """
+    target_sr = processor.feature_extractor.sampling_rate
+    if isinstance(audio_file, np.ndarray):
+        # Audio già in memoria alla frequenza del modello: nessuna decodifica né ricampionamento
+        audio_data = audio_file.astype(np.float32, copy=False)
+        audio_ref = "memory"
+        logger.info(f"Audio in memoria: {len(audio_data) / target_sr:.2f} secondi a {target_sr} Hz")
+    else:
         logger.info(f"Caricamento del file audio {audio_file}...")
-        # Carica il file audio utilizzando librosa con sampling_rate esplicito
-        target_sr = processor.feature_extractor.sampling_rate
-        audio_data, sr = librosa.load(audio_file, sr=target_sr)
+        # Carica il file audio con sampling_rate esplicito (decodifica e ricampionamento veloci)
+        audio_data, sr = load_audio(audio_file, sr=target_sr)
+        audio_ref = audio_file
 
         logger.info(f"File audio caricato con sampling rate: {sr} Hz (target: {target_sr} Hz)")
 
-        # Costruisci la conversazione in formato ChatML come richiesto da Qwen2-Audio
-        conversation = [
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": [
-                {"type": "audio", "audio_url": audio_file},  # L'URL viene usato solo come riferimento
-                {"type": "text", "text": text_prompt},
-            ]},
-        ]
-
-        # Applica il template di chat
-        logger.info("Preparazione dell'input per il modello...")
-        text = processor.apply_chat_template(conversation, add_generation_prompt=True, tokenize=False)
-
-        # Prepara l'input per il modello con sampling_rate esplicito
-        inputs = processor(
-            text=text,
-            audio=[audio_data],  # Usa 'audio' invece di 'audios'
-            sampling_rate=target_sr,
-            return_tensors="pt",
-            padding=True
-        )
+    # Costruisci la conversazione in formato ChatML come richiesto da Qwen2-Audio
+    conversation = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": [
+            {"type": "audio", "audio_url": audio_ref},  # L'URL viene usato solo come riferimento
+            {"type": "text", "text": text_prompt},
+        ]},
+    ]
+
+    # Applica il template di chat
+    logger.info("Preparazione dell'input per il modello...")
+    text = processor.apply_chat_template(conversation, add_generation_prompt=True, tokenize=False)
+
+    # Prepara l'input per il modello con sampling_rate esplicito
+    inputs = processor(
+        text=text,
+        audio=[audio_data],  # Usa 'audio' invece di 'audios'
+        sampling_rate=target_sr,
+        return_tensors="pt",
+        padding=True
+    )
+
+    # Sposta tutti gli input al device del modello
+    device = model.device
+    logger.info(f"Spostamento degli input sul device: {device}")
+    for key, value in inputs.items():
+        if hasattr(value, "to"):
+            inputs[key] = value.to(device)
+    # Le feature audio seguono il tipo dei pesi (bf16/fp16), gli id restano interi
+    if "input_features" in inputs:
+        inputs["input_features"] = inputs["input_features"].to(model_dtype(model))
 
-        # Sposta tutti gli input al device del modello
-        device = model.device
-        logger.info(f"Spostamento degli input sul device: {device}")
-        for key, value in inputs.items():
-            if hasattr(value, "to"):
-                inputs[key] = value.to(device)
+    return inputs
+
+def process_audio_with_qwen(audio_file, text_prompt, output_file, model_id="Qwen/Qwen2-Audio-7B-Instruct",
+                            processor=None, model=None):
+    """
+    Processa un file audio e un prompt testuale usando il modello Qwen2-Audio
+
+    Args:
+        audio_file (str or numpy.ndarray): Percorso del file audio, oppure campioni float32
+            mono già in memoria alla frequenza del feature extractor (16 kHz)
+        text_prompt (str): Prompt testuale da inviare al modello
+        output_file (str): Percorso dove salvare la risposta
+        model_id (str): ID del modello Qwen da utilizzare
+        processor, model (optional): Modello già caricato con load_qwen_model(),
+            per evitare di ricaricarlo a ogni chiamata
+    """
+    try:
+        if processor is None or model is None:
+            processor, model = load_qwen_model(model_id)
+
+        inputs = prepare_qwen_inputs(audio_file, text_prompt, processor, model)
 
         # Crea una configurazione di generazione personalizzata che sovrascrive la predefinita
         generation_config = GenerationConfig(
@@ -122,26 +191,302 @@ def process_audio_with_qwen(audio_file, text_prompt, output_file, model_id="Qwen
         logger.error(traceback.format_exc())
         raise
 
+def read_batch_items(jsonl_file=None, audio_file=None, prompts=None):
+    """
+    Costruisce la lista delle richieste per process_batch_with_qwen.
+
+    Args:
+        jsonl_file (str, optional): File JSONL con una richiesta per riga: {"audio": ..., "prompt": ..., "id": ...}
+            ("id" è facoltativo)
+        audio_file (str, optional): In alternativa, un solo file audio...
+        prompts (list, optional): ...con più prompt
+
+    Returns:
+        list: Dizionari {"id", "audio", "prompt"}
+    """
+    if jsonl_file:
+        items = []
+        with open(jsonl_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if "audio" not in item or "prompt" not in item:
+                    raise ValueError(f"Riga {line_number} di {jsonl_file}: servono i campi 'audio' e 'prompt'")
+                items.append({"id": item.get("id", len(items)), "audio": item["audio"], "prompt": item["prompt"]})
+        return items
+    return [{"id": i, "audio": audio_file, "prompt": prompt} for i, prompt in enumerate(prompts or [])]
+
+def process_batch_with_qwen(items, processor, model, batch_size=8, max_new_tokens=256):
+    """
+    Esegue più coppie audio/prompt con generazioni in batch (greedy, con padding a sinistra).
+
+    Le richieste sullo stesso audio vengono raggruppate nello stesso batch: ogni file
+    viene decodificato una volta e le sue feature log-mel vengono calcolate una volta
+    per batch, anche se compare in più righe.
+
+    Args:
+        items (list): Dizionari {"id", "audio", "prompt"} (vedi read_batch_items)
+        processor, model: Modello caricato con load_qwen_model()
+        batch_size (int): Numero massimo di prompt generati insieme
+        max_new_tokens (int): Lunghezza massima di ogni risposta
+
+    Yields:
+        dict: Per ogni richiesta {"id", "audio", "prompt", "response", "batch_size", "generation_time"}
+    """
+    target_sr = processor.feature_extractor.sampling_rate
+    tokenizer = processor.tokenizer
+    generation_config = GenerationConfig(
+        max_new_tokens=max_new_tokens,
+        num_beams=1,
+        do_sample=False,
+        temperature=None,
+        top_p=None,
+        top_k=None,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id
+    )
+
+    # Ordine stabile: prima tutte le richieste del primo audio, poi del secondo, ...
+    audio_order = {}
+    for item in items:
+        audio_order.setdefault(item["audio"], len(audio_order))
+    ordered = sorted(items, key=lambda item: audio_order[item["audio"]])
+    # Ultimo batch in cui compare ogni audio: dopo di esso la forma d'onda viene liberata
+    last_batch = {item["audio"]: index // batch_size for index, item in enumerate(ordered)}
+
+    audios = {}
+    feature_extractor = processor.feature_extractor
+    if not isinstance(feature_extractor, CachedFeatureExtractor):
+        # Con gli audio in ordine, tra un batch e il successivo si ripete al più un audio:
+        # bastano le feature delle clip dell'ultimo batch
+        processor.feature_extractor = CachedFeatureExtractor(feature_extractor, MemoryFeatureCache(max_entries=batch_size))
+    padding_side = tokenizer.padding_side
+    # Con il padding a sinistra i token generati iniziano per tutti nella stessa colonna
+    tokenizer.padding_side = "left"
+    try:
+        for batch_start in range(0, len(ordered), batch_size):
+            batch = ordered[batch_start:batch_start + batch_size]
+            texts = []
+            for item in batch:
+                if item["audio"] not in audios:
+                    audios[item["audio"]] = load_audio(item["audio"], sr=target_sr)[0]
+                conversation = [
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": [
+                        {"type": "audio", "audio_url": item["audio"]},
+                        {"type": "text", "text": item["prompt"]},
+                    ]},
+                ]
+                texts.append(processor.apply_chat_template(conversation, add_generation_prompt=True, tokenize=False))
+
+            inputs = processor(text=texts, audio=[audios[item["audio"]] for item in batch],
+                               sampling_rate=target_sr, return_tensors="pt", padding=True)
+            inputs = inputs.to(model.device)
+            inputs["input_features"] = inputs["input_features"].to(model_dtype(model))
+
+            start_time = time.time()
+            with torch.no_grad():
+                generate_ids = model.generate(**inputs, generation_config=generation_config)
+            generation_time = time.time() - start_time
+            logger.info(f"Batch di {len(batch)} prompt generato in {generation_time:.2f} secondi")
+
+            responses = processor.batch_decode(generate_ids[:, inputs.input_ids.size(1):], skip_special_tokens=True,
+                                               clean_up_tokenization_spaces=False)
+            for audio in {item["audio"] for item in batch}:
+                if last_batch[audio] == batch_start // batch_size:
+                    del audios[audio]
+            for item, response in zip(batch, responses):
+                yield {**item, "response": response.strip(), "batch_size": len(batch),
+                       "generation_time": generation_time}
+    finally:
+        tokenizer.padding_side = padding_side
+        processor.feature_extractor = feature_extractor
+
+def stream_qwen_response(audio_file, text_prompt, processor, model, max_new_tokens=256, do_sample=False,
+                         temperature=0.7, top_p=0.9):
+    """
+    Genera la risposta di Qwen2-Audio restituendo il testo man mano che viene prodotto.
+
+    A differenza di process_audio_with_qwen (beam search, risposta disponibile solo
+    alla fine) la generazione è greedy o a campionamento e gira in un thread separato;
+    i pezzi di testo arrivano da un TextIteratorStreamer, così la prima frase può
+    essere sintetizzata mentre il modello genera le successive.
+
+    Args:
+        audio_file (str or numpy.ndarray): Percorso del file audio o campioni float32 a 16 kHz
+        text_prompt (str): Prompt testuale da inviare al modello
+        processor, model: Modello caricato con load_qwen_model()
+        max_new_tokens (int): Lunghezza massima della risposta
+        do_sample (bool): True per il campionamento, False per la generazione greedy
+        temperature, top_p (float): Parametri del campionamento (ignorati se do_sample=False)
+
+    Yields:
+        str: Pezzi di testo della risposta, nell'ordine
+    """
+    inputs = prepare_qwen_inputs(audio_file, text_prompt, processor, model)
+    streamer = TextIteratorStreamer(processor.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    generation_config = GenerationConfig(
+        max_new_tokens=max_new_tokens,
+        num_beams=1,
+        do_sample=do_sample,
+        temperature=temperature if do_sample else None,
+        top_p=top_p if do_sample else None,
+        top_k=None,
+        pad_token_id=processor.tokenizer.pad_token_id,
+        eos_token_id=processor.tokenizer.eos_token_id
+    )
+
+    errors = []
+
+    def generate():
+        try:
+            # no_grad vale per il thread corrente: va attivato qui e non nel chiamante
+            with torch.no_grad():
+                model.generate(**inputs, generation_config=generation_config, streamer=streamer)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=generate, name="qwen-generate", daemon=True)
+    thread.start()
+    for text in streamer:
+        if text:
+            yield text
+    thread.join()
+    if errors:
+        raise errors[0]
+
 def main():
     parser = argparse.ArgumentParser(description='Test del modello Qwen2-Audio')
-    parser.add_argument('-a', '--audio', type=str, required=True,
+    parser.add_argument('-a', '--audio', type=str,
                         help='Percorso del file audio da processare')
-    parser.add_argument('-p', '--prompt', type=str, required=True,
+    parser.add_argument('--mic', action='store_true',
+                        help='Registra dal microfono e passa l\'audio al modello direttamente dalla memoria')
+    parser.add_argument('-d', '--duration', type=float,
+                        help='Con --mic, durata della registrazione in secondi (default: fino alla fine della frase)')
+    parser.add_argument('--save_audio', type=str,
+                        help='Con --mic, salva anche la registrazione come MP3 (in background)')
+    parser.add_argument('-s', '--server', type=str,
+                        help='URL del servizio Qwen residente (es. http://localhost:8091); evita di caricare il modello')
+    parser.add_argument('-f', '--followup', type=str, nargs='*', default=[],
+                        help='Con --server, domande successive nella stessa conversazione')
+    parser.add_argument('--profile', choices=PROFILES,
+                        help='Profilo di inferenza: fp32, int8 (quantizzazione dinamica), bf16, fp16 su GPU '
+                             '(default: caricamento con device_map="auto")')
+    parser.add_argument('--threads', type=int, help='Numero di thread di PyTorch (default: automatico)')
+    parser.add_argument('--feature_cache', type=str,
+                        help='Directory della cache delle feature audio: la stessa clip con prompt diversi '
+                             'non ricalcola lo spettrogramma')
+    parser.add_argument('--stream', action='store_true',
+                        help='Generazione greedy in streaming: mostra il testo man mano che viene prodotto')
+    parser.add_argument('-p', '--prompt', type=str,
                         help='Prompt testuale da inviare al modello')
-    parser.add_argument('-o', '--output', type=str, default='qwen_response.txt',
-                        help='Nome del file di output (default: qwen_response.txt)')
+    parser.add_argument('--prompts', type=str, nargs='+',
+                        help='Modalità batch: più prompt sullo stesso audio (--audio), generati insieme')
+    parser.add_argument('--batch_jsonl', type=str,
+                        help='Modalità batch: file JSONL di richieste {"audio": ..., "prompt": ..., "id": ...}')
+    parser.add_argument('--batch_size', type=int, default=8,
+                        help='Modalità batch: prompt generati insieme (default: 8)')
+    parser.add_argument('--max_new_tokens', type=int, default=256,
+                        help='Modalità batch: lunghezza massima delle risposte (default: 256)')
+    parser.add_argument('-o', '--output', type=str,
+                        help='Nome del file di output (default: qwen_response.txt, qwen_responses.jsonl in modalità batch)')
     parser.add_argument('-m', '--model', type=str, default="Qwen/Qwen2-Audio-7B-Instruct",
                         help='ID del modello Qwen da utilizzare')
 
     args = parser.parse_args()
 
+    def load_model():
+        processor, model = load_qwen_model(args.model, args.profile, args.threads)
+        if args.feature_cache:
+            enable_feature_cache(processor, args.feature_cache)
+        return processor, model
+
+    if args.prompts or args.batch_jsonl:
+        if args.prompts and not args.audio:
+            parser.error("--prompts richiede --audio")
+        output = args.output or 'qwen_responses.jsonl'
+        try:
+            items = read_batch_items(args.batch_jsonl, args.audio, args.prompts)
+            processor, model = load_model()
+            start_time = time.time()
+            with open(output, 'w', encoding='utf-8') as f:
+                # Una riga per risposta, scritta appena il suo batch è completato
+                for result in process_batch_with_qwen(items, processor, model, args.batch_size, args.max_new_tokens):
+                    logger.info(f"[{result['id']}] {result['prompt']}\n{result['response']}")
+                    f.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    f.flush()
+            logger.info(f"{len(items)} risposte in {time.time() - start_time:.2f} secondi, salvate in '{output}'")
+        except Exception as e:
+            logger.error(f"Errore nell'esecuzione del test: {str(e)}")
+        return
+
+    if not args.prompt:
+        parser.error("specificare --prompt, oppure --prompts o --batch_jsonl per la modalità batch")
+    args.output = args.output or 'qwen_response.txt'
+
+    if args.mic:
+        from record_mic import record_array, save_mp3_async
+
+        # Qwen2-Audio usa un feature extractor a 16 kHz, come Whisper
+        audio_data = record_array(args.duration)
+        export_thread = save_mp3_async(audio_data, args.save_audio) if args.save_audio else None
+        try:
+            process_audio_with_qwen(audio_data, args.prompt, args.output, args.model, *load_model())
+        except Exception as e:
+            logger.error(f"Errore nell'esecuzione del test: {str(e)}")
+        finally:
+            if export_thread:
+                export_thread.join()
+        return
+
+    if not args.audio:
+        parser.error("specificare --audio oppure --mic")
+
     # Verifica che il file audio esista
     if not os.path.exists(args.audio):
         logger.error(f"Il file audio '{args.audio}' non esiste")
         return
 
+    if args.server:
+        from qwen_server import chat_remote, create_remote_session
+
+        try:
+            session_id = create_remote_session(args.server)
+            responses = []
+            for i, prompt in enumerate([args.prompt] + args.followup):
+                result = chat_remote(args.server, session_id, prompt, args.audio if i == 0 else None)
+                logger.info(f"Turno {result['turn']}: {result['reused_tokens']}/{result['prompt_tokens']} token "
+                            f"dal contesto in cache, risposta in {result['generation_time']:.2f}s")
+                logger.info(f"Risposta del modello:\n{result['text']}")
+                responses.append(result['text'])
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write("\n\n".join(responses))
+            logger.info(f"Risposte salvate in '{args.output}'")
+        except Exception as e:
+            logger.error(f"Errore nell'esecuzione del test: {str(e)}")
+        return
+
     try:
-        process_audio_with_qwen(args.audio, args.prompt, args.output, args.model)
+        if args.stream:
+            processor, model = load_model()
+            start_time = time.time()
+            first_text_time = None
+            pieces = []
+            for text in stream_qwen_response(args.audio, args.prompt, processor, model):
+                if first_text_time is None:
+                    first_text_time = time.time() - start_time
+                pieces.append(text)
+                print(text, end="", flush=True)
+            print()
+            logger.info(f"Primo testo dopo {first_text_time or 0:.2f}s, risposta completa in {time.time() - start_time:.2f}s")
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write("".join(pieces))
+            logger.info(f"Risposta salvata in '{args.output}'")
+        else:
+            processor, model = load_model()
+            process_audio_with_qwen(args.audio, args.prompt, args.output, args.model, processor, model)
     except Exception as e:
         logger.error(f"Errore nell'esecuzione del test: {str(e)}")
 
@@ -5,11 +5,20 @@ Script per testare il modello Qwen2-Audio con impostazioni ottimizzate per siste
 
 import argparse
 import os
+import sys
 import logging
 import torch
 import gc
 from transformers import Qwen2AudioForConditionalGeneration, AutoProcessor, GenerationConfig
 
+# Rende importabili i moduli condivisi in component_test/common
+COMMON_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from audio_loader import load_audio
+from inference_profile import PROFILES, apply_profile, configure_threads, load_kwargs, resolve_profile
+
 # Configura logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -20,10 +29,15 @@ def free_memory():
         torch.cuda.empty_cache()
     gc.collect()
 
-def process_audio_with_qwen(audio_file, text_prompt, output_file, model_id="Qwen/Qwen2-Audio-7B-Instruct"):
+def process_audio_with_qwen(audio_file, text_prompt, output_file, model_id="Qwen/Qwen2-Audio-7B-Instruct",
+                            profile=None, num_threads=None):
     """
     Processa un file audio e un prompt testuale usando il modello Qwen2-Audio
     con impostazioni ottimizzate per risorse limitate.
+
+    Senza profilo il modello viene caricato in float16 con offload su disco;
+    su macchine senza GPU conviene un profilo di inference_profile.py
+    (int8 o bf16), che evita l'offload e il float16 emulato su CPU.
     """
     try:
         # Libera memoria prima di iniziare
@@ -44,20 +58,28 @@ def process_audio_with_qwen(audio_file, text_prompt, output_file, model_id="Qwen
             "low_cpu_mem_usage": True     # Riduce uso di memoria CPU
         }
 
+        if profile is not None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            profile = resolve_profile(profile, device)
+            configure_threads(num_threads)
+            logger.info(f"Profilo di inferenza: {profile}")
+            model_loading_kwargs = dict(load_kwargs(profile), device_map=device)
+
         model = Qwen2AudioForConditionalGeneration.from_pretrained(
             model_id,
             **model_loading_kwargs
         )
+        if profile is not None:
+            model = apply_profile(model, profile)
 
         # Dopo aver caricato il modello, esegui pulizia della memoria
         free_memory()
 
         logger.info(f"Caricamento del file audio {audio_file}...")
-        import librosa
 
         # Carica l'audio con un sample rate ridotto per risparmiare memoria
         target_sr = processor.feature_extractor.sampling_rate
-        audio_data, sr = librosa.load(audio_file, sr=target_sr, mono=True)
+        audio_data, sr = load_audio(audio_file, sr=target_sr, mono=True)
 
         logger.info(f"Audio caricato: durata={len(audio_data)/sr:.2f}s, sr={sr}Hz")
 
@@ -147,6 +169,9 @@ def main():
                         help='Nome del file di output (default: qwen_response.txt)')
     parser.add_argument('-m', '--model', type=str, default="Qwen/Qwen2-Audio-7B-Instruct",
                         help='ID del modello Qwen da utilizzare')
+    parser.add_argument('--profile', choices=PROFILES,
+                        help='Profilo di inferenza per CPU: int8 o bf16 (default: float16 con offload su disco)')
+    parser.add_argument('--threads', type=int, help='Numero di thread di PyTorch (default: automatico)')
 
     args = parser.parse_args()
 
@@ -159,7 +184,7 @@ def main():
         # Imposta variabili d'ambiente per ottimizzare l'uso della memoria
         os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "max_split_size_mb:128"
 
-        process_audio_with_qwen(args.audio, args.prompt, args.output, args.model)
+        process_audio_with_qwen(args.audio, args.prompt, args.output, args.model, args.profile, args.threads)
     except Exception as e:
         logger.error(f"Errore nell'esecuzione del test: {str(e)}")
 
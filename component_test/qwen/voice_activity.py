@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Segmentazione della voce in tempo reale basata sull'energia del segnale.
+
+I campioni arrivano a blocchi (dal microfono o da un file WAV) e vengono
+analizzati in frame da pochi millisecondi: quando l'energia supera la soglia
+per alcuni frame consecutivi inizia una frase, quando resta sotto soglia per
+un tempo di "hangover" la frase viene chiusa e restituita subito come array
+float32 a 16 kHz, pronto per Whisper o Qwen2-Audio.
+
+La memoria è limitata: i campioni precedenti l'inizio della voce sono tenuti
+in un buffer circolare di pochi centinaia di millisecondi (così l'attacco
+della prima sillaba non viene perso) e ogni frase ha una durata massima.
+"""
+
+import wave
+
+import numpy as np
+
+# Frequenza di campionamento attesa dai modelli di riconoscimento vocale
+VAD_SAMPLE_RATE = 16000
+
+
+class RingBuffer:
+    """Buffer circolare di campioni a capacità fissa: i più vecchi vengono sovrascritti"""
+
+    def __init__(self, capacity, dtype=np.float32):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def write(self, samples):
+        """Aggiunge campioni in coda, scartando i più vecchi se il buffer è pieno"""
+        samples = np.asarray(samples, dtype=self.data.dtype)
+        if len(samples) >= self.capacity:
+            self.data[:] = samples[-self.capacity:]
+            self.start = 0
+            self.size = self.capacity
+            return
+
+        end = (self.start + self.size) % self.capacity
+        first = min(len(samples), self.capacity - end)
+        self.data[end:end + first] = samples[:first]
+        self.data[:len(samples) - first] = samples[first:]
+
+        overflow = self.size + len(samples) - self.capacity
+        if overflow > 0:
+            self.start = (self.start + overflow) % self.capacity
+        self.size = min(self.capacity, self.size + len(samples))
+
+    def read(self):
+        """Restituisce una copia contigua del contenuto, dal campione più vecchio al più recente"""
+        end = self.start + self.size
+        if end <= self.capacity:
+            return self.data[self.start:end].copy()
+        return np.concatenate((self.data[self.start:], self.data[:end - self.capacity]))
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+
+
+class SpeechSegment:
+    """Una frase rilevata: campioni float32 e tempi in secondi dall'inizio dello stream"""
+
+    def __init__(self, audio, start, sample_rate=VAD_SAMPLE_RATE):
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.start = start
+        self.end = start + len(audio) / sample_rate
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class EnergyVAD:
+    def __init__(self, sample_rate=VAD_SAMPLE_RATE, frame_ms=30, threshold_db=-40.0, noise_margin_db=10.0,
+                 start_ms=90, hangover_ms=600, pre_roll_ms=300, min_speech_ms=250, max_speech_s=30.0):
+        """
+        Rilevatore di inizio e fine frase basato sull'energia RMS dei frame.
+
+        Args:
+            sample_rate (int): Frequenza di campionamento dei blocchi in ingresso
+            frame_ms (int): Durata dei frame di analisi in millisecondi
+            threshold_db (float): Soglia minima di energia in dBFS per considerare un frame voce
+            noise_margin_db (float): Margine sopra il rumore di fondo stimato (la soglia si adatta
+                a stanze rumorose)
+            start_ms (int): Voce continua necessaria per iniziare una frase
+            hangover_ms (int): Silenzio necessario per chiudere una frase
+            pre_roll_ms (int): Audio precedente l'inizio della voce incluso nella frase
+            min_speech_ms (int): Frasi più corte vengono scartate (colpi, click)
+            max_speech_s (float): Durata massima di una frase; oltre viene emessa comunque
+        """
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * frame_ms / 1000)
+        self.threshold_db = threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.start_frames = max(1, round(start_ms / frame_ms))
+        self.hangover_frames = max(1, round(hangover_ms / frame_ms))
+        self.min_speech_samples = int(sample_rate * min_speech_ms / 1000)
+
+        pre_roll = max(self.frame_size * self.start_frames, int(sample_rate * pre_roll_ms / 1000))
+        self.pre_roll = RingBuffer(pre_roll)
+        self.speech = RingBuffer(int(sample_rate * max_speech_s))
+        self.pending = np.zeros(0, dtype=np.float32)
+
+        self.noise_db = None
+        self.in_speech = False
+        self.speech_run = 0
+        self.silence_run = 0
+        self.speech_start = 0.0
+        self.samples_seen = 0
+
+    @property
+    def current_threshold(self):
+        """Soglia effettiva in dBFS, tenendo conto del rumore di fondo stimato"""
+        if self.noise_db is None:
+            return self.threshold_db
+        return max(self.threshold_db, self.noise_db + self.noise_margin_db)
+
+    def _frame_db(self, frame):
+        rms = np.sqrt(np.mean(np.square(frame, dtype=np.float64)))
+        return 20 * np.log10(max(rms, 1e-10))
+
+    def _emit(self):
+        audio = self.speech.read()
+        self.speech.clear()
+        if len(audio) < self.min_speech_samples:
+            return None
+        return SpeechSegment(audio, self.speech_start, self.sample_rate)
+
+    def _process_frame(self, frame):
+        frame_db = self._frame_db(frame)
+        is_speech = frame_db > self.current_threshold
+        frame_start = self.samples_seen / self.sample_rate
+        self.samples_seen += len(frame)
+
+        if not self.in_speech:
+            self.pre_roll.write(frame)
+            if is_speech:
+                self.speech_run += 1
+                if self.speech_run >= self.start_frames:
+                    # Inizio frase: include il pre-roll, che contiene anche i frame di attacco
+                    self.in_speech = True
+                    self.silence_run = 0
+                    audio = self.pre_roll.read()
+                    self.pre_roll.clear()
+                    self.speech.write(audio)
+                    self.speech_start = frame_start + len(frame) / self.sample_rate - len(audio) / self.sample_rate
+            else:
+                self.speech_run = 0
+                # Il rumore di fondo si stima solo sui frame di silenzio
+                if self.noise_db is None:
+                    self.noise_db = frame_db
+                else:
+                    self.noise_db = 0.95 * self.noise_db + 0.05 * frame_db
+            return None
+
+        if len(self.speech) + len(frame) > self.speech.capacity:
+            # Frase troppo lunga: la si emette e si continua con una nuova
+            segment = self._emit()
+            self.speech_start = frame_start
+            self.speech.write(frame)
+            return segment
+
+        self.speech.write(frame)
+        self.silence_run = 0 if is_speech else self.silence_run + 1
+        if self.silence_run >= self.hangover_frames:
+            self.in_speech = False
+            self.speech_run = 0
+            return self._emit()
+        return None
+
+    def process(self, samples):
+        """
+        Analizza un blocco di campioni float32.
+
+        Returns:
+            list: Frasi (SpeechSegment) concluse in questo blocco
+        """
+        samples = np.concatenate((self.pending, np.asarray(samples, dtype=np.float32)))
+        segments = []
+        num_frames = len(samples) // self.frame_size
+        for i in range(num_frames):
+            segment = self._process_frame(samples[i * self.frame_size:(i + 1) * self.frame_size])
+            if segment is not None:
+                segments.append(segment)
+        self.pending = samples[num_frames * self.frame_size:]
+        return segments
+
+    def flush(self):
+        """Chiude lo stream, restituendo l'eventuale frase ancora in corso"""
+        segments = []
+        if self.in_speech:
+            if len(self.pending):
+                self.speech.write(self.pending)
+            segment = self._emit()
+            if segment is not None:
+                segments.append(segment)
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.in_speech = False
+        self.speech_run = 0
+        self.pre_roll.clear()
+        return segments
+
+
+def stream_utterances(blocks, vad=None):
+    """
+    Restituisce le frasi man mano che vengono concluse.
+
+    Args:
+        blocks (iterable): Blocchi di campioni float32 a vad.sample_rate
+        vad (EnergyVAD, optional): Rilevatore da usare (default: parametri standard a 16 kHz)
+
+    Yields:
+        SpeechSegment: Frasi rilevate, in ordine
+    """
+    vad = vad or EnergyVAD()
+    for block in blocks:
+        yield from vad.process(block)
+    yield from vad.flush()
+
+
+def wav_blocks(wav_file, block_size=1024, sample_rate=VAD_SAMPLE_RATE):
+    """
+    Legge un file WAV PCM a 16 bit come blocchi float32 mono alla frequenza richiesta,
+    simulando lo stream del microfono (utile per i test).
+    """
+    with wave.open(wav_file, 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{wav_file}: sono supportati solo WAV PCM a 16 bit")
+        channels = wf.getnchannels()
+        file_rate = wf.getframerate()
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+
+    audio = samples.reshape(-1, channels).mean(axis=1).astype(np.float32) / 32768.0
+    if file_rate != sample_rate:
+        from math import gcd
+        from scipy.signal import resample_poly
+
+        divisor = gcd(sample_rate, file_rate)
+        audio = resample_poly(audio, sample_rate // divisor, file_rate // divisor).astype(np.float32)
+
+    for start in range(0, len(audio), block_size):
+        yield audio[start:start + block_size]
+
+
+def write_wav(output_file, audio, sample_rate=VAD_SAMPLE_RATE):
+    """Salva campioni float32 come WAV PCM mono a 16 bit"""
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    with wave.open(output_file, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.tobytes())
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Generazione del lipsync in batch per molte clip (ad esempio le risposte predefinite).
+
+Ogni clip viene decodificata e analizzata da Rhubarb in un pool di processi
+grande quanto il numero di core: ffmpeg e Rhubarb usano un solo core per
+clip, quindi le clip vengono elaborate in parallelo. Ogni clip è isolata: un
+errore o un timeout su una clip viene registrato e le altre proseguono.
+
+Il batch è ripetibile: gli output già presenti vengono saltati (sono scritti
+con una rinomina atomica, quindi un file presente è sempre completo), così un
+job interrotto riprende da dove si era fermato. Con --cache_dir i risultati
+vengono anche letti e salvati nella cache di lipsync_cache.py.
+
+Le clip si indicano con una directory (con l'eventuale dialogo in un .txt
+accanto alla clip) oppure con un manifest JSONL, una clip per riga:
+    {"audio": "clips/saluto.mp3", "dialog": "Ciao, come stai?", "name": "saluto"}
+("dialog" e "name" sono facoltativi).
+
+Uso:
+    python batch_lipsync.py clips_dir --output_dir lipsync_out [--format json] [--workers 8] [--rhubarb_path path]
+    python batch_lipsync.py --manifest clips.jsonl --output_dir lipsync_out [--cache_dir lipsync_cache]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from lipsync_cache import AUDIO_EXTENSIONS, LipSyncCache, lipsync_key, parse_mouth_cues, write_mouth_cues
+from rhubarb_audio import memory_temp_dir, prepare_wav
+from test_rhubarb_with_phonetic import run_rhubarb_with_phonetic
+
+
+def clips_from_directory(clips_dir):
+    """Clip audio di una directory, con il dialogo letto dal .txt con lo stesso nome se presente"""
+    clips = []
+    for name in sorted(os.listdir(clips_dir)):
+        if not name.lower().endswith(AUDIO_EXTENSIONS):
+            continue
+        audio = os.path.join(clips_dir, name)
+        dialog_file = os.path.splitext(audio)[0] + ".txt"
+        dialog = None
+        if os.path.isfile(dialog_file):
+            with open(dialog_file, 'r', encoding='utf-8') as f:
+                dialog = f.read()
+        clips.append({"audio": audio, "dialog": dialog, "name": os.path.splitext(name)[0]})
+    return clips
+
+
+def clips_from_manifest(manifest_file):
+    """Clip elencate in un manifest JSONL; i percorsi relativi sono relativi al manifest"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    clips = []
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "audio" not in item:
+                raise ValueError(f"Riga {line_number} di {manifest_file}: manca il campo 'audio'")
+            audio = os.path.join(base_dir, item["audio"])
+            name = item.get("name") or os.path.splitext(os.path.basename(audio))[0]
+            clips.append({"audio": audio, "dialog": item.get("dialog"), "name": name})
+    return clips
+
+
+def process_clip(clip, output_file, output_format, rhubarb_path, recognizer="phonetic", extended_shapes="GHX",
+                 timeout=None):
+    """
+    Decodifica una clip ed esegue Rhubarb (nel processo del pool).
+
+    Returns:
+        dict: Esito della clip: {"name", "status", "error", "elapsed", "duration", "cues"}, con
+        i mouthCues nel formato di parse_mouth_cues() in "result" se la clip è riuscita
+    """
+    start_time = time.time()
+    report = {"name": clip["name"], "audio": clip["audio"], "status": "failed", "error": None,
+              "elapsed": 0.0, "duration": None, "cues": 0}
+    try:
+        with memory_temp_dir() as temp_dir:
+            wav_file = prepare_wav(clip["audio"], temp_dir)
+            dialog_file = None
+            if clip.get("dialog"):
+                dialog_file = os.path.join(temp_dir, "dialog.txt")
+                with open(dialog_file, 'w', encoding='utf-8') as f:
+                    f.write(clip["dialog"])
+
+            # Rhubarb scrive su un file temporaneo accanto all'output, rinominato solo a lavoro concluso.
+            # L'analisi è sempre in JSON (il TSV non ha fine dei cue né durata): gli altri formati
+            # vengono scritti dal risultato letto
+            partial_file = f"{output_file}.part"
+            if not run_rhubarb_with_phonetic(wav_file, partial_file, "json", rhubarb_path, dialog_file,
+                                             recognizer=recognizer, extended_shapes=extended_shapes,
+                                             verbose=False, timeout=timeout):
+                raise RuntimeError("Rhubarb fallito")
+            result = parse_mouth_cues(partial_file, "json")
+            if output_format != "json":
+                write_mouth_cues(result, partial_file, output_format, sound_file=clip["audio"])
+            os.replace(partial_file, output_file)
+    except Exception as e:
+        report["error"] = str(e) or type(e).__name__
+        if os.path.exists(f"{output_file}.part"):
+            os.unlink(f"{output_file}.part")
+    else:
+        report.update(status="analyzed", result=result, cues=len(result["mouthCues"]),
+                      duration=result["metadata"].get("duration"))
+    report["elapsed"] = time.time() - start_time
+    return report
+
+
+def run_batch(clips, output_dir, output_format="json", rhubarb_path="./bin/rhubarb/rhubarb", workers=None,
+              recognizer="phonetic", extended_shapes="GHX", cache=None, force=False, timeout=None,
+              report_file=None):
+    """
+    Genera il lipsync di tutte le clip in parallelo.
+
+    Args:
+        clips (list): Clip {"audio", "dialog", "name"} da clips_from_directory() o clips_from_manifest()
+        output_dir (str): Directory degli output ({name}.{output_format})
+        workers (int, optional): Processi in parallelo (default: numero di core)
+        cache (LipSyncCache, optional): Cache dei risultati di Rhubarb
+        force (bool): Se True rigenera anche gli output già presenti
+        timeout (float, optional): Tempo massimo di Rhubarb per clip in secondi
+        report_file (str, optional): File JSONL in cui aggiungere l'esito di ogni clip
+
+    Returns:
+        dict: Riepilogo con conteggi, tempo totale e throughput
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    start_time = time.time()
+    summary = {"clips": len(clips), "skipped": 0, "cached": 0, "analyzed": 0, "failed": 0,
+               "audio_seconds": 0.0, "clip_times": []}
+
+    report = open(report_file, 'a', encoding='utf-8') if report_file else None
+
+    def record(entry):
+        summary[entry["status"]] += 1
+        if entry["status"] == "analyzed":
+            summary["clip_times"].append(entry["elapsed"])
+            summary["audio_seconds"] += entry.get("duration") or 0.0
+        if entry["status"] == "failed":
+            print(f"Errore su {entry['name']}: {entry['error']}")
+        if report:
+            report.write(json.dumps({key: value for key, value in entry.items() if key != "result"},
+                                    ensure_ascii=False) + "\n")
+            report.flush()
+
+    try:
+        pending = []
+        for clip in clips:
+            output_file = os.path.join(output_dir, f"{clip['name']}.{output_format}")
+            if not force and os.path.isfile(output_file):
+                record({"name": clip["name"], "audio": clip["audio"], "status": "skipped"})
+                continue
+            if not os.path.isfile(clip["audio"]):
+                record({"name": clip["name"], "audio": clip["audio"], "status": "failed",
+                        "error": "file audio non trovato"})
+                continue
+
+            key = None
+            if cache:
+                key = lipsync_key(clip["audio"], recognizer, clip.get("dialog"), extended_shapes)
+                cached = cache.get(key)
+                if cached:
+                    write_mouth_cues(cached, output_file, output_format, sound_file=clip["audio"])
+                    record({"name": clip["name"], "audio": clip["audio"], "status": "cached"})
+                    continue
+            pending.append((clip, output_file, key))
+
+        print(f"{len(clips)} clip: {summary['skipped']} già presenti, {summary['cached']} dalla cache, "
+              f"{len(pending)} da analizzare con {workers} processi")
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(process_clip, clip, output_file, output_format, rhubarb_path, recognizer,
+                                extended_shapes, timeout): (clip, key)
+                for clip, output_file, key in pending
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                clip, key = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    # Il processo del pool è terminato in modo anomalo: si registra solo questa clip
+                    entry = {"name": clip["name"], "audio": clip["audio"], "status": "failed",
+                             "error": f"processo terminato: {e}"}
+                if cache and key and entry["status"] == "analyzed":
+                    cache.put(key, entry["result"])
+                record(entry)
+                if done % 50 == 0 or done == len(futures):
+                    elapsed = time.time() - start_time
+                    print(f"  {done}/{len(futures)} clip elaborate ({done / elapsed:.1f} clip/s)")
+    finally:
+        if report:
+            report.close()
+
+    elapsed = time.time() - start_time
+    clip_times = sorted(summary.pop("clip_times"))
+    summary.update({
+        "workers": workers,
+        "elapsed": elapsed,
+        "clips_per_second": summary["analyzed"] / elapsed if elapsed else 0.0,
+        # Secondi di audio analizzati per secondo di elaborazione, su tutti i processi
+        "audio_seconds_per_second": summary["audio_seconds"] / elapsed if elapsed else 0.0,
+        "clip_time_p50": clip_times[len(clip_times) // 2] if clip_times else None,
+        "clip_time_max": clip_times[-1] if clip_times else None
+    })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera il lipsync di molte clip in parallelo con Rhubarb")
+    parser.add_argument("clips_dir", nargs="?", help="Directory con le clip audio (MP3/WAV/OGG)")
+    parser.add_argument("--manifest", help="Manifest JSONL delle clip, al posto della directory")
+    parser.add_argument("--output_dir", default="lipsync_output", help="Directory degli output (default: lipsync_output)")
+    parser.add_argument("--format", choices=["json", "xml", "tsv"], default="json", help="Formato di output (default: json)")
+    parser.add_argument("--rhubarb_path", default="./bin/rhubarb/rhubarb", help="Percorso all'eseguibile di Rhubarb")
+    parser.add_argument("--recognizer", choices=["phonetic", "pocketSphinx"], default="phonetic",
+                        help="Riconoscitore di Rhubarb (default: phonetic)")
+    parser.add_argument("--extended_shapes", default="GHX", help="Forme labiali estese da utilizzare (default: GHX)")
+    parser.add_argument("--workers", type=int, help="Processi in parallelo (default: numero di core)")
+    parser.add_argument("--timeout", type=float, help="Tempo massimo di Rhubarb per clip in secondi")
+    parser.add_argument("--cache_dir", help="Directory della cache dei risultati di Rhubarb (opzionale)")
+    parser.add_argument("--force", action="store_true", help="Rigenera anche gli output già presenti")
+    parser.add_argument("--report", help="File JSONL con l'esito di ogni clip (default: batch_report.jsonl in --output_dir)")
+
+    args = parser.parse_args()
+
+    if args.manifest:
+        if not os.path.isfile(args.manifest):
+            print(f"Manifest non trovato: {args.manifest}")
+            sys.exit(1)
+        clips = clips_from_manifest(args.manifest)
+    elif args.clips_dir:
+        if not os.path.isdir(args.clips_dir):
+            print(f"Directory delle clip non trovata: {args.clips_dir}")
+            sys.exit(1)
+        clips = clips_from_directory(args.clips_dir)
+    else:
+        parser.error("specificare la directory delle clip oppure --manifest")
+
+    if not os.path.isfile(args.rhubarb_path):
+        print(f"Eseguibile Rhubarb non trovato in: {args.rhubarb_path}")
+        sys.exit(1)
+
+    names = [clip["name"] for clip in clips]
+    if len(set(names)) != len(names):
+        print("Nomi di output duplicati nel batch: usa il campo 'name' del manifest per distinguerli")
+        sys.exit(1)
+
+    cache = LipSyncCache(args.cache_dir) if args.cache_dir else None
+    report_file = args.report or os.path.join(args.output_dir, "batch_report.jsonl")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    summary = run_batch(clips, args.output_dir, args.format, args.rhubarb_path, args.workers, args.recognizer,
+                        args.extended_shapes, cache, args.force, args.timeout, report_file)
+
+    print(f"\nClip: {summary['clips']}")
+    print(f"  già presenti: {summary['skipped']}, dalla cache: {summary['cached']}, "
+          f"analizzate: {summary['analyzed']}, fallite: {summary['failed']}")
+    print(f"Tempo totale: {summary['elapsed']:.2f} secondi con {summary['workers']} processi")
+    print(f"Throughput: {summary['clips_per_second']:.2f} clip/s, "
+          f"{summary['audio_seconds_per_second']:.1f} secondi di audio al secondo")
+    if summary["clip_time_p50"] is not None:
+        print(f"Tempo per clip: mediana {summary['clip_time_p50']:.2f} s, massimo {summary['clip_time_max']:.2f} s")
+    print(f"Esito per clip in: {report_file}")
+
+    sys.exit(0 if summary["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Confronto tra il JSON di Rhubarb e il formato binario .lsb: dimensione e tempo di lettura.
+
+Per ogni output di Rhubarb vengono misurati i byte del JSON (come scritto da
+Rhubarb), dell'XML e del file .lsb, e il tempo per ottenere i mouthCues dal
+JSON (json.loads) e dal binario (decode_mouth_cues e decode_arrays). Senza
+file di input viene generato un insieme sintetico di frasi con cue casuali.
+
+Uso:
+    python bench_lipsync_binary.py [test_output/lipsync_out ...] [--utterances 200] [--seconds 8] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from lipsync_analysis import SHAPES
+from lipsync_binary import decode_arrays, decode_mouth_cues, encode_mouth_cues
+from lipsync_cache import parse_mouth_cues, write_mouth_cues
+
+
+def synthetic_results(utterances, seconds, seed=0):
+    """Genera mouthCues contigui con durate simili a quelle di Rhubarb (50-400 ms)"""
+    rng = np.random.default_rng(seed)
+    results = []
+    for _ in range(utterances):
+        lengths = rng.integers(5, 40, size=int(seconds * 10)) / 100
+        starts = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+        shapes = rng.choice(list(SHAPES), size=len(lengths))
+        cues = [{"start": round(start, 2), "end": round(start + length, 2), "value": str(shape)}
+                for start, length, shape in zip(starts, lengths, shapes)]
+        results.append({"metadata": {"duration": cues[-1]["end"]}, "mouthCues": cues})
+    return results
+
+
+def load_results(paths):
+    """Legge gli output di Rhubarb dai file o dalle directory indicate"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)))
+        else:
+            files.append(path)
+    results = []
+    for file in files:
+        extension = os.path.splitext(file)[1].lstrip(".").lower()
+        if extension in ("json", "tsv", "xml"):
+            results.append(parse_mouth_cues(file, extension))
+    return results
+
+
+def serialized(result, output_format, temp_dir):
+    """Restituisce i byte dell'output nel formato scritto da Rhubarb"""
+    path = os.path.join(temp_dir, f"bench.{output_format}")
+    write_mouth_cues(result, path, output_format)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def time_per_call(function, payloads, repeat):
+    """Tempo mediano in microsecondi per una chiamata di function su ciascun payload"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for payload in payloads:
+            function(payload)
+        timings.append((time.perf_counter() - start) / len(payloads) * 1e6)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dimensione e tempo di lettura: JSON di Rhubarb vs formato binario .lsb")
+    parser.add_argument("inputs", nargs="*", help="Output di Rhubarb (file o directory); default: dati sintetici")
+    parser.add_argument("--utterances", type=int, default=200, help="Frasi sintetiche da generare (default: 200)")
+    parser.add_argument("--seconds", type=float, default=8.0, help="Durata di ogni frase sintetica (default: 8)")
+    parser.add_argument("--repeat", type=int, default=20, help="Ripetizioni delle misure di lettura (default: 20)")
+
+    args = parser.parse_args()
+
+    results = load_results(args.inputs) if args.inputs else synthetic_results(args.utterances, args.seconds)
+    results = [result for result in results if result["mouthCues"]]
+    if not results:
+        print("Nessun output di Rhubarb da confrontare.")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        json_payloads = [serialized(result, "json", temp_dir) for result in results]
+        xml_payloads = [serialized(result, "xml", temp_dir) for result in results]
+    binary_payloads = [encode_mouth_cues(result) for result in results]
+
+    # Il binario deve restituire gli stessi cue del JSON
+    for result, payload in zip(results, binary_payloads):
+        decoded = decode_mouth_cues(payload)["mouthCues"]
+        if [cue["value"] for cue in decoded] != [cue["value"] for cue in result["mouthCues"]]:
+            print("Errore: il formato binario non restituisce le stesse forme labiali")
+            sys.exit(1)
+
+    num_cues = sum(len(result["mouthCues"]) for result in results)
+    sizes = {
+        "json": sum(map(len, json_payloads)),
+        "xml": sum(map(len, xml_payloads)),
+        "lsb": sum(map(len, binary_payloads))
+    }
+    timings = {
+        "json.loads": time_per_call(json.loads, json_payloads, args.repeat),
+        "decode_mouth_cues": time_per_call(decode_mouth_cues, binary_payloads, args.repeat),
+        "decode_arrays": time_per_call(decode_arrays, binary_payloads, args.repeat)
+    }
+
+    print(f"{len(results)} output di Rhubarb, {num_cues} mouth cues ({num_cues / len(results):.0f} per file)\n")
+    print(f"{'formato':<20} {'byte totali':>12} {'byte/cue':>10} {'rapporto':>10}")
+    for name, size in sizes.items():
+        print(f"{name:<20} {size:>12} {size / num_cues:>10.1f} {sizes['json'] / size:>9.1f}x")
+
+    print(f"\n{'lettura':<20} {'us/file':>12} {'rapporto':>10}")
+    for name, elapsed in timings.items():
+        print(f"{name:<20} {elapsed:>12.1f} {timings['json.loads'] / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Lettura degli output di Rhubarb in array NumPy e statistiche vettorizzate.
+
+Gli output json, tsv, xml (e il formato binario .lsb) vengono caricati in una
+struttura a colonne, MouthCueArrays: inizio e fine in secondi e codice della
+forma labiale (indice in "ABCDEFGHX"). Sulle colonne si calcolano senza cicli
+Python la distribuzione delle forme labiali, la distribuzione delle durate, la
+frequenza dei cue e i buchi o le sovrapposizioni tra cue consecutivi. Più file
+si concatenano in un'unica struttura, così le statistiche di un corpus di
+decine di migliaia di output si calcolano con una sola passata.
+
+Uso:
+    python lipsync_analysis.py output_phon.json
+    python lipsync_analysis.py test_output/lipsync_out [altri file o directory] [--workers 8] [--json stats.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Forme labiali di Rhubarb: il codice di una forma è la sua posizione nella stringa
+SHAPES = "ABCDEFGHX"
+SILENCE_CODE = SHAPES.index("X")
+CUE_FORMATS = ("json", "tsv", "xml", "lsb")
+
+# Tabella byte ASCII -> codice della forma (255 per i caratteri non validi)
+_CODE_TABLE = np.full(256, 255, dtype=np.uint8)
+_CODE_TABLE[np.frombuffer(SHAPES.encode("ascii"), dtype=np.uint8)] = np.arange(len(SHAPES), dtype=np.uint8)
+
+
+def shape_codes(shapes):
+    """Converte una lista di forme labiali ("A", "X", ...) nei rispettivi codici uint8"""
+    joined = "".join(shapes)
+    if len(joined) != len(shapes) or not joined.isascii():
+        raise ValueError("Le forme labiali devono essere singole lettere in " + SHAPES)
+    codes = _CODE_TABLE[np.frombuffer(joined.encode("ascii"), dtype=np.uint8)]
+    invalid = np.flatnonzero(codes == 255)
+    if len(invalid):
+        raise ValueError(f"Forma labiale non supportata: {shapes[invalid[0]]}")
+    return codes
+
+
+class MouthCueArrays:
+    def __init__(self, starts, ends, codes, duration=None, file_index=None):
+        """
+        Mouth cues in colonne.
+
+        Args:
+            starts, ends (numpy.ndarray): Inizio e fine dei cue in secondi (float64)
+            codes (numpy.ndarray): Codice della forma labiale di ogni cue (uint8)
+            duration (float, optional): Durata dell'audio (somma delle durate se concatenati)
+            file_index (numpy.ndarray, optional): File di provenienza di ogni cue, per i corpus concatenati
+        """
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.codes = np.asarray(codes, dtype=np.uint8)
+        self.duration = duration
+        self.file_index = file_index
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def durations(self):
+        return self.ends - self.starts
+
+    @property
+    def shapes(self):
+        return np.array(list(SHAPES))[self.codes].tolist()
+
+    @property
+    def total_duration(self):
+        """Durata dell'audio, oppure la fine dell'ultimo cue se non indicata"""
+        if self.duration is not None:
+            return self.duration
+        return float(self.ends[-1]) if len(self) else 0.0
+
+    @classmethod
+    def from_result(cls, result):
+        """Crea le colonne da un risultato nel formato di parse_mouth_cues()"""
+        cues = result["mouthCues"]
+        count = len(cues)
+        return cls(np.fromiter((cue["start"] for cue in cues), dtype=np.float64, count=count),
+                   np.fromiter((cue["end"] for cue in cues), dtype=np.float64, count=count),
+                   shape_codes([cue["value"] for cue in cues]),
+                   result.get("metadata", {}).get("duration"))
+
+    def to_result(self):
+        """Restituisce i cue nel formato di parse_mouth_cues()"""
+        cues = [{"start": start, "end": end, "value": shape}
+                for start, end, shape in zip(self.starts.tolist(), self.ends.tolist(), self.shapes)]
+        return {"metadata": {"duration": self.duration}, "mouthCues": cues}
+
+    @classmethod
+    def concatenate(cls, items):
+        """Unisce i cue di più file in un'unica struttura, ricordando il file di provenienza"""
+        items = list(items)
+        if not items:
+            return cls([], [], [], 0.0, np.zeros(0, dtype=np.int32))
+        return cls(np.concatenate([item.starts for item in items]),
+                   np.concatenate([item.ends for item in items]),
+                   np.concatenate([item.codes for item in items]),
+                   sum(item.total_duration for item in items),
+                   np.repeat(np.arange(len(items), dtype=np.int32), [len(item) for item in items]))
+
+
+def parse_cues(content, output_format):
+    """
+    Legge il contenuto di un output di Rhubarb.
+
+    Args:
+        content (bytes): Contenuto del file
+        output_format (str): "json", "tsv", "xml" oppure "lsb"
+
+    Returns:
+        MouthCueArrays: I cue in colonne
+    """
+    if output_format == "json":
+        data = json.loads(content)
+        result = {"metadata": {"duration": data.get("metadata", {}).get("duration")},
+                  "mouthCues": data.get("mouthCues", [])}
+        return MouthCueArrays.from_result(result)
+
+    if output_format == "tsv":
+        # Righe "inizio<TAB>forma": i token si alternano, le righe vuote spariscono con split()
+        tokens = content.decode("utf-8").split()
+        starts = np.array(tokens[0::2], dtype=np.float64)
+        # Nel TSV la fine di un cue coincide con l'inizio del successivo
+        ends = np.append(starts[1:], starts[-1:])
+        return MouthCueArrays(starts, ends, shape_codes(tokens[1::2]), float(starts[-1]) if len(starts) else None)
+
+    if output_format == "xml":
+        root = ET.fromstring(content)
+        duration = root.findtext("metadata/duration")
+        elements = root.findall("mouthCues/mouthCue")
+        count = len(elements)
+        return MouthCueArrays(np.fromiter((element.get("start") for element in elements), dtype=np.float64, count=count),
+                              np.fromiter((element.get("end") for element in elements), dtype=np.float64, count=count),
+                              shape_codes([element.text.strip() for element in elements]),
+                              float(duration) if duration else None)
+
+    if output_format == "lsb":
+        from lipsync_binary import decode_arrays
+
+        starts_ms, ends_ms, codes, duration_ms = decode_arrays(content)
+        return MouthCueArrays(starts_ms / 1000, ends_ms / 1000, codes, duration_ms / 1000)
+
+    raise ValueError(f"Formato di output non supportato: {output_format}")
+
+
+def load_cues(output_file, output_format=None):
+    """Legge un output di Rhubarb; senza formato lo deduce dall'estensione del file"""
+    output_format = output_format or os.path.splitext(output_file)[1].lstrip(".").lower()
+    with open(output_file, 'rb') as f:
+        return parse_cues(f.read(), output_format)
+
+
+def shape_histogram(cues):
+    """
+    Distribuzione delle forme labiali.
+
+    Returns:
+        dict: {forma: {"count": numero di cue, "seconds": tempo totale, "share": frazione del tempo}}
+    """
+    counts = np.bincount(cues.codes, minlength=len(SHAPES))
+    seconds = np.bincount(cues.codes, weights=cues.durations, minlength=len(SHAPES))
+    total = seconds.sum()
+    return {shape: {"count": int(counts[code]), "seconds": float(seconds[code]),
+                    "share": float(seconds[code] / total) if total else 0.0}
+            for code, shape in enumerate(SHAPES)}
+
+
+def duration_stats(cues, percentiles=(5, 25, 50, 75, 95)):
+    """
+    Distribuzione delle durate dei cue in secondi, complessiva e per forma labiale.
+
+    Returns:
+        dict: {"all": {...}, "A": {...}, ...} con count, mean, min, max e i percentili richiesti
+    """
+    def describe(durations):
+        if not len(durations):
+            return {"count": 0}
+        values = np.percentile(durations, percentiles)
+        stats = {"count": int(len(durations)), "mean": float(durations.mean()),
+                 "min": float(durations.min()), "max": float(durations.max())}
+        stats.update({f"p{p}": float(value) for p, value in zip(percentiles, values)})
+        return stats
+
+    durations = cues.durations
+    # Ordinando per forma, le durate di ogni forma diventano una fetta contigua
+    order = np.argsort(cues.codes, kind="stable")
+    bounds = np.searchsorted(cues.codes[order], np.arange(len(SHAPES) + 1))
+    stats = {"all": describe(durations)}
+    for code, shape in enumerate(SHAPES):
+        stats[shape] = describe(durations[order[bounds[code]:bounds[code + 1]]])
+    return stats
+
+
+def duration_histogram(cues, bin_seconds=0.02, max_seconds=0.5):
+    """
+    Istogramma delle durate dei cue; l'ultimo intervallo raccoglie i cue più lunghi di max_seconds.
+
+    Returns:
+        tuple: (bordi degli intervalli in secondi, numero di cue per intervallo)
+    """
+    edges = np.arange(0.0, max_seconds + bin_seconds / 2, bin_seconds)
+    counts, _ = np.histogram(np.minimum(cues.durations, max_seconds - 1e-9), bins=edges)
+    return edges, counts
+
+
+def cue_rate(cues):
+    """
+    Frequenza dei cue: complessiva e limitata al parlato (esclusi i silenzi X).
+
+    Returns:
+        dict: {"cues_per_second", "speech_cues_per_second", "speech_seconds"}
+    """
+    speech = cues.codes != SILENCE_CODE
+    speech_seconds = float(cues.durations[speech].sum())
+    total = cues.total_duration
+    return {
+        "cues_per_second": len(cues) / total if total else 0.0,
+        "speech_cues_per_second": int(speech.sum()) / speech_seconds if speech_seconds else 0.0,
+        "speech_seconds": speech_seconds
+    }
+
+
+def find_gaps(cues, tolerance=0.005):
+    """
+    Trova i buchi e le sovrapposizioni tra cue consecutivi dello stesso file.
+
+    Args:
+        tolerance (float): Differenza in secondi sotto cui due cue sono considerati contigui
+
+    Returns:
+        dict: Array "index" (cue che precede il buco), "start", "end" e "size"
+            (negativa per le sovrapposizioni)
+    """
+    sizes = cues.starts[1:] - cues.ends[:-1]
+    mask = np.abs(sizes) > tolerance
+    if cues.file_index is not None:
+        mask &= cues.file_index[1:] == cues.file_index[:-1]
+    index = np.flatnonzero(mask)
+    return {"index": index, "start": cues.ends[index], "end": cues.starts[index + 1], "size": sizes[index]}
+
+
+def summarize(cues, short_threshold=0.06):
+    """Raccoglie tutte le statistiche di un file o di un corpus in un dizionario serializzabile in JSON"""
+    gaps = find_gaps(cues)
+    edges, counts = duration_histogram(cues)
+    return {
+        "cues": len(cues),
+        "duration": cues.total_duration,
+        "shapes": shape_histogram(cues),
+        "durations": duration_stats(cues),
+        "duration_histogram": {"edges": edges.round(3).tolist(), "counts": counts.tolist()},
+        "rate": cue_rate(cues),
+        "short_cues": int((cues.durations < short_threshold).sum()),
+        "gaps": int((gaps["size"] > 0).sum()),
+        "overlaps": int((gaps["size"] < 0).sum())
+    }
+
+
+def print_summary(cues, title):
+    """Stampa un riepilogo leggibile delle statistiche"""
+    summary = summarize(cues)
+    durations = summary["durations"]["all"]
+    print(f"\n{title}:")
+    print(f"  - Durata totale: {summary['duration']:.2f} secondi")
+    print(f"  - Numero di mouth cues: {summary['cues']}")
+    print(f"  - Cue al secondo: {summary['rate']['cues_per_second']:.1f} "
+          f"({summary['rate']['speech_cues_per_second']:.1f} nel parlato)")
+    if durations["count"]:
+        print(f"  - Durata dei cue: media {durations['mean'] * 1000:.0f} ms, mediana {durations['p50'] * 1000:.0f} ms, "
+              f"p5 {durations['p5'] * 1000:.0f} ms, p95 {durations['p95'] * 1000:.0f} ms")
+    print(f"  - Cue più brevi di 60 ms: {summary['short_cues']}")
+    print(f"  - Buchi tra cue: {summary['gaps']}, sovrapposizioni: {summary['overlaps']}")
+    print(f"  - Distribuzione delle forme labiali:")
+    for shape, stats in summary["shapes"].items():
+        if stats["count"]:
+            print(f"    {shape}: {stats['count']} occorrenze, {stats['share'] * 100:.1f}% del tempo")
+    return summary
+
+
+def analyze_output(output_file, output_format):
+    """Analizza e mostra un riepilogo dell'output generato da Rhubarb"""
+    try:
+        cues = load_cues(output_file, output_format)
+        print_summary(cues, f"Analisi dell'output {output_format.upper()}")
+        print(f"  - Esempio dei primi 5 mouth cues:")
+        for i, cue in enumerate(cues.to_result()["mouthCues"][:5]):
+            print(f"    {i+1}. Da {cue['start']:.2f} a {cue['end']:.2f}: {cue['value']}")
+        return True
+    except Exception as e:
+        print(f"Errore durante l'analisi dell'output: {e}")
+        return False
+
+
+def find_output_files(paths):
+    """Espande file e directory nella lista degli output di Rhubarb da analizzare"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if os.path.splitext(name)[1].lstrip(".").lower() in CUE_FORMATS)
+        else:
+            files.append(path)
+    return files
+
+
+def load_corpus(files, workers=1):
+    """Legge più output di Rhubarb (in parallelo con workers > 1) e li concatena"""
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            items = list(executor.map(load_cues, files, chunksize=max(1, len(files) // (workers * 8))))
+    else:
+        items = [load_cues(file) for file in files]
+    return MouthCueArrays.concatenate(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Statistiche sugli output di Rhubarb (json, tsv, xml, lsb)")
+    parser.add_argument("inputs", nargs="+", help="File di output di Rhubarb o directory da analizzare")
+    parser.add_argument("--workers", type=int, default=1, help="Processi per la lettura dei file (default: 1)")
+    parser.add_argument("--json", help="Salva le statistiche complete in un file JSON")
+
+    args = parser.parse_args()
+
+    files = find_output_files(args.inputs)
+    if not files:
+        print("Nessun output di Rhubarb trovato.")
+        sys.exit(1)
+
+    start_time = time.time()
+    try:
+        cues = load_corpus(files, args.workers)
+    except (OSError, ValueError, ET.ParseError) as e:
+        print(f"Errore durante la lettura degli output: {e}")
+        sys.exit(1)
+    load_time = time.time() - start_time
+
+    summary = print_summary(cues, f"Statistiche di {len(files)} file")
+    print(f"\nLettura di {len(cues)} mouth cues in {load_time:.2f} secondi")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(dict(summary, files=len(files)), f, indent=2)
+        print(f"Statistiche salvate in: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Formato binario compatto per i mouthCues da inviare a Unity (.lsb).
+
+Il JSON e l'XML di Rhubarb ripetono nomi di campo e tempi in virgola mobile
+per ogni cue; qui ogni cue occupa 3 byte. Struttura del file (little endian):
+
+    header   magic "RLSB", versione (uint8), flag (uint8),
+             numero di cue (uint32), durata in millisecondi (uint32)
+    starts   uint16[n]  inizio di ogni cue in ms, come differenza dal precedente
+    shapes   uint8[n]   forma labiale come indice in "ABCDEFGHX"
+    lengths  uint16[n]  durata di ogni cue in ms, solo senza il flag CONTIGUOUS
+
+Con il flag CONTIGUOUS (il caso normale di Rhubarb) la fine di ogni cue
+coincide con l'inizio del successivo e l'ultimo termina alla durata totale,
+quindi le durate non vengono salvate. I tempi di Rhubarb hanno due decimali:
+la conversione in millisecondi non perde precisione.
+
+Uso:
+    python lipsync_binary.py output_phon.json [--output output_phon.lsb]
+    python lipsync_binary.py output_phon.lsb --decode --format json [--output output_phon_decoded.json]
+"""
+
+import argparse
+import os
+import struct
+import sys
+
+import numpy as np
+
+from lipsync_analysis import MouthCueArrays
+from lipsync_cache import atomic_write, parse_mouth_cues, write_mouth_cues
+
+MAGIC = b"RLSB"
+VERSION = 1
+HEADER = struct.Struct("<4sBBII")
+
+# Flag dell'header
+FLAG_CONTIGUOUS = 0x01
+
+MAX_DELTA_MS = np.iinfo(np.uint16).max
+
+
+def encode_mouth_cues(result):
+    """
+    Codifica i mouthCues nel formato binario.
+
+    Args:
+        result (dict): Risultato nel formato di parse_mouth_cues()
+
+    Returns:
+        bytes: Contenuto del file .lsb
+    """
+    cues = MouthCueArrays.from_result(result)
+    starts = np.rint(cues.starts * 1000).astype(np.int64)
+    ends = np.rint(cues.ends * 1000).astype(np.int64)
+    duration_ms = int(round(cues.total_duration * 1000))
+
+    deltas = np.diff(starts, prepend=0)
+    lengths = ends - starts
+    if len(cues) and (deltas.min() < 0 or lengths.min() < 0):
+        raise ValueError("I mouthCues devono essere ordinati e con fine non precedente all'inizio")
+    if len(cues) and max(deltas.max(), lengths.max()) > MAX_DELTA_MS:
+        raise ValueError(f"Intervallo tra due cue oltre {MAX_DELTA_MS} ms, non rappresentabile")
+
+    contiguous = bool(np.array_equal(ends[:-1], starts[1:]) and (not len(ends) or ends[-1] == duration_ms))
+    flags = FLAG_CONTIGUOUS if contiguous else 0
+
+    parts = [HEADER.pack(MAGIC, VERSION, flags, len(cues), duration_ms),
+             deltas.astype("<u2").tobytes(), cues.codes.tobytes()]
+    if not contiguous:
+        parts.append(lengths.astype("<u2").tobytes())
+    return b"".join(parts)
+
+
+def decode_arrays(data):
+    """
+    Decodifica il formato binario in array, senza creare un dizionario per cue.
+
+    Returns:
+        tuple: (starts_ms, ends_ms, codes, duration_ms), con starts_ms/ends_ms int64 e codes uint8
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("File lipsync binario troncato")
+    magic, version, flags, count, duration_ms = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Il file non è un lipsync binario (magic non valido)")
+    if version != VERSION:
+        raise ValueError(f"Versione del formato non supportata: {version}")
+
+    expected = HEADER.size + 3 * count + (0 if flags & FLAG_CONTIGUOUS else 2 * count)
+    if len(data) < expected:
+        raise ValueError("File lipsync binario troncato")
+
+    offset = HEADER.size
+    starts = np.cumsum(np.frombuffer(data, dtype="<u2", count=count, offset=offset), dtype=np.int64)
+    offset += 2 * count
+    codes = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset)
+    offset += count
+    if flags & FLAG_CONTIGUOUS:
+        ends = np.append(starts[1:], duration_ms) if count else starts.copy()
+    else:
+        ends = starts + np.frombuffer(data, dtype="<u2", count=count, offset=offset)
+    return starts, ends, codes, duration_ms
+
+
+def decode_mouth_cues(data):
+    """
+    Decodifica il formato binario nei mouthCues.
+
+    Returns:
+        dict: Risultato nel formato di parse_mouth_cues()
+    """
+    starts, ends, codes, duration_ms = decode_arrays(data)
+    return MouthCueArrays(starts / 1000, ends / 1000, codes, duration_ms / 1000).to_result()
+
+
+def read_binary(path):
+    """Legge un file .lsb e restituisce i mouthCues"""
+    with open(path, 'rb') as f:
+        return decode_mouth_cues(f.read())
+
+
+def convert_file(input_file, output_file=None, input_format=None):
+    """
+    Converte un output di Rhubarb (json, tsv, xml) nel formato binario.
+
+    Args:
+        input_file (str): File prodotto da Rhubarb
+        output_file (str, optional): File .lsb di destinazione (default: stesso nome con estensione .lsb)
+        input_format (str, optional): Formato del file (default: dedotto dall'estensione)
+
+    Returns:
+        str: Percorso del file scritto
+    """
+    base, extension = os.path.splitext(input_file)
+    input_format = input_format or extension.lstrip(".").lower()
+    output_file = output_file or f"{base}.lsb"
+    atomic_write(output_file, encode_mouth_cues(parse_mouth_cues(input_file, input_format)))
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversione dei mouthCues di Rhubarb nel formato binario compatto")
+    parser.add_argument("input_file", help="Output di Rhubarb (json, tsv, xml) oppure file .lsb con --decode")
+    parser.add_argument("--output", help="File di destinazione (default: stesso nome con la nuova estensione)")
+    parser.add_argument("--input_format", choices=["json", "xml", "tsv"],
+                        help="Formato del file di input (default: dedotto dall'estensione)")
+    parser.add_argument("--decode", action="store_true", help="Converte un file .lsb in uno dei formati di Rhubarb")
+    parser.add_argument("--format", choices=["json", "xml", "tsv"], default="json",
+                        help="Formato di output con --decode (default: json)")
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.input_file):
+        print(f"File di input non trovato: {args.input_file}")
+        sys.exit(1)
+
+    try:
+        if args.decode:
+            output_file = args.output or f"{os.path.splitext(args.input_file)[0]}_decoded.{args.format}"
+            write_mouth_cues(read_binary(args.input_file), output_file, args.format)
+        else:
+            output_file = convert_file(args.input_file, args.output, args.input_format)
+    except ValueError as e:
+        print(f"Errore nella conversione: {e}")
+        sys.exit(1)
+
+    print(f"{os.path.getsize(args.input_file)} byte -> {os.path.getsize(output_file)} byte. "
+          f"Output salvato in: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
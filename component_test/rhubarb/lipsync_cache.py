@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Cache dei risultati di Rhubarb Lip Sync.
+
+La chiave è l'hash SHA-256 del contenuto audio combinato con riconoscitore,
+testo del dialogo e forme labiali estese: lo stesso audio analizzato con le
+stesse opzioni non richiede una nuova esecuzione di Rhubarb. Ogni voce salva i
+mouthCues già analizzati in JSON, da cui è possibile rigenerare l'output in
+qualsiasi formato (json, tsv, xml). Oltre il numero massimo di voci vengono
+eliminate quelle usate meno di recente.
+
+Uso (pre-riscaldamento da una directory di clip):
+    python lipsync_cache.py clips_dir --cache_dir lipsync_cache [--recognizer phonetic] [--rhubarb_path path]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from xml.sax.saxutils import escape
+
+from lipsync_analysis import load_cues
+
+# Rende importabili i moduli condivisi in component_test/common
+COMMON_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from disk_cache import DiskCache, atomic_write
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg")
+
+
+def file_hash(path, block_size=1024 * 1024):
+    """Calcola l'hash SHA-256 del contenuto di un file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def lipsync_key(audio_file, recognizer, dialog_text=None, extended_shapes="GHX", segment_length=None):
+    """
+    Calcola la chiave della cache per un file audio e le opzioni di Rhubarb.
+
+    Con segment_length (analisi in segmenti, vedi rhubarb_segments) la chiave è
+    distinta da quella dell'analisi del file intero, che produce cue diversi.
+    """
+    options = {
+        "audio": file_hash(audio_file),
+        "recognizer": recognizer,
+        "dialog": dialog_text or "",
+        "extended_shapes": extended_shapes
+    }
+    if segment_length:
+        options["segment_length"] = float(segment_length)
+    payload = json.dumps(options, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_mouth_cues(output_file, output_format):
+    """
+    Legge un output di Rhubarb e restituisce i mouthCues in formato uniforme.
+
+    Returns:
+        dict: {"metadata": {"duration": float o None}, "mouthCues": [{"start", "end", "value"}]}
+    """
+    return load_cues(output_file, output_format).to_result()
+
+
+def write_mouth_cues(result, output_file, output_format, sound_file=""):
+    """
+    Scrive i mouthCues nello stesso formato prodotto da Rhubarb. La scrittura è
+    atomica: un file di output presente è sempre completo.
+    """
+    cues = result["mouthCues"]
+    duration = result.get("metadata", {}).get("duration")
+    if duration is None:
+        duration = cues[-1]["end"] if cues else 0.0
+
+    if output_format == "json":
+        content = json.dumps({
+            "metadata": {"soundFile": sound_file, "duration": duration},
+            "mouthCues": cues
+        }, indent=2)
+    elif output_format == "tsv":
+        content = "".join(f"{cue['start']:.2f}\t{cue['value']}\n" for cue in cues)
+    elif output_format == "xml":
+        lines = ['<?xml version="1.0" encoding="utf-8"?>\n<rhubarbResult>\n  <metadata>\n',
+                 f'    <soundFile>{escape(sound_file)}</soundFile>\n',
+                 f'    <duration>{duration:.2f}</duration>\n  </metadata>\n  <mouthCues>\n']
+        lines += [f'    <mouthCue start="{cue["start"]:.2f}" end="{cue["end"]:.2f}">{cue["value"]}</mouthCue>\n'
+                  for cue in cues]
+        lines.append('  </mouthCues>\n</rhubarbResult>\n')
+        content = "".join(lines)
+    else:
+        raise ValueError(f"Formato di output non supportato: {output_format}")
+
+    atomic_write(output_file, content.encode("utf-8"))
+
+
+class LipSyncCache(DiskCache):
+    required_suffix = ".json"
+
+    def __init__(self, cache_dir, max_entries=10000):
+        """
+        Args:
+            cache_dir (str): Directory in cui salvare le voci della cache
+            max_entries (int): Numero massimo di voci conservate
+        """
+        super().__init__(cache_dir, max_entries=max_entries)
+
+    def get(self, key):
+        """Restituisce i mouthCues salvati per la chiave, oppure None"""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key, ".json"), 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._touch(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        """Salva i mouthCues (nel formato di parse_mouth_cues) per la chiave"""
+        with self._lock:
+            self._store(key, {".json": json.dumps(result).encode("utf-8")})
+
+    def prewarm(self, clips_dir, rhubarb_path, recognizer="phonetic", extended_shapes="GHX"):
+        """
+        Analizza con Rhubarb tutte le clip di una directory non ancora presenti in cache.
+        Se accanto alla clip esiste un file .txt con lo stesso nome, viene usato come dialogo.
+
+        Returns:
+            dict: Numero di clip già in cache, analizzate e fallite
+        """
+        from rhubarb_audio import memory_temp_dir, prepare_wav
+        from test_rhubarb_with_phonetic import run_rhubarb_with_phonetic
+
+        summary = {"cached": 0, "analyzed": 0, "failed": 0}
+        clips = sorted(name for name in os.listdir(clips_dir) if name.lower().endswith(AUDIO_EXTENSIONS))
+
+        for name in clips:
+            clip_path = os.path.join(clips_dir, name)
+            dialog_file = os.path.splitext(clip_path)[0] + ".txt"
+            dialog_file = dialog_file if os.path.isfile(dialog_file) else None
+            dialog_text = None
+            if dialog_file:
+                with open(dialog_file, 'r', encoding='utf-8') as f:
+                    dialog_text = f.read()
+
+            key = lipsync_key(clip_path, recognizer, dialog_text, extended_shapes)
+            if key in self:
+                summary["cached"] += 1
+                continue
+
+            with memory_temp_dir() as temp_dir:
+                output_file = os.path.join(temp_dir, "output.json")
+                try:
+                    wav_file = prepare_wav(clip_path, temp_dir)
+                except subprocess.CalledProcessError as e:
+                    # Clip non decodificabile: si passa alla successiva
+                    print(f"Errore durante la conversione di {name}: {e.stderr.decode(errors='replace').strip()}")
+                    summary["failed"] += 1
+                    continue
+                except FileNotFoundError:
+                    print("ffmpeg non trovato. Assicurati che ffmpeg sia installato e disponibile nel PATH.")
+                    summary["failed"] += 1
+                    continue
+
+                if run_rhubarb_with_phonetic(wav_file, output_file, "json", rhubarb_path, dialog_file,
+                                             recognizer=recognizer, extended_shapes=extended_shapes):
+                    self.put(key, parse_mouth_cues(output_file, "json"))
+                    summary["analyzed"] += 1
+                else:
+                    summary["failed"] += 1
+
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-riscalda la cache di Rhubarb a partire da una directory di clip audio")
+    parser.add_argument("clips_dir", help="Directory con le clip audio (MP3/WAV/OGG)")
+    parser.add_argument("--cache_dir", default="lipsync_cache", help="Directory della cache (default: lipsync_cache)")
+    parser.add_argument("--recognizer", choices=["phonetic", "pocketSphinx"], default="phonetic",
+                        help="Riconoscitore di Rhubarb (default: phonetic)")
+    parser.add_argument("--extended_shapes", default="GHX", help="Forme labiali estese da utilizzare (default: GHX)")
+    parser.add_argument("--rhubarb_path", default="./bin/rhubarb/rhubarb", help="Percorso all'eseguibile di Rhubarb")
+    parser.add_argument("--max_entries", type=int, default=10000, help="Numero massimo di voci in cache (default: 10000)")
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.clips_dir):
+        print(f"Directory delle clip non trovata: {args.clips_dir}")
+        sys.exit(1)
+
+    cache = LipSyncCache(args.cache_dir, args.max_entries)
+    summary = cache.prewarm(args.clips_dir, args.rhubarb_path, args.recognizer, args.extended_shapes)
+
+    print(f"\nClip già in cache: {summary['cached']}")
+    print(f"Clip analizzate: {summary['analyzed']}")
+    print(f"Clip fallite: {summary['failed']}")
+    print(f"Voci in cache: {cache.stats()['entries']}")
+    sys.exit(0 if summary["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
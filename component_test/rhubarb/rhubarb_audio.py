@@ -0,0 +1,119 @@
+"""
+Preparazione dell'audio per Rhubarb Lip Sync.
+
+Rhubarb analizza internamente l'audio a 16 kHz mono, quindi non ha senso
+convertire in WAV a 44.1 kHz: ffmpeg decodifica direttamente a 16 kHz mono
+PCM a 16 bit e scrive su stdout, l'header WAV viene costruito in memoria e il
+file passato a Rhubarb (che accetta solo un percorso, non stdin) viene
+scritto in una directory su tmpfs quando disponibile (/dev/shm su Linux).
+L'input può essere un percorso o direttamente i byte dell'audio (ad esempio
+l'MP3 appena ricevuto da ElevenLabs), evitando di scriverlo su disco.
+"""
+
+import io
+import os
+import subprocess
+import tempfile
+import wave
+
+# Frequenza di campionamento usata internamente da Rhubarb
+RHUBARB_SAMPLE_RATE = 16000
+
+# Directory su memoria condivisa (tmpfs) disponibile su Linux
+SHM_DIR = "/dev/shm"
+
+
+def decode_to_pcm(source, sample_rate=RHUBARB_SAMPLE_RATE):
+    """
+    Decodifica l'audio in PCM mono a 16 bit usando una pipe di ffmpeg.
+
+    Args:
+        source (str or bytes): Percorso del file audio oppure i suoi byte
+        sample_rate (int): Frequenza di campionamento di destinazione
+
+    Returns:
+        bytes: Campioni PCM little-endian a 16 bit
+
+    Raises:
+        subprocess.CalledProcessError: Se ffmpeg fallisce
+        FileNotFoundError: Se ffmpeg non è installato
+    """
+    from_bytes = isinstance(source, (bytes, bytearray))
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if not from_bytes:
+        # Senza input da stdin, ffmpeg non deve leggerlo (evita blocchi in background)
+        cmd.append("-nostdin")
+    cmd += [
+        "-i", "pipe:0" if from_bytes else str(source),
+        "-ac", "1",
+        "-ar", str(sample_rate),
+        "-f", "s16le",
+        "pipe:1"
+    ]
+    result = subprocess.run(
+        cmd,
+        input=bytes(source) if from_bytes else None,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    return result.stdout
+
+
+def pcm_to_wav_bytes(pcm, sample_rate=RHUBARB_SAMPLE_RATE):
+    """Costruisce in memoria un file WAV mono a 16 bit a partire dai campioni PCM"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def decode_to_wav_bytes(source, sample_rate=RHUBARB_SAMPLE_RATE):
+    """Decodifica l'audio in un WAV mono a 16 bit interamente in memoria"""
+    return pcm_to_wav_bytes(decode_to_pcm(source, sample_rate), sample_rate)
+
+
+def is_rhubarb_ready_wav(path, sample_rate=RHUBARB_SAMPLE_RATE):
+    """Verifica se il file è già un WAV PCM mono a 16 bit alla frequenza richiesta"""
+    if not isinstance(path, (str, os.PathLike)) or not str(path).lower().endswith(".wav"):
+        return False
+    try:
+        with wave.open(str(path), 'rb') as wf:
+            return (wf.getnchannels() == 1 and wf.getsampwidth() == 2
+                    and wf.getframerate() == sample_rate)
+    except (wave.Error, EOFError, OSError):
+        return False
+
+
+def memory_temp_dir():
+    """
+    Restituisce una directory temporanea su tmpfs se disponibile,
+    altrimenti una normale directory temporanea.
+    """
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        return tempfile.TemporaryDirectory(dir=SHM_DIR, prefix="rhubarb_")
+    return tempfile.TemporaryDirectory(prefix="rhubarb_")
+
+
+def prepare_wav(source, temp_dir, sample_rate=RHUBARB_SAMPLE_RATE):
+    """
+    Restituisce il percorso di un WAV pronto per Rhubarb. Se il file è già nel
+    formato corretto non viene avviato ffmpeg.
+
+    Args:
+        source (str or bytes): Percorso del file audio oppure i suoi byte
+        temp_dir (str): Directory (preferibilmente da memory_temp_dir()) in cui scrivere il WAV
+
+    Returns:
+        str: Percorso del file WAV
+    """
+    if is_rhubarb_ready_wav(source, sample_rate):
+        return str(source)
+
+    wav_file = os.path.join(temp_dir, "temp_audio.wav")
+    with open(wav_file, 'wb') as f:
+        f.write(decode_to_wav_bytes(source, sample_rate))
+    return wav_file
@@ -7,19 +7,30 @@ Uso: python rhubarb_client.py --name filename [--url http://localhost:8080/avata
 import argparse
 import requests
 import json
+import os
 import sys
 
-def request_speech(url, file_name):
+# Rende importabili i moduli condivisi in component_test/common
+COMMON_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from http_client import get_session
+
+def request_speech(url, file_name, session=None):
     """
     Richiede a Unity di riprodurre un file audio con sincronizzazione labiale
 
     Args:
         url: URL dell'endpoint speak
         file_name: Nome del file da riprodurre (senza estensione)
+        session: Sessione HTTP da usare (default: sessione condivisa)
 
     Returns:
         bool: True se la richiesta ha avuto successo, False altrimenti
     """
+    session = session or get_session()
+
     # Costruisci l'URL completo con il parametro del nome del file
     full_url = f"{url}?file={file_name}"
 
@@ -27,7 +38,7 @@ def request_speech(url, file_name):
 
     try:
         # Invia la richiesta GET
-        response = requests.get(full_url)
+        response = session.get(full_url)
 
         # Verifica la risposta
         if response.status_code == 200:
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Lipsync di audio lunghi con Rhubarb eseguito in parallelo su segmenti.
+
+Rhubarb usa un solo core per file, quindi il tempo di analisi cresce con la
+durata della risposta. Qui l'audio viene tagliato nelle pause (dove la bocca
+è comunque chiusa), i segmenti vengono analizzati da più processi Rhubarb in
+parallelo e i mouthCues vengono riuniti spostandoli del tempo di inizio del
+segmento. Alle giunzioni vengono eliminati i brevi cue di silenzio introdotti
+dal taglio e uniti i cue consecutivi con la stessa forma, così il risultato ha
+lo stesso formato (json, tsv, xml) dell'analisi del file intero.
+
+Il testo del dialogo non può essere diviso in modo affidabile tra i segmenti,
+quindi in questa modalità non viene passato a Rhubarb.
+
+Uso:
+    python rhubarb_segments.py input.mp3 [--output output_prefix] [--format json|xml|tsv]
+        [--segment_length 10] [--workers 4] [--rhubarb_path path]
+"""
+
+import argparse
+import os
+import sys
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from lipsync_cache import parse_mouth_cues, write_mouth_cues
+from rhubarb_audio import RHUBARB_SAMPLE_RATE, decode_to_pcm, is_rhubarb_ready_wav, memory_temp_dir, pcm_to_wav_bytes
+from test_rhubarb_with_phonetic import run_rhubarb_with_phonetic
+
+# Durata della finestra usata per misurare l'energia
+FRAME_SECONDS = 0.02
+
+
+def find_split_points(samples, sample_rate=RHUBARB_SAMPLE_RATE, segment_length=10.0, min_silence=0.25,
+                      threshold_db=-40.0):
+    """
+    Sceglie i punti di taglio al centro delle pause più vicine alla lunghezza desiderata.
+
+    Args:
+        samples (numpy.ndarray): Campioni mono (int16 o float)
+        segment_length (float): Durata desiderata dei segmenti in secondi
+        min_silence (float): Durata minima di una pausa utilizzabile per il taglio
+        threshold_db (float): Energia sotto cui un frame è considerato silenzio (dB rispetto al fondo scala)
+
+    Returns:
+        list: Indici dei campioni in cui tagliare, in ordine crescente
+    """
+    frame = int(FRAME_SECONDS * sample_rate)
+    num_frames = len(samples) // frame
+    if num_frames == 0 or len(samples) < 1.5 * segment_length * sample_rate:
+        return []
+
+    audio = samples[:num_frames * frame].astype(np.float32)
+    if samples.dtype == np.int16:
+        audio /= 32768.0
+    rms = np.sqrt(np.mean(audio.reshape(num_frames, frame) ** 2, axis=1))
+    levels = 20 * np.log10(np.maximum(rms, 1e-10))
+    silent = levels < threshold_db
+
+    # Pause: sequenze di frame silenziosi lunghe almeno min_silence, ridotte al loro centro
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    long_runs = (run_ends - run_starts) * FRAME_SECONDS >= min_silence
+    candidates = ((run_starts[long_runs] + run_ends[long_runs]) // 2) * frame
+
+    points = []
+    start = 0
+    target = int(segment_length * sample_rate)
+    while len(samples) - start > 1.5 * target:
+        # Pause tra metà e una volta e mezza la lunghezza desiderata, la più vicina al bersaglio
+        window = candidates[(candidates > start + target // 2) & (candidates < start + 3 * target // 2)]
+        if len(window):
+            cut = int(window[np.argmin(np.abs(window - (start + target)))])
+        else:
+            # Nessuna pausa: si taglia nel frame meno energetico attorno al bersaglio
+            first, last = (start + target // 2) // frame, min((start + 3 * target // 2) // frame, num_frames)
+            cut = int((first + np.argmin(levels[first:last])) * frame)
+        points.append(cut)
+        start = cut
+    return points
+
+
+def merge_segment_cues(segment_results, offsets, duration, seam_tolerance=0.12):
+    """
+    Riunisce i mouthCues dei segmenti in un unico risultato con tempi assoluti.
+
+    Args:
+        segment_results (list): Risultati di parse_mouth_cues() per ogni segmento
+        offsets (list): Inizio di ogni segmento in secondi
+        duration (float): Durata totale dell'audio
+        seam_tolerance (float): I cue di silenzio (X) più brevi di questa durata a contatto
+            con una giunzione vengono eliminati ed assorbiti dal cue vicino
+
+    Returns:
+        dict: Risultato nel formato di parse_mouth_cues()
+    """
+    seams = [round(offset, 2) for offset in offsets[1:]]
+    cues = []
+    for result, offset in zip(segment_results, offsets):
+        for cue in result["mouthCues"]:
+            cues.append({"start": round(cue["start"] + offset, 2), "end": round(cue["end"] + offset, 2),
+                         "value": cue["value"]})
+
+    def touches_seam(cue):
+        return any(abs(cue["start"] - seam) < 0.011 or abs(cue["end"] - seam) < 0.011 for seam in seams)
+
+    smoothed = []
+    for cue in cues:
+        if cue["end"] <= cue["start"]:
+            continue
+        if cue["value"] == "X" and cue["end"] - cue["start"] < seam_tolerance and touches_seam(cue) and smoothed:
+            # Silenzio creato dal taglio: il cue precedente continua fino alla fine di questo
+            smoothed[-1]["end"] = cue["end"]
+            continue
+        if smoothed and smoothed[-1]["value"] == cue["value"]:
+            smoothed[-1]["end"] = cue["end"]
+            continue
+        smoothed.append(dict(cue))
+
+    # I cue restano contigui, come nell'output di Rhubarb
+    for previous, cue in zip(smoothed, smoothed[1:]):
+        previous["end"] = cue["start"]
+    return {"metadata": {"duration": round(duration, 2)}, "mouthCues": smoothed}
+
+
+def run_rhubarb_segmented(source, output_file, output_format, rhubarb_path, segment_length=10.0, workers=None,
+                          recognizer="phonetic", extended_shapes="GHX", timeout=None):
+    """
+    Genera il lipsync di un audio lungo analizzando i segmenti in parallelo.
+
+    Args:
+        source (str or bytes): Percorso del file audio oppure i suoi byte
+        output_file (str): File di output nel formato richiesto
+        output_format (str): "json", "tsv" o "xml"
+        segment_length (float): Durata desiderata dei segmenti in secondi
+        workers (int, optional): Processi Rhubarb in parallelo (default: numero di core)
+
+    Returns:
+        dict: Risultato nel formato di parse_mouth_cues(), oppure None se un segmento fallisce
+    """
+    if is_rhubarb_ready_wav(source):
+        # WAV già a 16 kHz mono: nessun bisogno di ffmpeg
+        with wave.open(source, 'rb') as wf:
+            samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    else:
+        samples = np.frombuffer(decode_to_pcm(source), dtype=np.int16)
+    duration = len(samples) / RHUBARB_SAMPLE_RATE
+    bounds = [0] + find_split_points(samples, segment_length=segment_length) + [len(samples)]
+    offsets = [start / RHUBARB_SAMPLE_RATE for start in bounds[:-1]]
+    workers = min(workers or os.cpu_count() or 1, len(offsets))
+    print(f"Audio di {duration:.1f} secondi diviso in {len(offsets)} segmenti, {workers} processi Rhubarb")
+
+    with memory_temp_dir() as temp_dir:
+        def analyze(index):
+            wav_file = os.path.join(temp_dir, f"segment_{index:03d}.wav")
+            with open(wav_file, 'wb') as f:
+                f.write(pcm_to_wav_bytes(samples[bounds[index]:bounds[index + 1]].tobytes()))
+            segment_output = os.path.join(temp_dir, f"segment_{index:03d}.json")
+            if not run_rhubarb_with_phonetic(wav_file, segment_output, "json", rhubarb_path, recognizer=recognizer,
+                                             extended_shapes=extended_shapes, verbose=False, timeout=timeout):
+                return None
+            return parse_mouth_cues(segment_output, "json")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            segment_results = list(executor.map(analyze, range(len(offsets))))
+
+    if any(result is None for result in segment_results):
+        return None
+
+    result = merge_segment_cues(segment_results, offsets, duration)
+    sound_file = source if isinstance(source, str) else ""
+    write_mouth_cues(result, output_file, output_format, sound_file=sound_file)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lipsync di audio lunghi con Rhubarb in parallelo su segmenti")
+    parser.add_argument("input_file", help="File audio di input")
+    parser.add_argument("--output", default="output_segmented", help="Prefisso del file di output (senza estensione)")
+    parser.add_argument("--format", choices=["json", "xml", "tsv"], default="json", help="Formato di output (default: json)")
+    parser.add_argument("--rhubarb_path", default="./bin/rhubarb/rhubarb", help="Percorso all'eseguibile di Rhubarb")
+    parser.add_argument("--recognizer", choices=["phonetic", "pocketSphinx"], default="phonetic",
+                        help="Riconoscitore di Rhubarb (default: phonetic)")
+    parser.add_argument("--extended_shapes", default="GHX", help="Forme labiali estese da utilizzare (default: GHX)")
+    parser.add_argument("--segment_length", type=float, default=10.0, help="Durata desiderata dei segmenti in secondi (default: 10)")
+    parser.add_argument("--workers", type=int, help="Processi Rhubarb in parallelo (default: numero di core)")
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.input_file):
+        print(f"File di input non trovato: {args.input_file}")
+        sys.exit(1)
+    if not os.path.isfile(args.rhubarb_path):
+        print(f"Eseguibile Rhubarb non trovato in: {args.rhubarb_path}")
+        sys.exit(1)
+
+    output_file = f"{args.output}.{args.format}"
+    start_time = time.time()
+    result = run_rhubarb_segmented(args.input_file, output_file, args.format, args.rhubarb_path,
+                                   args.segment_length, args.workers, args.recognizer, args.extended_shapes)
+    if result is None:
+        print("\nAnalisi di almeno un segmento fallita.")
+        sys.exit(1)
+
+    print(f"{len(result['mouthCues'])} mouth cues in {time.time() - start_time:.2f} secondi. Output salvato in: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Script di test per il formato binario dei mouthCues (lipsync_binary.py).
+Verifica il round-trip di cue contigui, con pause e vuoti e gli errori sui file
+troncati o non validi. Non serve Rhubarb: i cue sono costruiti a mano.
+
+Uso:
+    python test_lipsync_binary.py [--output_dir test_output]
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+from lipsync_binary import FLAG_CONTIGUOUS, HEADER, convert_file, decode_mouth_cues, encode_mouth_cues, read_binary
+
+CONTIGUOUS = {
+    "metadata": {"duration": 1.5},
+    "mouthCues": [
+        {"start": 0.0, "end": 0.37, "value": "X"},
+        {"start": 0.37, "end": 0.45, "value": "B"},
+        {"start": 0.45, "end": 0.8, "value": "C"},
+        {"start": 0.8, "end": 1.21, "value": "F"},
+        {"start": 1.21, "end": 1.5, "value": "X"}
+    ]
+}
+
+GAPPED = {
+    "metadata": {"duration": 2.0},
+    "mouthCues": [
+        {"start": 0.1, "end": 0.25, "value": "A"},
+        {"start": 0.4, "end": 0.62, "value": "E"},
+        {"start": 0.62, "end": 0.9, "value": "H"},
+        {"start": 1.3, "end": 1.75, "value": "G"}
+    ]
+}
+
+EMPTY = {"metadata": {"duration": 0.5}, "mouthCues": []}
+
+
+def expect_error(data, message):
+    """Verifica che la decodifica fallisca con un ValueError che contiene il messaggio indicato"""
+    try:
+        decode_mouth_cues(data)
+    except ValueError as e:
+        assert message in str(e), f"Errore inatteso: {e}"
+        print(f"Errore atteso: {e}")
+        return
+    raise AssertionError(f"La decodifica doveva fallire ({message})")
+
+
+def test_lipsync_binary(output_dir):
+    """Verifica round-trip, dimensioni dei file e gestione degli errori"""
+
+    print("\nTest 1: Cue contigui")
+    data = encode_mouth_cues(CONTIGUOUS)
+    assert data[5] & FLAG_CONTIGUOUS, "Cue contigui codificati senza il flag CONTIGUOUS"
+    assert len(data) == HEADER.size + 3 * len(CONTIGUOUS["mouthCues"]), "Le durate non devono essere salvate"
+    assert decode_mouth_cues(data) == CONTIGUOUS, "Round-trip dei cue contigui non identico"
+    print(f"{len(CONTIGUOUS['mouthCues'])} cue in {len(data)} byte")
+
+    print("\nTest 2: Cue con pause")
+    data = encode_mouth_cues(GAPPED)
+    assert not data[5] & FLAG_CONTIGUOUS, "Cue con pause codificati con il flag CONTIGUOUS"
+    assert len(data) == HEADER.size + 5 * len(GAPPED["mouthCues"]), "Le durate dei cue con pause vanno salvate"
+    assert decode_mouth_cues(data) == GAPPED, "Round-trip dei cue con pause non identico"
+    print(f"{len(GAPPED['mouthCues'])} cue in {len(data)} byte")
+
+    print("\nTest 3: Nessun cue")
+    data = encode_mouth_cues(EMPTY)
+    assert len(data) == HEADER.size
+    assert decode_mouth_cues(data) == EMPTY, "Round-trip senza cue non identico"
+
+    print("\nTest 4: Conversione da file JSON di Rhubarb")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    json_path = output_dir / "binary_test.json"
+    json_path.write_text(json.dumps(CONTIGUOUS, indent=2))
+    lsb_path = convert_file(str(json_path))
+    assert lsb_path == str(output_dir / "binary_test.lsb")
+    assert read_binary(lsb_path) == CONTIGUOUS, "Il file .lsb non corrisponde al JSON di partenza"
+    print(f"{json_path.stat().st_size} byte -> {Path(lsb_path).stat().st_size} byte")
+
+    print("\nTest 5: File troncati")
+    data = encode_mouth_cues(GAPPED)
+    expect_error(data[:HEADER.size - 1], "troncato")
+    expect_error(data[:-1], "troncato")
+    contiguous = encode_mouth_cues(CONTIGUOUS)
+    expect_error(contiguous[:HEADER.size + 2], "troncato")
+
+    print("\nTest 6: Magic e versione non validi")
+    expect_error(b"RIFF" + data[4:], "magic")
+    expect_error(data[:4] + bytes([99]) + data[5:], "Versione")
+
+    print("\nTest 7: Cue non ordinati")
+    unordered = {"metadata": {"duration": 1.0},
+                 "mouthCues": [{"start": 0.5, "end": 0.6, "value": "A"}, {"start": 0.2, "end": 0.3, "value": "B"}]}
+    try:
+        encode_mouth_cues(unordered)
+    except ValueError as e:
+        print(f"Errore atteso: {e}")
+    else:
+        raise AssertionError("La codifica di cue non ordinati doveva fallire")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Testa il formato binario dei mouthCues")
+    parser.add_argument("--output_dir", default="test_output",
+                        help="Directory per i file di test (default: test_output)")
+
+    args = parser.parse_args()
+
+    test_lipsync_binary(args.output_dir)
+    print("\nTest completato con successo!")
+
+
+if __name__ == "__main__":
+    main()
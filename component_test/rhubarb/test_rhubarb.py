@@ -8,24 +8,23 @@ Uso:
 """
 
 import argparse
-import json
 import os
 import subprocess
 import sys
-import tempfile
 from pathlib import Path
 
+from lipsync_analysis import analyze_output
+from lipsync_cache import LipSyncCache, lipsync_key, parse_mouth_cues, write_mouth_cues
+from rhubarb_audio import memory_temp_dir, prepare_wav
+
 
 def convert_to_wav(mp3_file, temp_dir):
-    """Converte un file MP3 in WAV usando ffmpeg, necessario per Rhubarb"""
-    wav_file = os.path.join(temp_dir, "temp_audio.wav")
+    """
+    Converte un file MP3 in WAV mono a 16 kHz (la frequenza usata internamente da Rhubarb)
+    decodificando con una pipe di ffmpeg, necessario per Rhubarb
+    """
     try:
-        subprocess.run(
-            ["ffmpeg", "-i", mp3_file, "-ar", "44100", wav_file],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+        wav_file = prepare_wav(mp3_file, temp_dir)
         print(f"Convertito {mp3_file} in WAV")
         return wav_file
     except subprocess.CalledProcessError as e:
@@ -70,45 +69,6 @@ def run_rhubarb(wav_file, output_file, output_format, rhubarb_path):
         return False
 
 
-def analyze_output(output_file, output_format):
-    """Analizza e mostra un riepilogo dell'output generato da Rhubarb"""
-    try:
-        if output_format == "json":
-            with open(output_file, 'r') as f:
-                data = json.load(f)
-                mouth_cues = data.get("mouthCues", [])
-                print(f"\nAnalisi dell'output JSON:")
-                print(f"  - Durata totale: {data.get('metadata', {}).get('duration', 'N/A')} secondi")
-                print(f"  - Numero di mouth cues: {len(mouth_cues)}")
-                print(f"  - Esempio dei primi 3 mouth cues:")
-                for i, cue in enumerate(mouth_cues[:3]):
-                    print(f"    {i+1}. Da {cue.get('start')} a {cue.get('end')}: {cue.get('value')}")
-
-        elif output_format == "tsv":
-            with open(output_file, 'r') as f:
-                lines = f.readlines()
-                print(f"\nAnalisi dell'output TSV:")
-                print(f"  - Numero di linee: {len(lines)}")
-                print(f"  - Esempio delle prime 3 linee:")
-                for i, line in enumerate(lines[:3]):
-                    print(f"    {i+1}. {line.strip()}")
-
-        elif output_format == "xml":
-            # Per semplicità, mostro solo il numero di righe e alcune righe iniziali
-            with open(output_file, 'r') as f:
-                lines = f.readlines()
-                print(f"\nAnalisi dell'output XML:")
-                print(f"  - Numero di linee: {len(lines)}")
-                print(f"  - Prime 5 righe:")
-                for i, line in enumerate(lines[:5]):
-                    print(f"    {i+1}. {line.strip()}")
-
-        return True
-    except Exception as e:
-        print(f"Errore durante l'analisi dell'output: {e}")
-        return False
-
-
 def main():
     parser = argparse.ArgumentParser(description="Testa Rhubarb Lip Sync con un file audio MP3")
     parser.add_argument("input_file", help="File audio MP3 di input")
@@ -117,6 +77,7 @@ def main():
                         help="Formato di output (default: json)")
     parser.add_argument("--rhubarb_path", help="Percorso all'eseguibile di Rhubarb",
                         default="./bin/rhubarb/rhubarb")
+    parser.add_argument("--cache_dir", help="Directory della cache dei risultati di Rhubarb (opzionale)")
 
     args = parser.parse_args()
 
@@ -149,16 +110,37 @@ def main():
                 print(f"  - {alt}")
             sys.exit(1)
 
-    # Crea directory temporanea
-    with tempfile.TemporaryDirectory() as temp_dir:
+    # Costruisci il percorso del file di output
+    output_file = f"{args.output}.{args.format}"
+
+    # Se lo stesso audio è già stato analizzato, usa il risultato in cache
+    cache = LipSyncCache(args.cache_dir) if args.cache_dir else None
+    cache_key = None
+    if cache:
+        cache_key = lipsync_key(args.input_file, "pocketSphinx")
+        cached = cache.get(cache_key)
+        if cached:
+            write_mouth_cues(cached, output_file, args.format, sound_file=args.input_file)
+            print(f"Risultato trovato in cache. Output salvato in: {output_file}")
+            analyze_output(output_file, args.format)
+            print("\nTest completato con successo!")
+            return
+
+    # Crea directory temporanea (su memoria condivisa se disponibile)
+    with memory_temp_dir() as temp_dir:
         # Converti MP3 in WAV (formato richiesto da Rhubarb)
         wav_file = convert_to_wav(args.input_file, temp_dir)
 
-        # Costruisci il percorso del file di output
-        output_file = f"{args.output}.{args.format}"
+        # Con la cache Rhubarb scrive sempre JSON: il TSV non ha fine dei cue né durata
+        rhubarb_output = os.path.join(temp_dir, "output.json") if cache else output_file
 
         # Esegui Rhubarb
-        if run_rhubarb(wav_file, output_file, args.format, rhubarb_exec):
+        if run_rhubarb(wav_file, rhubarb_output, "json" if cache else args.format, rhubarb_exec):
+            if cache:
+                result = parse_mouth_cues(rhubarb_output, "json")
+                cache.put(cache_key, result)
+                write_mouth_cues(result, output_file, args.format, sound_file=args.input_file)
+
             # Analizza l'output
             analyze_output(output_file, args.format)
             print("\nTest completato con successo!")
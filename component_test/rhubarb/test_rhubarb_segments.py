@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Script di test per la divisione in segmenti dell'analisi di Rhubarb (rhubarb_segments.py).
+Verifica la scelta dei punti di taglio su audio sintetico (toni separati da
+pause) e la riunione dei mouthCues dei segmenti alle giunzioni. Non serve
+Rhubarb: i cue dei segmenti sono costruiti a mano.
+
+Uso:
+    python test_rhubarb_segments.py
+"""
+
+import numpy as np
+
+from rhubarb_audio import RHUBARB_SAMPLE_RATE
+from rhubarb_segments import FRAME_SECONDS, find_split_points, merge_segment_cues
+
+SAMPLE_RATE = RHUBARB_SAMPLE_RATE
+FRAME = int(FRAME_SECONDS * SAMPLE_RATE)
+
+
+def synthetic_speech(duration, pauses, quiet=(), amplitude=0.5):
+    """
+    Crea un tono continuo (int16) interrotto da pause di silenzio.
+
+    Args:
+        duration (float): Durata in secondi
+        pauses (list): Coppie (inizio, fine) in secondi delle pause di silenzio
+        quiet (list): Coppie (inizio, fine) in secondi di tratti a volume ridotto (-30 dB), non silenziosi
+    """
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    audio = amplitude * np.sin(2 * np.pi * 220 * t)
+    for start, end in quiet:
+        audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)] *= 10 ** (-30 / 20)
+    for start, end in pauses:
+        audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)] = 0.0
+    return (audio * 32767).astype(np.int16)
+
+
+def check_points(points, expected_seconds):
+    """Verifica che i punti di taglio cadano entro un frame dai tempi attesi"""
+    found = [point / SAMPLE_RATE for point in points]
+    print(f"Punti di taglio: {[round(seconds, 2) for seconds in found]} s")
+    assert len(points) == len(expected_seconds), f"Attesi {len(expected_seconds)} tagli, trovati {len(points)}"
+    for point, expected in zip(points, expected_seconds):
+        assert abs(point - expected * SAMPLE_RATE) <= FRAME, f"Taglio a {point / SAMPLE_RATE:.3f} s invece di {expected} s"
+        assert point % FRAME == 0, "I tagli devono cadere al confine di un frame"
+
+
+def test_find_split_points():
+    """Verifica i tagli nelle pause, il ripiego sul tratto meno energetico e l'audio breve"""
+
+    print("\nTest 1: Tagli al centro delle pause più vicine alla lunghezza desiderata")
+    # La pausa a 4 s è troppo lontana da 10 s e quella di 0.1 s a 9 s è troppo breve
+    samples = synthetic_speech(36.0, pauses=[(3.8, 4.2), (8.95, 9.05), (9.9, 10.5), (19.6, 20.0), (30.2, 30.8)])
+    check_points(find_split_points(samples, segment_length=10.0), [10.2, 19.8, 30.5])
+
+    print("\nTest 2: Stesso audio in float")
+    float_samples = samples.astype(np.float32) / 32768.0
+    assert find_split_points(float_samples, segment_length=10.0) == find_split_points(samples, segment_length=10.0), \
+        "I campioni float devono dare gli stessi tagli degli int16"
+
+    print("\nTest 3: Nessuna pausa, taglio nel tratto meno energetico")
+    samples = synthetic_speech(20.0, pauses=[], quiet=[(11.0, 11.2)])
+    points = find_split_points(samples, segment_length=10.0)
+    assert len(points) == 1 and 11.0 <= points[0] / SAMPLE_RATE < 11.2, \
+        f"Il taglio doveva cadere nel tratto a volume ridotto: {points}"
+    print(f"Punto di taglio: {points[0] / SAMPLE_RATE:.2f} s")
+
+    print("\nTest 4: Audio breve, nessun taglio")
+    assert find_split_points(synthetic_speech(14.0, pauses=[(6.0, 7.0)]), segment_length=10.0) == []
+    assert find_split_points(np.zeros(FRAME - 1, dtype=np.int16), segment_length=10.0) == []
+
+
+def test_merge_segment_cues():
+    """Verifica tempi assoluti, silenzi alle giunzioni e cue contigui"""
+
+    print("\nTest 5: Silenzi brevi alle giunzioni eliminati e forme uguali unite")
+    first = {"metadata": {"duration": 4.05}, "mouthCues": [
+        {"start": 0.0, "end": 0.2, "value": "X"},
+        {"start": 0.2, "end": 4.0, "value": "B"},
+        {"start": 4.0, "end": 4.05, "value": "X"}
+    ]}
+    second = {"metadata": {"duration": 2.5}, "mouthCues": [
+        {"start": 0.0, "end": 0.06, "value": "X"},
+        {"start": 0.06, "end": 1.0, "value": "B"},
+        {"start": 1.0, "end": 1.0, "value": "E"},
+        {"start": 1.0, "end": 2.0, "value": "C"},
+        {"start": 2.0, "end": 2.5, "value": "X"}
+    ]}
+    result = merge_segment_cues([first, second], [0.0, 4.05], 6.55)
+    assert result == {"metadata": {"duration": 6.55}, "mouthCues": [
+        {"start": 0.0, "end": 0.2, "value": "X"},
+        {"start": 0.2, "end": 5.05, "value": "B"},
+        {"start": 5.05, "end": 6.05, "value": "C"},
+        {"start": 6.05, "end": 6.55, "value": "X"}
+    ]}, f"Riunione inattesa: {result['mouthCues']}"
+
+    print("\nTest 6: Pause vere alle giunzioni conservate")
+    first = {"metadata": {"duration": 3.0}, "mouthCues": [
+        {"start": 0.0, "end": 2.6, "value": "D"},
+        {"start": 2.6, "end": 3.0, "value": "X"}
+    ]}
+    second = {"metadata": {"duration": 2.0}, "mouthCues": [
+        {"start": 0.0, "end": 0.3, "value": "X"},
+        {"start": 0.3, "end": 2.0, "value": "F"}
+    ]}
+    third = {"metadata": {"duration": 1.0}, "mouthCues": [
+        {"start": 0.1, "end": 1.0, "value": "A"}
+    ]}
+    result = merge_segment_cues([first, second, third], [0.0, 3.0, 5.0], 6.0)
+    cues = result["mouthCues"]
+    assert [cue["value"] for cue in cues] == ["D", "X", "F", "A"], f"Forme inattese: {cues}"
+    assert cues[1] == {"start": 2.6, "end": 3.3, "value": "X"}, "La pausa lunga alla giunzione va conservata"
+    for previous, cue in zip(cues, cues[1:]):
+        assert previous["end"] == cue["start"], f"Cue non contigui: {previous} -> {cue}"
+    assert cues[-1] == {"start": 5.1, "end": 6.0, "value": "A"}, "Tempi del terzo segmento non spostati"
+
+
+def main():
+    test_find_split_points()
+    test_merge_segment_cues()
+    print("\nTest completato con successo!")
+
+
+if __name__ == "__main__":
+    main()
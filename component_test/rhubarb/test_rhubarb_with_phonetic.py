@@ -8,24 +8,23 @@ Uso:
 """
 
 import argparse
-import json
 import os
 import subprocess
 import sys
-import tempfile
 from pathlib import Path
 
+from lipsync_analysis import analyze_output
+from lipsync_cache import LipSyncCache, lipsync_key, parse_mouth_cues, write_mouth_cues
+from rhubarb_audio import memory_temp_dir, prepare_wav
+
 
 def convert_to_wav(mp3_file, temp_dir):
-    """Converte un file MP3 in WAV usando ffmpeg, necessario per Rhubarb"""
-    wav_file = os.path.join(temp_dir, "temp_audio.wav")
+    """
+    Converte un file MP3 in WAV mono a 16 kHz (la frequenza usata internamente da Rhubarb)
+    decodificando con una pipe di ffmpeg, necessario per Rhubarb
+    """
     try:
-        subprocess.run(
-            ["ffmpeg", "-i", mp3_file, "-ar", "44100", wav_file],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+        wav_file = prepare_wav(mp3_file, temp_dir)
         print(f"Convertito {mp3_file} in WAV")
         return wav_file
     except subprocess.CalledProcessError as e:
@@ -37,17 +36,21 @@ def convert_to_wav(mp3_file, temp_dir):
         sys.exit(1)
 
 
-def run_rhubarb_with_phonetic(wav_file, output_file, output_format, rhubarb_path, dialog_file=None):
+def run_rhubarb_with_phonetic(wav_file, output_file, output_format, rhubarb_path, dialog_file=None,
+                              recognizer="phonetic", extended_shapes="GHX", verbose=True, timeout=None):
     """
     Esegue Rhubarb Lip Sync sul file WAV utilizzando il riconoscitore fonetico
-    per generare i dati di sincronizzazione labiale
+    per generare i dati di sincronizzazione labiale.
+    Con verbose=False vengono stampati solo gli errori (utile con molti processi in parallelo);
+    timeout limita la durata dell'esecuzione in secondi.
     """
     try:
         # Costruisci il comando Rhubarb con il riconoscitore fonetico
         cmd = [
             rhubarb_path,
             "-f", output_format,  # Formato di output
-            "-r", "phonetic",     # Usa il riconoscitore fonetico per lingue non inglesi
+            "-r", recognizer,     # Usa il riconoscitore fonetico per lingue non inglesi
+            "--extendedShapes", extended_shapes,  # Forme labiali estese
             "-o", output_file,    # File di output
         ]
 
@@ -59,17 +62,23 @@ def run_rhubarb_with_phonetic(wav_file, output_file, output_format, rhubarb_path
         cmd.append(wav_file)
 
         # Esegui Rhubarb
-        print(f"Esecuzione di Rhubarb con riconoscitore fonetico: {' '.join(cmd)}")
+        if verbose:
+            print(f"Esecuzione di Rhubarb con riconoscitore fonetico: {' '.join(cmd)}")
         result = subprocess.run(
             cmd,
             check=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True
+            text=True,
+            timeout=timeout
         )
 
-        print(f"Rhubarb completato con successo. Output salvato in: {output_file}")
+        if verbose:
+            print(f"Rhubarb completato con successo. Output salvato in: {output_file}")
         return True
+    except subprocess.TimeoutExpired:
+        print(f"Rhubarb interrotto dopo {timeout} secondi: {wav_file}")
+        return False
     except subprocess.CalledProcessError as e:
         print(f"Errore durante l'esecuzione di Rhubarb: {e}")
         print(f"Output di errore: {e.stderr}")
@@ -80,89 +89,6 @@ def run_rhubarb_with_phonetic(wav_file, output_file, output_format, rhubarb_path
         return False
 
 
-def analyze_output(output_file, output_format):
-    """Analizza e mostra un riepilogo dell'output generato da Rhubarb"""
-    try:
-        if output_format == "json":
-            with open(output_file, 'r') as f:
-                data = json.load(f)
-                mouth_cues = data.get("mouthCues", [])
-                print(f"\nAnalisi dell'output JSON:")
-                print(f"  - Durata totale: {data.get('metadata', {}).get('duration', 'N/A')} secondi")
-                print(f"  - Numero di mouth cues: {len(mouth_cues)}")
-                print(f"  - Distribuzione delle forme labiali:")
-
-                # Conta le occorrenze di ogni forma labiale
-                mouth_shapes = {}
-                for cue in mouth_cues:
-                    shape = cue.get('value')
-                    if shape in mouth_shapes:
-                        mouth_shapes[shape] += 1
-                    else:
-                        mouth_shapes[shape] = 1
-
-                for shape, count in sorted(mouth_shapes.items()):
-                    print(f"    {shape}: {count} occorrenze")
-
-                # Mostra alcuni esempi
-                print(f"  - Esempio dei primi 5 mouth cues:")
-                for i, cue in enumerate(mouth_cues[:5]):
-                    print(f"    {i+1}. Da {cue.get('start')} a {cue.get('end')}: {cue.get('value')}")
-
-        elif output_format == "tsv":
-            with open(output_file, 'r') as f:
-                lines = f.readlines()
-                print(f"\nAnalisi dell'output TSV:")
-                print(f"  - Numero di linee: {len(lines)}")
-
-                # Conta le occorrenze di ogni forma labiale
-                mouth_shapes = {}
-                for line in lines:
-                    if line.strip():
-                        parts = line.strip().split('\t')
-                        if len(parts) >= 2:
-                            shape = parts[1]
-                            if shape in mouth_shapes:
-                                mouth_shapes[shape] += 1
-                            else:
-                                mouth_shapes[shape] = 1
-
-                print(f"  - Distribuzione delle forme labiali:")
-                for shape, count in sorted(mouth_shapes.items()):
-                    print(f"    {shape}: {count} occorrenze")
-
-                print(f"  - Esempio delle prime 5 linee:")
-                for i, line in enumerate(lines[:5]):
-                    print(f"    {i+1}. {line.strip()}")
-
-        elif output_format == "xml":
-            # Per XML mostriamo statistiche più semplici
-            with open(output_file, 'r') as f:
-                content = f.read()
-
-                # Contiamo le occorrenze di ogni forma labiale
-                mouth_shapes = {}
-                import re
-                cues = re.findall(r'<mouthCue start="[^"]+" end="[^"]+">(.*?)</mouthCue>', content)
-
-                for shape in cues:
-                    if shape in mouth_shapes:
-                        mouth_shapes[shape] += 1
-                    else:
-                        mouth_shapes[shape] = 1
-
-                print(f"\nAnalisi dell'output XML:")
-                print(f"  - Numero totale di mouth cues: {len(cues)}")
-                print(f"  - Distribuzione delle forme labiali:")
-                for shape, count in sorted(mouth_shapes.items()):
-                    print(f"    {shape}: {count} occorrenze")
-
-        return True
-    except Exception as e:
-        print(f"Errore durante l'analisi dell'output: {e}")
-        return False
-
-
 def main():
     parser = argparse.ArgumentParser(description="Testa Rhubarb Lip Sync con il riconoscitore fonetico per audio in italiano o altre lingue non inglesi")
     parser.add_argument("input_file", help="File audio MP3 di input")
@@ -173,6 +99,10 @@ def main():
                         default="./bin/rhubarb/rhubarb")
     parser.add_argument("--dialog", help="File di testo con il dialogo trascritto (opzionale, migliora la precisione)")
     parser.add_argument("--extended_shapes", help="Forme labiali estese da utilizzare (es. 'GHX')", default="GHX")
+    parser.add_argument("--cache_dir", help="Directory della cache dei risultati di Rhubarb (opzionale)")
+    parser.add_argument("--segment_length", type=float,
+                        help="Audio lunghi: taglia nelle pause in segmenti di circa N secondi analizzati in parallelo")
+    parser.add_argument("--workers", type=int, help="Con --segment_length, processi Rhubarb in parallelo (default: numero di core)")
 
     args = parser.parse_args()
 
@@ -210,16 +140,59 @@ def main():
                 print(f"  - {alt}")
             sys.exit(1)
 
-    # Crea directory temporanea
-    with tempfile.TemporaryDirectory() as temp_dir:
+    # Costruisci il percorso del file di output
+    output_file = f"{args.output}.{args.format}"
+
+    # Se lo stesso audio è già stato analizzato con le stesse opzioni, usa il risultato in cache
+    cache = LipSyncCache(args.cache_dir) if args.cache_dir else None
+    cache_key = None
+    if cache:
+        dialog_text = None
+        # Con --segment_length il dialogo non viene passato a Rhubarb, quindi non fa parte della chiave
+        if args.dialog and not args.segment_length:
+            with open(args.dialog, 'r', encoding='utf-8') as f:
+                dialog_text = f.read()
+        cache_key = lipsync_key(args.input_file, "phonetic", dialog_text, args.extended_shapes, args.segment_length)
+        cached = cache.get(cache_key)
+        if cached:
+            write_mouth_cues(cached, output_file, args.format, sound_file=args.input_file)
+            print(f"Risultato trovato in cache. Output salvato in: {output_file}")
+            analyze_output(output_file, args.format)
+            print("\nTest completato con successo!")
+            return
+
+    if args.segment_length:
+        from rhubarb_segments import run_rhubarb_segmented
+
+        if args.dialog:
+            print("Il dialogo non viene usato con --segment_length: non può essere diviso tra i segmenti")
+        result = run_rhubarb_segmented(args.input_file, output_file, args.format, rhubarb_exec, args.segment_length,
+                                       args.workers, extended_shapes=args.extended_shapes)
+        if result is None:
+            print("\nTest fallito.")
+            sys.exit(1)
+        if cache:
+            cache.put(cache_key, result)
+        analyze_output(output_file, args.format)
+        print("\nTest completato con successo!")
+        return
+
+    # Crea directory temporanea (su memoria condivisa se disponibile)
+    with memory_temp_dir() as temp_dir:
         # Converti MP3 in WAV (formato richiesto da Rhubarb)
         wav_file = convert_to_wav(args.input_file, temp_dir)
 
-        # Costruisci il percorso del file di output
-        output_file = f"{args.output}.{args.format}"
+        # Con la cache Rhubarb scrive sempre JSON: il TSV non ha fine dei cue né durata
+        rhubarb_output = os.path.join(temp_dir, "output.json") if cache else output_file
 
         # Esegui Rhubarb con il riconoscitore fonetico
-        if run_rhubarb_with_phonetic(wav_file, output_file, args.format, rhubarb_exec, args.dialog):
+        if run_rhubarb_with_phonetic(wav_file, rhubarb_output, "json" if cache else args.format, rhubarb_exec,
+                                     args.dialog, extended_shapes=args.extended_shapes):
+            if cache:
+                result = parse_mouth_cues(rhubarb_output, "json")
+                cache.put(cache_key, result)
+                write_mouth_cues(result, output_file, args.format, sound_file=args.input_file)
+
             # Analizza l'output
             analyze_output(output_file, args.format)
             print("\nTest completato con successo!")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Script di test per gli upload in parallelo verso Unity.
+Confronta upload sequenziali e paralleli di audio + lipsync su un server locale
+che simula gli endpoint /avatar/upload e /avatar/speak (Unity non è necessario).
+
+Uso:
+    python test_upload_batch.py [--utterances 4] [--latency 0.1]
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from rhubarb_client import request_speech
+from unity_stub_server import UnityStubServer
+from upload_to_unity import upload_and_speak, upload_file, upload_files
+
+
+def create_test_files(output_dir, count):
+    """Crea coppie audio/lipsync finte da caricare"""
+    pairs = []
+    for i in range(count):
+        audio_path = output_dir / f"batch_{i}.mp3"
+        lipsync_path = output_dir / f"batch_{i}.json"
+        audio_path.write_bytes(b"\xff\xfb\x90\x64" + b"\x00" * 4000)
+        lipsync_path.write_text(json.dumps({
+            "metadata": {"duration": 0.5},
+            "mouthCues": [{"start": 0.0, "end": 0.5, "value": "X"}]
+        }))
+        pairs.append((str(audio_path), str(lipsync_path), f"batch_{i}"))
+    return pairs
+
+
+def test_upload_batch(num_utterances=4, latency=0.1):
+    """Verifica correttezza e guadagno di tempo degli upload in parallelo"""
+
+    output_dir = Path("./test_output")
+    output_dir.mkdir(exist_ok=True)
+    pairs = create_test_files(output_dir, num_utterances)
+
+    with UnityStubServer(latency=latency) as server:
+        print(f"\nTest 1: Upload sequenziale di {num_utterances} frasi (audio + lipsync)")
+        start_time = time.time()
+        for audio_path, lipsync_path, name in pairs:
+            assert upload_file(server.upload_url, audio_path, "audio", name)
+            assert upload_file(server.upload_url, lipsync_path, "lipsync", name)
+        sequential_time = time.time() - start_time
+        print(f"Completato in {sequential_time:.2f} secondi")
+
+        server.files.clear()
+
+        print("\nTest 2: Upload in parallelo delle stesse frasi")
+        uploads = []
+        for audio_path, lipsync_path, name in pairs:
+            uploads.append((audio_path, "audio", name))
+            uploads.append((lipsync_path, "lipsync", name))
+        start_time = time.time()
+        results = upload_files(server.upload_url, uploads, max_workers=len(uploads))
+        parallel_time = time.time() - start_time
+        print(f"Completato in {parallel_time:.2f} secondi")
+        assert all(results), "Alcuni upload in parallelo sono falliti"
+        for _, _, name in pairs:
+            assert set(server.files[name]) == {"audio", "lipsync"}, f"File mancanti per {name}"
+        assert parallel_time < sequential_time, "Gli upload in parallelo non sono più veloci"
+
+        print("\nTest 3: Upload e riproduzione in un'unica chiamata")
+        audio_path, lipsync_path, _ = pairs[0]
+        start_time = time.time()
+        assert upload_and_speak(server.upload_url, server.speak_url, audio_path, lipsync_path, "combined")
+        combined_time = time.time() - start_time
+        speak_events = [event for event in server.events if event["event"] == "speak"]
+        assert speak_events and speak_events[-1]["name"] == "combined"
+        print(f"Upload e riproduzione completati in {combined_time:.2f} secondi")
+
+        print("\nTest 4: Riproduzione di un file non caricato")
+        assert not request_speech(server.speak_url, "inesistente"), "La riproduzione di un file mancante deve fallire"
+
+    print(f"\nGuadagno degli upload in parallelo: {sequential_time - parallel_time:.2f} secondi "
+          f"({sequential_time / parallel_time:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Testa gli upload in parallelo verso un server Unity simulato")
+    parser.add_argument("--utterances", type=int, default=4, help="Numero di frasi da caricare (default: 4)")
+    parser.add_argument("--latency", type=float, default=0.1, help="Latenza simulata per richiesta in secondi (default: 0.1)")
+
+    args = parser.parse_args()
+
+    test_upload_batch(args.utterances, args.latency)
+    print("\nTest completato con successo!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Script di test per la post-elaborazione dei mouthCues (viseme_smoothing.py).
+Verifica che i cue risultanti siano contigui, che le chiusure delle labbra (A)
+non vengano eliminate, che il silenzio finale diventi un cue di riposo X e che
+i pesi per frame siano normalizzati. I cue sono costruiti a mano, non serve Rhubarb.
+
+Uso:
+    python test_viseme_smoothing.py
+"""
+
+import numpy as np
+
+from lipsync_analysis import SHAPES, SILENCE_CODE
+from viseme_smoothing import smooth_mouth_cues, viseme_weights
+
+# Cue di Rhubarb con forme di uno o due frame, una pausa e silenzio finale dopo 1.2 s
+CUES = {
+    "metadata": {"duration": 1.6},
+    "mouthCues": [
+        {"start": 0.05, "end": 0.3, "value": "B"},
+        {"start": 0.3, "end": 0.33, "value": "A"},
+        {"start": 0.33, "end": 0.36, "value": "E"},
+        {"start": 0.36, "end": 0.6, "value": "C"},
+        {"start": 0.6, "end": 0.64, "value": "F"},
+        {"start": 0.64, "end": 0.9, "value": "D"},
+        {"start": 0.95, "end": 1.2, "value": "B"}
+    ]
+}
+
+
+def check_contiguous(result, duration):
+    """Verifica che i cue coprano da 0 alla durata senza buchi né sovrapposizioni"""
+    cues = result["mouthCues"]
+    assert cues[0]["start"] == 0.0, "Il primo cue deve iniziare a 0"
+    assert cues[-1]["end"] == duration, "L'ultimo cue deve terminare alla durata dell'audio"
+    for previous, cue in zip(cues, cues[1:]):
+        assert previous["end"] == cue["start"], f"Cue non contigui: {previous} -> {cue}"
+        assert previous["value"] != cue["value"], f"Cue consecutivi con la stessa forma: {previous} -> {cue}"
+
+
+def test_viseme_smoothing():
+    """Verifica cue contigui, forme conservate, silenzio finale e pesi per frame"""
+
+    print("\nTest 1: Cue contigui e uniti")
+    result = smooth_mouth_cues(CUES)
+    check_contiguous(result, 1.6)
+    shapes = "".join(cue["value"] for cue in result["mouthCues"])
+    print(f"Forme: {''.join(cue['value'] for cue in CUES['mouthCues'])} -> {shapes}")
+    assert result["mouthCues"][0]["value"] == "X", "Il buco iniziale deve diventare un cue X"
+
+    print("\nTest 2: Le chiusure delle labbra (A) non vengono eliminate")
+    assert "A" in shapes, "Il cue A di 30 ms è stato eliminato"
+    assert "E" not in shapes and "F" not in shapes, "I cue brevi diversi da A dovevano essere assorbiti"
+    for cue in result["mouthCues"]:
+        duration = round(cue["end"] - cue["start"], 3)
+        assert duration >= 0.07 or cue["value"] == "A", f"Cue più breve della durata minima: {cue}"
+    without_keep = smooth_mouth_cues(CUES, keep_shapes="")
+    assert "A" not in "".join(cue["value"] for cue in without_keep["mouthCues"]), \
+        "Con keep_shapes vuoto anche il cue A breve va eliminato"
+
+    print("\nTest 3: Il silenzio finale diventa un cue X")
+    last, before_last = result["mouthCues"][-1], result["mouthCues"][-2]
+    assert last == {"start": 1.2, "end": 1.6, "value": "X"}, f"Silenzio finale non riempito con X: {last}"
+    assert before_last["value"] == "B" and before_last["end"] == 1.2, \
+        f"L'ultima forma è stata allungata nel silenzio: {before_last}"
+
+    print("\nTest 4: Pesi dei visemi per frame")
+    fps = 60
+    weights = viseme_weights(result, fps=fps, blend=0.06)
+    assert weights.shape == (int(np.ceil(1.6 * fps)) + 1, len(SHAPES)), f"Forma inattesa: {weights.shape}"
+    assert np.allclose(weights.sum(axis=1), 1.0, atol=1e-5), "Le righe dei pesi non sommano a 1"
+    assert (weights >= 0).all()
+    assert weights[-1, SILENCE_CODE] == 1.0, "L'ultimo frame deve essere a riposo"
+    blended = np.count_nonzero((weights > 0.01).sum(axis=1) > 1)
+    assert blended > 0, "Nessuna dissolvenza tra forme diverse"
+    print(f"{len(weights)} frame, {blended} con due forme miscelate")
+
+    print("\nTest 5: Pesi senza dissolvenza e senza cue")
+    hard = viseme_weights(result, fps=fps, blend=0)
+    assert np.array_equal(hard.sum(axis=1), np.ones(len(hard))) and set(np.unique(hard)) <= {0.0, 1.0}, \
+        "Senza dissolvenza ogni frame deve avere una sola forma"
+    empty = viseme_weights({"metadata": {"duration": 0.5}, "mouthCues": []}, fps=fps)
+    assert (empty[:, SILENCE_CODE] == 1.0).all() and np.allclose(empty.sum(axis=1), 1.0), \
+        "Senza cue tutti i frame devono essere a riposo"
+
+
+def main():
+    test_viseme_smoothing()
+    print("\nTest completato con successo!")
+
+
+if __name__ == "__main__":
+    main()
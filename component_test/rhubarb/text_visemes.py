@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Generazione dei dati di sincronizzazione labiale a partire dall'allineamento
+per carattere restituito da ElevenLabs (convert_text_to_speech_with_timing),
+senza eseguire Rhubarb sull'audio.
+
+Ogni carattere viene convertito in un fonema con regole grafema→fonema per
+l'italiano e poi nella forma labiale di Rhubarb corrispondente (A-H, X).
+L'output ha lo stesso formato JSON di Rhubarb (metadata + mouthCues), quindi
+può essere letto da analyze_output e caricato su Unity come un normale
+file di lipsync.
+
+Uso:
+    python text_visemes.py alignment.json [--output output_visemes] [--format json|xml|tsv]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from lipsync_cache import write_mouth_cues
+
+# Forme labiali di Rhubarb:
+#   A: labbra chiuse (P, B, M)
+#   B: bocca leggermente aperta, denti serrati (gran parte delle consonanti, I)
+#   C: bocca aperta (E)
+#   D: bocca spalancata (A)
+#   E: bocca leggermente arrotondata (O)
+#   F: labbra protruse (U, W)
+#   G: denti superiori sul labbro inferiore (F, V)
+#   H: lingua sollevata (L)
+#   X: riposo
+VOWEL_SHAPES = {
+    "a": "D", "à": "D", "á": "D",
+    "e": "C", "è": "C", "é": "C",
+    "i": "B", "ì": "B", "í": "B", "y": "B",
+    "o": "E", "ò": "E", "ó": "E",
+    "u": "F", "ù": "F", "ú": "F",
+}
+
+CONSONANT_SHAPES = {
+    "p": "A", "b": "A", "m": "A",
+    "f": "G", "v": "G",
+    "l": "H",
+    "w": "F",
+}
+
+# Consonanti non elencate (t, d, n, s, z, r, c, g, k, q, x, j) e cifre: denti serrati
+DEFAULT_CONSONANT_SHAPE = "B"
+
+# Caratteri che interrompono il parlato
+PAUSE_CHARACTERS = set(".,;:!?…()[]\"«»—–\n")
+
+VOWELS = set(VOWEL_SHAPES)
+FRONT_VOWELS = set("eèéiìí")
+
+
+def character_shapes(text):
+    """
+    Applica le regole grafema→fonema dell'italiano e restituisce per ogni
+    carattere la forma labiale, "X" per le pause oppure None per i caratteri muti.
+
+    Args:
+        text (str or list): Testo (o lista di caratteri) dell'allineamento
+
+    Returns:
+        list: Una forma labiale (o None) per ogni carattere
+    """
+    chars = [c.lower() for c in text]
+    shapes = []
+
+    for i, c in enumerate(chars):
+        prev_c = chars[i - 1] if i > 0 else ""
+        next_c = chars[i + 1] if i + 1 < len(chars) else ""
+
+        if c in PAUSE_CHARACTERS:
+            shapes.append("X")
+        elif c.isspace() or c in "'’-":
+            # Lo spazio tra le parole non chiude la bocca, a meno di una pausa lunga
+            shapes.append(None)
+        elif c == "h":
+            # "h" è sempre muta (ch, gh, ho, ha...)
+            shapes.append(None)
+        elif c in VOWELS:
+            if c == "i" and prev_c in "cg" and next_c in VOWELS and next_c not in FRONT_VOWELS:
+                # "cia", "gio", "sciu": la i serve solo a rendere dolce la consonante
+                shapes.append(None)
+            elif c == "i" and prev_c == "l" and i >= 2 and chars[i - 2] == "g" and next_c in VOWELS:
+                # "glia", "glie": suono palatale unico, resta sulla forma della l
+                shapes.append(None)
+            elif c == "u" and prev_c in "qg" and next_c in VOWELS:
+                # "qua", "guo": semivocale /w/, labbra protruse
+                shapes.append("F")
+            else:
+                shapes.append(VOWEL_SHAPES[c])
+        elif c.isalpha() or c.isdigit():
+            if c == "g" and next_c == "n":
+                # "gn" è un'unica nasale palatale: nessuna forma separata per la g
+                shapes.append(None)
+            elif c == "g" and next_c == "l" and i + 2 < len(chars) and chars[i + 2] == "i":
+                # "gli": la g non si pronuncia separatamente
+                shapes.append(None)
+            else:
+                shapes.append(CONSONANT_SHAPES.get(c, DEFAULT_CONSONANT_SHAPE))
+        else:
+            shapes.append(None)
+
+    return shapes
+
+
+def alignment_to_mouth_cues(alignment, min_pause=0.15, precision=2):
+    """
+    Converte l'allineamento per carattere di ElevenLabs in mouthCues di Rhubarb.
+
+    Args:
+        alignment (dict): Dizionario con "characters", "character_start_times_seconds"
+            e "character_end_times_seconds"
+        min_pause (float): Durata minima in secondi perché uno spazio diventi una pausa (X)
+        precision (int): Numero di decimali dei tempi, come nell'output di Rhubarb
+
+    Returns:
+        dict: {"metadata": {"duration": float}, "mouthCues": [{"start", "end", "value"}]}
+    """
+    characters = alignment.get("characters", [])
+    starts = alignment.get("character_start_times_seconds", [])
+    ends = alignment.get("character_end_times_seconds", [])
+    shapes = character_shapes(characters)
+
+    segments = []
+    for shape, start, end in zip(shapes, starts, ends):
+        if shape is None:
+            # Caratteri muti: pausa se abbastanza lunghi, altrimenti prolungano la forma precedente
+            if end - start >= min_pause:
+                shape = "X"
+            elif segments:
+                segments[-1][2] = max(segments[-1][2], end)
+                continue
+            else:
+                continue
+        segments.append([shape, start, end])
+
+    cues = []
+    cursor = 0.0
+    for shape, start, end in segments:
+        start = max(start, cursor)
+        if start > cursor:
+            # Buco nell'allineamento: bocca a riposo
+            cues.append({"start": cursor, "end": start, "value": "X"})
+        if end <= start:
+            continue
+        cues.append({"start": start, "end": end, "value": shape})
+        cursor = end
+
+    duration = max(ends) if ends else 0.0
+    if cursor < duration:
+        cues.append({"start": cursor, "end": duration, "value": "X"})
+    # Come Rhubarb, l'ultima forma è sempre la bocca a riposo
+    if cues and cues[-1]["value"] != "X":
+        cues.append({"start": cues[-1]["end"], "end": cues[-1]["end"], "value": "X"})
+
+    # Arrotonda e unisce le forme consecutive uguali (es. doppie consonanti)
+    merged = []
+    for cue in cues:
+        start = round(cue["start"], precision)
+        end = round(cue["end"], precision)
+        if merged and merged[-1]["value"] == cue["value"]:
+            merged[-1]["end"] = end
+        elif merged and start == end and cue is not cues[-1]:
+            continue
+        else:
+            merged.append({"start": start, "end": end, "value": cue["value"]})
+
+    return {"metadata": {"duration": round(duration, precision)}, "mouthCues": merged}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera i dati di lipsync dall'allineamento per carattere di ElevenLabs, senza Rhubarb")
+    parser.add_argument("alignment_file", help="File JSON con l'allineamento (o il risultato completo di convert_text_to_speech_with_timing)")
+    parser.add_argument("--output", help="Prefisso del file di output (senza estensione)", default="output_visemes")
+    parser.add_argument("--format", choices=["json", "xml", "tsv"], default="json",
+                        help="Formato di output (default: json)")
+    parser.add_argument("--min_pause", type=float, default=0.15,
+                        help="Durata minima in secondi di uno spazio per chiudere la bocca (default: 0.15)")
+    parser.add_argument("--sound_file", default="", help="Nome del file audio da riportare nei metadati")
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.alignment_file):
+        print(f"File di allineamento non trovato: {args.alignment_file}")
+        sys.exit(1)
+
+    with open(args.alignment_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    # Accetta sia l'allineamento puro sia il dizionario restituito da ElevenLabsTTS
+    alignment = data.get("alignment", data)
+    if "characters" not in alignment:
+        print("Il file non contiene un allineamento per carattere valido")
+        sys.exit(1)
+
+    result = alignment_to_mouth_cues(alignment, min_pause=args.min_pause)
+    output_file = f"{args.output}.{args.format}"
+    write_mouth_cues(result, output_file, args.format, sound_file=args.sound_file)
+
+    print(f"Generati {len(result['mouthCues'])} mouth cues in {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Server HTTP locale che simula gli endpoint di RhubarbLipSyncManager in Unity:
+- POST /avatar/upload (multipart/form-data con fileName, fileType e file)
+- GET  /avatar/speak?file=nome
+
+I file ricevuti sono tenuti in memoria; la riproduzione ha successo solo se
+per il nome richiesto sono stati caricati sia l'audio sia il lipsync, come in
+Unity. Una latenza configurabile per richiesta permette di misurare il
+guadagno degli upload in parallelo senza avviare Unity.
+
+Uso:
+    python unity_stub_server.py [--port 8080] [--latency 0.05]
+"""
+
+import argparse
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def parse_multipart(content_type, body):
+    """Estrae campi e file da un corpo multipart/form-data"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    fields = {}
+    files = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        filename = part.get_param("filename", header="content-disposition")
+        payload = part.get_payload(decode=True)
+        if filename is not None:
+            files[name] = (filename, payload)
+        else:
+            fields[name] = payload.decode("utf-8")
+    return fields, files
+
+
+class UnityStubHandler(BaseHTTPRequestHandler):
+    """Gestisce le richieste verso gli endpoint simulati di Unity"""
+
+    # Configurati da UnityStubServer
+    latency = 0.0
+    files = None
+    events = None
+    lock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _record(self, event, **details):
+        with self.lock:
+            self.events.append(dict(event=event, time=time.time(), **details))
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/avatar/upload":
+            self._send_json({"status": "error", "message": "Endpoint non trovato"}, status=404)
+            return
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+
+        try:
+            fields, files = parse_multipart(self.headers.get("Content-Type", ""), body)
+            file_name = fields["fileName"]
+            file_type = fields["fileType"]
+            _, data = files["file"]
+        except (KeyError, ValueError) as e:
+            self._send_json({"status": "error", "message": f"Richiesta non valida: {e}"}, status=400)
+            return
+
+        with self.lock:
+            self.files.setdefault(file_name, {})[file_type] = data
+        self._record("upload", name=file_name, type=file_type, size=len(data))
+        self._send_json({"status": "success", "message": f"File {file_name} ({file_type}) caricato"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/avatar/speak":
+            self._send_json({"status": "error", "message": "Endpoint non trovato"}, status=404)
+            return
+
+        time.sleep(self.latency)
+        file_name = parse_qs(url.query).get("file", [""])[0]
+        with self.lock:
+            available = self.files.get(file_name, {})
+            ready = "audio" in available and "lipsync" in available
+
+        if not ready:
+            self._send_json({"status": "error", "message": f"File mancanti per '{file_name}'"})
+            return
+
+        self._record("speak", name=file_name)
+        self._send_json({"status": "success", "message": f"Riproduzione di {file_name} avviata"})
+
+
+class UnityStubServer:
+    """Avvia il server simulato in un thread separato, utilizzabile come context manager"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        handler = type("ConfiguredUnityStubHandler", (UnityStubHandler,), {
+            "latency": latency,
+            "files": {},
+            "events": [],
+            "lock": threading.Lock()
+        })
+        self.handler = handler
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/avatar"
+
+    @property
+    def upload_url(self):
+        return f"{self.base_url}/upload"
+
+    @property
+    def speak_url(self):
+        return f"{self.base_url}/speak"
+
+    @property
+    def files(self):
+        return self.handler.files
+
+    @property
+    def events(self):
+        return self.handler.events
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server locale che simula gli endpoint /avatar/upload e /avatar/speak di Unity")
+    parser.add_argument("--host", default="127.0.0.1", help="Indirizzo di ascolto (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Porta di ascolto (default: 8080)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latenza simulata per richiesta in secondi (default: 0)")
+
+    args = parser.parse_args()
+
+    server = UnityStubServer(args.host, args.port, args.latency)
+    print(f"Server Unity simulato in ascolto su {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer interrotto dall'utente")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
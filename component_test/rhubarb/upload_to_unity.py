@@ -2,15 +2,24 @@
 """
 Script per caricare file audio o JSON in Unity attraverso l'endpoint HTTP
 Uso: python upload_to_unity.py --file path/to/file --type audio|lipsync [--name customname] [--url http://localhost:8080/avatar/upload]
+     python upload_to_unity.py --audio audio.mp3 --lipsync lipsync.json [--name customname] [--speak]
 """
 
 import argparse
 import requests
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-def upload_file(url, file_path, file_type, file_name=None):
+# rhubarb_client aggiunge COMMON_DIR (component_test/common) a sys.path
+from rhubarb_client import COMMON_DIR, request_speech
+
+from http_client import get_session
+
+def upload_file(url, file_path, file_type, file_name=None, session=None):
     """Carica un singolo file a Unity usando multipart/form-data"""
+    session = session or get_session()
+
     # Verifica che il file esista
     if not os.path.exists(file_path):
         print(f"Errore: File non trovato: {file_path}")
@@ -40,7 +49,7 @@ def upload_file(url, file_path, file_type, file_name=None):
 
     try:
         # Invia la richiesta POST
-        response = requests.post(url, data=form_data, files=files)
+        response = session.post(url, data=form_data, files=files)
 
         # Verifica la risposta
         if response.status_code == 200:
@@ -63,20 +72,84 @@ def upload_file(url, file_path, file_type, file_name=None):
 
     return False
 
+def upload_files(url, uploads, max_workers=4, session=None):
+    """
+    Carica più file a Unity in parallelo, riutilizzando le connessioni della sessione condivisa.
+
+    Args:
+        url: URL dell'endpoint di upload
+        uploads: Lista di tuple (file_path, file_type) o (file_path, file_type, file_name)
+        max_workers: Numero massimo di upload contemporanei
+        session: Sessione HTTP da usare (default: sessione condivisa)
+
+    Returns:
+        list: Esito (True/False) di ciascun upload, nello stesso ordine di uploads
+    """
+    session = session or get_session()
+    if not uploads:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(uploads))) as executor:
+        futures = [executor.submit(upload_file, url, *upload, session=session) for upload in uploads]
+        return [future.result() for future in futures]
+
+def upload_utterance(url, audio_path, lipsync_path, file_name=None, session=None):
+    """
+    Carica in parallelo l'audio e il lipsync di una frase con lo stesso nome.
+
+    Returns:
+        bool: True se entrambi gli upload hanno avuto successo
+    """
+    if file_name is None:
+        file_name = os.path.splitext(os.path.basename(audio_path))[0]
+    results = upload_files(url, [(audio_path, 'audio', file_name), (lipsync_path, 'lipsync', file_name)],
+                           max_workers=2, session=session)
+    return all(results)
+
+def upload_and_speak(upload_url, speak_url, audio_path, lipsync_path, file_name=None, session=None):
+    """
+    Carica audio e lipsync in parallelo e, se entrambi vanno a buon fine, ne richiede la riproduzione.
+
+    Returns:
+        bool: True se upload e richiesta di riproduzione hanno avuto successo
+    """
+    if file_name is None:
+        file_name = os.path.splitext(os.path.basename(audio_path))[0]
+    if not upload_utterance(upload_url, audio_path, lipsync_path, file_name, session=session):
+        return False
+    return request_speech(speak_url, file_name, session=session)
+
 def main():
     # Configurazione degli argomenti da linea di comando
     parser = argparse.ArgumentParser(description='Carica un file in Unity')
-    parser.add_argument('--file', required=True, help='Percorso al file da caricare')
-    parser.add_argument('--type', required=True, choices=['audio', 'lipsync'],
+    parser.add_argument('--file', help='Percorso al file da caricare')
+    parser.add_argument('--type', choices=['audio', 'lipsync'],
                         help='Tipo di file (audio o lipsync)')
+    parser.add_argument('--audio', help='File audio da caricare insieme a --lipsync')
+    parser.add_argument('--lipsync', help='File di lipsync da caricare insieme a --audio')
+    parser.add_argument('--speak', action='store_true',
+                        help='Dopo l\'upload di --audio e --lipsync, richiede la riproduzione')
+    parser.add_argument('--speak_url', default='http://localhost:8080/avatar/speak',
+                        help='URL dell\'endpoint speak (default: http://localhost:8080/avatar/speak)')
     parser.add_argument('--name', help='Nome personalizzato per il file (default: nome del file senza estensione)')
     parser.add_argument('--url', default='http://localhost:8080/avatar/upload',
                         help='URL dell\'endpoint di upload (default: http://localhost:8080/avatar/upload)')
 
     args = parser.parse_args()
 
-    # Carica il file
-    success = upload_file(args.url, args.file, args.type, args.name)
+    if args.audio or args.lipsync:
+        if not (args.audio and args.lipsync):
+            parser.error('--audio e --lipsync vanno specificati insieme')
+        # Carica audio e lipsync in parallelo, eventualmente avviando la riproduzione
+        if args.speak:
+            success = upload_and_speak(args.url, args.speak_url, args.audio, args.lipsync, args.name)
+        else:
+            success = upload_utterance(args.url, args.audio, args.lipsync, args.name)
+    else:
+        if not (args.file and args.type):
+            parser.error('specificare --file e --type, oppure --audio e --lipsync')
+        # Carica il file
+        success = upload_file(args.url, args.file, args.type, args.name)
 
     # Esci con codice appropriato
     sys.exit(0 if success else 1)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Post-elaborazione dei mouthCues prima dell'invio a Unity.
+
+I cue di Rhubarb (e quelli ricavati dall'allineamento di ElevenLabs) contengono
+spesso forme labiali di poche decine di millisecondi: a 30-60 fps durano uno o
+due frame e producono uno sfarfallio della bocca invece di un movimento
+naturale. Qui i cue vengono:
+
+1. resi contigui (i buchi diventano riposo X) e uniti se consecutivi con la stessa forma;
+2. eliminati se più brevi della soglia di unione, assorbiti dal vicino più lungo;
+3. allungati fino alla durata minima prendendo tempo dai vicini che ne hanno
+   in eccesso (quelli che non possono essere allungati vengono assorbiti).
+
+Le chiusure delle labbra (A: P, B, M) sono brevi ma ben visibili, quindi per
+default non vengono mai eliminate, solo allungate.
+
+Il risultato ha lo stesso formato dell'output di Rhubarb, con meno cue. In
+alternativa vengono calcolati i pesi dei visemi già miscelati per ogni frame:
+ogni peso è la frazione di una finestra di coarticolazione centrata sul frame
+occupata da quella forma, così tra due forme c'è una dissolvenza lineare.
+
+Uso:
+    python viseme_smoothing.py output_phon.json [--output output_smooth] [--format json|xml|tsv]
+        [--merge_threshold 0.05] [--min_duration 0.07] [--keep_shapes A]
+        [--fps 60 --blend 0.06 --weights output_weights.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from lipsync_analysis import SHAPES, SILENCE_CODE, MouthCueArrays, load_cues, summarize
+from lipsync_cache import atomic_write, write_mouth_cues
+
+
+def make_contiguous(cues):
+    """
+    Ordina i cue, elimina quelli vuoti, riempie i buchi con il riposo (X) e unisce
+    i cue consecutivi con la stessa forma. Il risultato copre da 0 alla durata totale.
+    """
+    duration = cues.total_duration
+    keep = cues.ends > cues.starts
+    order = np.argsort(cues.starts[keep], kind="stable")
+    starts, ends, codes = cues.starts[keep][order], cues.ends[keep][order], cues.codes[keep][order]
+    if not len(codes):
+        return MouthCueArrays([0.0], [duration], [SILENCE_CODE], duration) if duration else cues
+
+    # Le sovrapposizioni vengono tagliate all'inizio del cue successivo
+    ends = np.append(np.minimum(ends[:-1], starts[1:]), ends[-1])
+    # Silenzio finale: nuovo cue X invece di allungare l'ultima forma
+    if duration > ends[-1]:
+        starts, ends, codes = np.append(starts, ends[-1]), np.append(ends, duration), np.append(codes, SILENCE_CODE)
+    # Buchi, compreso quello iniziale: nuovi cue X
+    previous_ends = np.append(0.0, ends[:-1])
+    gaps = np.flatnonzero(starts > previous_ends)
+    ends = np.insert(ends, gaps, starts[gaps])
+    starts = np.insert(starts, gaps, previous_ends[gaps])
+    codes = np.insert(codes, gaps, SILENCE_CODE)
+    return _merge_runs(starts, ends, codes, max(duration, float(ends[-1])))
+
+
+def _merge_runs(starts, ends, codes, duration):
+    """Unisce i cue contigui consecutivi con la stessa forma"""
+    first = np.flatnonzero(np.append(True, codes[1:] != codes[:-1]))
+    last = np.append(first[1:] - 1, len(codes) - 1)
+    return MouthCueArrays(starts[first], ends[last], codes[first], duration)
+
+
+def merge_short_cues(cues, threshold=0.05, keep_shapes="A"):
+    """
+    Elimina i cue più brevi della soglia, partendo dal più breve: il suo tempo va
+    al vicino più lungo. I cue devono essere contigui (vedi make_contiguous).
+
+    Args:
+        keep_shapes (str): Forme labiali che non vengono mai eliminate
+    """
+    starts, ends, codes = cues.starts.copy(), cues.ends.copy(), cues.codes.copy()
+    kept_codes = [SHAPES.index(shape) for shape in keep_shapes]
+    while len(codes) > 1:
+        durations = ends - starts
+        candidates = np.where(np.isin(codes, kept_codes), np.inf, durations)
+        i = int(np.argmin(candidates))
+        if candidates[i] >= threshold:
+            break
+        if i == 0 or (i < len(codes) - 1 and durations[i + 1] > durations[i - 1]):
+            starts[i + 1] = starts[i]
+        else:
+            ends[i - 1] = ends[i]
+        starts, ends, codes = np.delete(starts, i), np.delete(ends, i), np.delete(codes, i)
+        # I vicini possono ora avere la stessa forma
+        merged = _merge_runs(starts, ends, codes, cues.duration)
+        starts, ends, codes = merged.starts, merged.ends, merged.codes
+    return MouthCueArrays(starts, ends, codes, cues.duration)
+
+
+def enforce_min_duration(cues, min_duration=0.07, keep_shapes="A"):
+    """
+    Allunga i cue più brevi di min_duration spostando i confini verso i vicini che
+    hanno tempo in eccesso; i cue che restano troppo brevi vengono assorbiti.
+    """
+    starts, ends = cues.starts.copy(), cues.ends.copy()
+    for i in np.flatnonzero(ends - starts < min_duration):
+        need = min_duration - (ends[i] - starts[i])
+        if i + 1 < len(starts):
+            take = min(need, max(0.0, ends[i + 1] - starts[i + 1] - min_duration))
+            ends[i] += take
+            starts[i + 1] += take
+            need -= take
+        if i > 0 and need > 0:
+            take = min(need, max(0.0, ends[i - 1] - starts[i - 1] - min_duration))
+            starts[i] -= take
+            ends[i - 1] -= take
+    # Tolleranza per gli errori di arrotondamento dei tempi
+    return merge_short_cues(MouthCueArrays(starts, ends, cues.codes, cues.duration), min_duration - 1e-6, keep_shapes)
+
+
+def smooth_mouth_cues(result, merge_threshold=0.05, min_duration=0.07, keep_shapes="A"):
+    """
+    Applica l'intera post-elaborazione a un risultato di Rhubarb.
+
+    Args:
+        result (dict): Risultato nel formato di parse_mouth_cues()
+        merge_threshold (float): I cue più brevi (in secondi) vengono eliminati
+        min_duration (float): Durata minima (in secondi) dei cue rimasti
+        keep_shapes (str): Forme labiali che non vengono mai eliminate (default: le chiusure A)
+
+    Returns:
+        dict: Risultato nel formato di parse_mouth_cues(), con cue contigui
+    """
+    cues = make_contiguous(MouthCueArrays.from_result(result))
+    if len(cues):
+        cues = enforce_min_duration(merge_short_cues(cues, merge_threshold, keep_shapes), min_duration, keep_shapes)
+    cues.starts, cues.ends = cues.starts.round(3), cues.ends.round(3)
+    return cues.to_result()
+
+
+def viseme_weights(result, fps=60, blend=0.06):
+    """
+    Calcola i pesi miscelati delle forme labiali per ogni frame.
+
+    Il peso di una forma nel frame al tempo t è la frazione della finestra
+    [t - blend/2, t + blend/2] occupata da quella forma: ogni riga somma a 1 e a
+    ogni cambio di forma c'è una dissolvenza lineare lunga blend secondi.
+
+    Returns:
+        numpy.ndarray: Pesi float32 di forma (frame, len(SHAPES)), colonne nell'ordine di SHAPES
+    """
+    cues = make_contiguous(MouthCueArrays.from_result(result))
+    duration = cues.total_duration
+    times = np.arange(int(np.ceil(duration * fps)) + 1) / fps
+    if not len(cues):
+        weights = np.zeros((len(times), len(SHAPES)), dtype=np.float32)
+        weights[:, SILENCE_CODE] = 1.0
+        return weights
+
+    if blend <= 0:
+        index = np.clip(np.searchsorted(cues.starts, times, side="right") - 1, 0, len(cues) - 1)
+        return np.eye(len(SHAPES), dtype=np.float32)[cues.codes[index]]
+
+    # Tempo cumulativo di ogni forma ai confini dei cue, interpolato linearmente in mezzo
+    boundaries = np.append(cues.starts[0], cues.ends)
+    occupancy = np.zeros((len(cues) + 1, len(SHAPES)))
+    occupancy[np.arange(1, len(cues) + 1), cues.codes] = cues.durations
+    cumulative = np.cumsum(occupancy, axis=0)
+
+    low = np.clip(times - blend / 2, 0.0, duration)
+    high = np.clip(times + blend / 2, 0.0, duration)
+    covered = np.stack([np.interp(high, boundaries, cumulative[:, code]) -
+                        np.interp(low, boundaries, cumulative[:, code]) for code in range(len(SHAPES))], axis=1)
+    return (covered / np.maximum(high - low, 1e-9)[:, None]).astype(np.float32)
+
+
+def write_viseme_weights(weights, output_file, fps):
+    """
+    Salva i pesi per frame in JSON, con i pesi in un unico array piatto (riga per riga),
+    leggibile da JsonUtility di Unity.
+    """
+    data = {
+        "fps": fps,
+        "shapes": SHAPES,
+        "frameCount": int(len(weights)),
+        "weights": np.round(weights.astype(np.float64), 3).ravel().tolist()
+    }
+    atomic_write(output_file, json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post-elaborazione dei mouthCues: unione dei cue brevi, durata minima e pesi per frame")
+    parser.add_argument("input_file", help="Output di Rhubarb (json, tsv, xml)")
+    parser.add_argument("--output", default="output_smooth", help="Prefisso del file di output (senza estensione)")
+    parser.add_argument("--format", choices=["json", "xml", "tsv"], default="json", help="Formato di output (default: json)")
+    parser.add_argument("--merge_threshold", type=float, default=0.05,
+                        help="Durata sotto cui un cue viene eliminato, in secondi (default: 0.05)")
+    parser.add_argument("--min_duration", type=float, default=0.07,
+                        help="Durata minima dei cue rimasti, in secondi (default: 0.07)")
+    parser.add_argument("--keep_shapes", default="A",
+                        help="Forme labiali da non eliminare mai (default: A, le chiusure delle labbra)")
+    parser.add_argument("--weights", help="Salva anche i pesi dei visemi per frame in questo file JSON")
+    parser.add_argument("--fps", type=int, default=60, help="Frame al secondo dei pesi (default: 60)")
+    parser.add_argument("--blend", type=float, default=0.06,
+                        help="Durata della dissolvenza tra due forme, in secondi (default: 0.06)")
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.input_file):
+        print(f"File di input non trovato: {args.input_file}")
+        sys.exit(1)
+
+    try:
+        original = load_cues(args.input_file)
+    except ValueError as e:
+        print(f"Errore durante la lettura dell'output: {e}")
+        sys.exit(1)
+
+    result = smooth_mouth_cues(original.to_result(), args.merge_threshold, args.min_duration, args.keep_shapes)
+    output_file = f"{args.output}.{args.format}"
+    write_mouth_cues(result, output_file, args.format)
+
+    before, after = summarize(original), summarize(MouthCueArrays.from_result(result))
+    print(f"Mouth cues: {before['cues']} -> {after['cues']} "
+          f"(cue più brevi di 60 ms: {before['short_cues']} -> {after['short_cues']})")
+    print(f"Output salvato in: {output_file}")
+
+    if args.weights:
+        weights = viseme_weights(result, args.fps, args.blend)
+        write_viseme_weights(weights, args.weights, args.fps)
+        print(f"Pesi di {len(weights)} frame a {args.fps} fps salvati in: {args.weights}")
+
+
+if __name__ == "__main__":
+    main()
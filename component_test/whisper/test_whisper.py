@@ -6,61 +6,140 @@ che è più leggero e funziona anche su hardware con risorse limitate.
 
 import argparse
 import os
+import sys
 import logging
+import numpy as np
 import torch
 import time
 from transformers import WhisperProcessor, WhisperForConditionalGeneration
 
+# Rende importabili i moduli condivisi in component_test/common
+COMMON_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from audio_loader import load_audio
+from feature_cache import enable_feature_cache
+from inference_profile import PROFILES, apply_profile, configure_threads, load_kwargs, model_dtype, resolve_profile
+
 # Configura logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def transcribe_audio(audio_file, output_file, model_size="small"):
+# Frequenza di campionamento attesa da Whisper
+WHISPER_SAMPLE_RATE = 16000
+
+# Cartella con il registratore (component_test/qwen), usata da --mic
+QWEN_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "qwen"))
+
+def load_whisper_model(model_size="small", device=None, profile="fp32", num_threads=None, compile_model=False):
     """
-    Trascrive un file audio usando Whisper e salva la trascrizione in un file.
+    Carica il modello Whisper e il processor.
 
     Args:
-        audio_file (str): Percorso del file audio
-        output_file (str): Percorso dove salvare la trascrizione
         model_size (str): Dimensione del modello Whisper (tiny, base, small, medium, large)
+        device (str, optional): Dispositivo da usare, default è cuda se disponibile altrimenti cpu
+        profile (str): Profilo di inferenza (fp32, int8, bf16, fp16), vedi inference_profile.py
+        num_threads (int, optional): Thread di PyTorch per l'inferenza su CPU
+        compile_model (bool): Se True compila il forward con torch.compile
+
+    Returns:
+        tuple: (processor, model, device)
     """
-    try:
-        # Scegli il dispositivo adatto
+    # Scegli il dispositivo adatto
+    if device is None:
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        logger.info(f"Utilizzo del dispositivo: {device}")
+    logger.info(f"Utilizzo del dispositivo: {device}")
+
+    # Carica il modello Whisper e il processor
+    model_name = f"openai/whisper-{model_size}"
+    logger.info(f"Caricamento del modello {model_name}...")
+
+    profile = resolve_profile(profile, device)
+    configure_threads(num_threads)
+    logger.info(f"Profilo di inferenza: {profile}")
+
+    processor = WhisperProcessor.from_pretrained(model_name)
+    model = WhisperForConditionalGeneration.from_pretrained(model_name, **load_kwargs(profile)).to(device)
+    model = apply_profile(model, profile, compile_model)
+
+    return processor, model, device
+
+def transcribe_array(audio_data, processor, model, device):
+    """
+    Trascrive un array audio mono a 16 kHz con un modello già caricato.
+
+    Args:
+        audio_data (numpy.ndarray): Campioni audio float32 a 16 kHz
+        processor (WhisperProcessor): Processor di Whisper
+        model (WhisperForConditionalGeneration): Modello Whisper
+        device (str): Dispositivo del modello
+
+    Returns:
+        str: Testo trascritto
+    """
+    return transcribe_arrays([audio_data], processor, model, device)[0]
 
-        # Carica il modello Whisper e il processor
-        model_name = f"openai/whisper-{model_size}"
-        logger.info(f"Caricamento del modello {model_name}...")
+def transcribe_arrays(audio_arrays, processor, model, device):
+    """
+    Trascrive più array audio in un'unica chiamata a generate: le feature
+    log-mel vengono riempite alla finestra di 30 s e impilate in un batch.
+
+    Args:
+        audio_arrays (list): Array float32 a 16 kHz
+        processor, model, device: Modello caricato con load_whisper_model()
+
+    Returns:
+        list: Testi trascritti, nello stesso ordine degli array
+    """
+    if not audio_arrays:
+        return []
 
-        processor = WhisperProcessor.from_pretrained(model_name)
-        model = WhisperForConditionalGeneration.from_pretrained(model_name).to(device)
+    input_features = processor(list(audio_arrays), sampling_rate=WHISPER_SAMPLE_RATE,
+                               return_tensors="pt").input_features.to(device, dtype=model_dtype(model))
 
-        # Importa librosa per caricare l'audio
-        import librosa
+    with torch.no_grad():
+        predicted_ids = model.generate(input_features)
+
+    return processor.batch_decode(predicted_ids, skip_special_tokens=True)
+
+def transcribe_audio(audio_file, output_file, model_size="small", processor=None, model=None, device=None):
+    """
+    Trascrive un file audio usando Whisper e salva la trascrizione in un file.
 
-        logger.info(f"Caricamento del file audio {audio_file}...")
-        # Carica l'audio con librosa
-        audio_data, sampling_rate = librosa.load(audio_file, sr=16000)
+    Args:
+        audio_file (str or numpy.ndarray): Percorso del file audio, oppure campioni float32
+            mono a 16 kHz già in memoria (es. da record_array), senza passare da un file
+        output_file (str): Percorso dove salvare la trascrizione
+        model_size (str): Dimensione del modello Whisper (tiny, base, small, medium, large)
+        processor, model, device (optional): Modello già caricato con load_whisper_model(),
+            per evitare di ricaricarlo a ogni chiamata
+    """
+    try:
+        if processor is None or model is None:
+            processor, model, device = load_whisper_model(model_size, device)
 
-        # Prepara l'input per il modello
-        input_features = processor(audio_data, sampling_rate=16000, return_tensors="pt").input_features.to(device)
+        if isinstance(audio_file, np.ndarray):
+            audio_data = audio_file.astype(np.float32, copy=False)
+            logger.info(f"Audio in memoria: {len(audio_data) / WHISPER_SAMPLE_RATE:.2f} secondi")
+        else:
+            logger.info(f"Caricamento del file audio {audio_file}...")
+            audio_data, sampling_rate = load_audio(audio_file, sr=WHISPER_SAMPLE_RATE)
 
         # Genera la trascrizione
         logger.info("Generazione della trascrizione...")
         start_time = time.time()
 
-        with torch.no_grad():
-            predicted_ids = model.generate(input_features)
+        if len(audio_data) > 30 * WHISPER_SAMPLE_RATE:
+            # Oltre la finestra di 30 s il processor troncherebbe l'audio: trascrizione a finestre
+            from whisper_longform import transcribe_long
 
-        # Decodifica la trascrizione
-        transcription = processor.batch_decode(predicted_ids, skip_special_tokens=True)
+            transcription_text, _ = transcribe_long(audio_data, processor, model, device)
+        else:
+            transcription_text = transcribe_array(audio_data, processor, model, device)
         end_time = time.time()
 
         logger.info(f"Trascrizione generata in {end_time - start_time:.2f} secondi")
-
-        # Estrai la trascrizione dal batch
-        transcription_text = transcription[0]
         logger.info(f"Trascrizione: {transcription_text}")
 
         # Salva la trascrizione nel file di output
@@ -79,23 +158,81 @@ def transcribe_audio(audio_file, output_file, model_size="small"):
 
 def main():
     parser = argparse.ArgumentParser(description='Trascrizione audio con Whisper')
-    parser.add_argument('-a', '--audio', type=str, required=True,
+    parser.add_argument('-a', '--audio', type=str,
                         help='Percorso del file audio da trascrivere')
+    parser.add_argument('--mic', action='store_true',
+                        help='Registra dal microfono e trascrive direttamente dalla memoria, al posto di --audio')
+    parser.add_argument('-d', '--duration', type=float,
+                        help='Con --mic, durata della registrazione in secondi (default: fino alla fine della frase)')
+    parser.add_argument('--save_audio', type=str,
+                        help='Con --mic, salva anche la registrazione come MP3 (in background)')
     parser.add_argument('-o', '--output', type=str, default='whisper_transcript.txt',
                         help='Nome del file di output per la trascrizione (default: whisper_transcript.txt)')
     parser.add_argument('-m', '--model', type=str, default="small",
                         choices=["tiny", "base", "small", "medium", "large"],
                         help='Dimensione del modello Whisper da utilizzare (default: small)')
+    parser.add_argument('--profile', choices=PROFILES, default="fp32",
+                        help='Profilo di inferenza: fp32, int8 (quantizzazione dinamica), bf16, fp16 su GPU (default: fp32)')
+    parser.add_argument('--threads', type=int, help='Numero di thread di PyTorch (default: automatico)')
+    parser.add_argument('--compile', action='store_true', help='Compila il modello con torch.compile')
+    parser.add_argument('--feature_cache', type=str,
+                        help='Directory della cache delle feature audio (log-mel) tra esecuzioni successive')
+    parser.add_argument('-s', '--server', type=str,
+                        help='URL del servizio Whisper residente (es. http://localhost:8090); evita di caricare il modello')
 
     args = parser.parse_args()
 
+    def load_model():
+        processor, model, device = load_whisper_model(args.model, profile=args.profile, num_threads=args.threads,
+                                                      compile_model=args.compile)
+        if args.feature_cache:
+            enable_feature_cache(processor, args.feature_cache)
+        return processor, model, device
+
+    if args.mic:
+        if QWEN_DIR not in sys.path:
+            sys.path.insert(0, QWEN_DIR)
+        from record_mic import record_array, save_mp3_async
+
+        audio_data = record_array(args.duration, WHISPER_SAMPLE_RATE)
+        export_thread = save_mp3_async(audio_data, args.save_audio, WHISPER_SAMPLE_RATE) if args.save_audio else None
+        try:
+            if args.server:
+                from whisper_server import transcribe_remote
+
+                result = transcribe_remote(args.server, audio_data)
+                logger.info(f"Trascrizione: {result['text']}")
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    f.write(result['text'])
+            else:
+                transcribe_audio(audio_data, args.output, args.model, *load_model())
+        except Exception as e:
+            logger.error(f"Errore nell'esecuzione del test: {str(e)}")
+        finally:
+            if export_thread:
+                export_thread.join()
+        return
+
+    if not args.audio:
+        parser.error("specificare --audio oppure --mic")
+
     # Verifica che il file audio esista
     if not os.path.exists(args.audio):
         logger.error(f"Il file audio '{args.audio}' non esiste")
         return
 
     try:
-        transcribe_audio(args.audio, args.output, args.model)
+        if args.server:
+            from whisper_server import transcribe_remote
+
+            result = transcribe_remote(args.server, args.audio)
+            logger.info(f"Trascrizione: {result['text']}")
+            logger.info(f"Attesa in coda: {result['queue_time']:.2f}s, inferenza: {result['inference_time']:.2f}s")
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(result['text'])
+            logger.info(f"Trascrizione salvata in '{args.output}'")
+        else:
+            transcribe_audio(args.audio, args.output, args.model, *load_model())
     except Exception as e:
         logger.error(f"Errore nell'esecuzione del test: {str(e)}")
 
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Script di test per il servizio Whisper residente con audio più lunghi di 30 s.
+
+La frase del file indicato viene ripetuta due volte, separata da silenzio,
+in modo che la seconda ripetizione cada oltre la finestra di 30 s di
+Whisper. Il servizio viene avviato in questo processo e interrogato via HTTP:
+la trascrizione deve contenere entrambe le ripetizioni, cioè l'audio non
+deve essere stato troncato.
+
+Uso:
+    python test_whisper_server.py -a frase_breve.wav [--model tiny]
+"""
+
+import argparse
+import logging
+import threading
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+# test_whisper aggiunge COMMON_DIR (component_test/common) a sys.path
+from test_whisper import COMMON_DIR, WHISPER_SAMPLE_RATE
+from whisper_longform import WHISPER_WINDOW
+from whisper_server import WhisperService, make_handler, transcribe_remote
+
+from audio_loader import load_audio
+
+
+def words(text):
+    """Parole della trascrizione in minuscolo, senza punteggiatura"""
+    return [word.strip(".,;:!?\"'«»").lower() for word in text.split() if word.strip(".,;:!?\"'«»")]
+
+
+def test_long_audio(audio_file, model_size):
+    """Verifica che un audio oltre la finestra di Whisper venga trascritto per intero"""
+    clip, _ = load_audio(audio_file, sr=WHISPER_SAMPLE_RATE)
+    if len(clip) > 10 * WHISPER_SAMPLE_RATE:
+        raise ValueError("Usare una frase breve (al massimo 10 secondi)")
+
+    # Seconda ripetizione oltre i 30 s: con il troncamento andrebbe persa
+    gap = np.zeros(int((WHISPER_WINDOW + 5) * WHISPER_SAMPLE_RATE) - len(clip), dtype=np.float32)
+    long_audio = np.concatenate([clip, gap, clip]).astype(np.float32)
+
+    service = WhisperService(model_size, max_batch=4, max_wait_ms=0)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(service))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    try:
+        print("\nTest 1: Frase breve")
+        short_words = words(transcribe_remote(url, clip)["text"])
+        print(f"  {' '.join(short_words)}")
+        assert short_words, "La frase breve non è stata trascritta"
+
+        print(f"\nTest 2: Audio di {len(long_audio) / WHISPER_SAMPLE_RATE:.1f} secondi")
+        result = transcribe_remote(url, long_audio)
+        long_words = words(result["text"])
+        print(f"  {' '.join(long_words)}")
+        assert result["audio_duration"] > WHISPER_WINDOW, "Il servizio non ha ricevuto l'audio completo"
+        assert len(long_words) >= 1.5 * len(short_words), "La trascrizione è stata troncata a 30 secondi"
+        last_words = short_words[-2:]
+        assert long_words[-len(last_words):] == last_words, "La seconda ripetizione della frase manca dalla trascrizione"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Testa il servizio Whisper residente con audio più lunghi di 30 s")
+    parser.add_argument('-a', '--audio', type=str, required=True, help='File audio con una frase breve (max 10 s)')
+    parser.add_argument('-m', '--model', type=str, default="tiny",
+                        choices=["tiny", "base", "small", "medium", "large"],
+                        help='Dimensione del modello Whisper da utilizzare (default: tiny)')
+
+    args = parser.parse_args()
+
+    test_long_audio(args.audio, args.model)
+    print("\nTest completato con successo!")
+
+
+if __name__ == '__main__':
+    main()
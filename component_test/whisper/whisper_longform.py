@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Trascrizione di registrazioni lunghe con Whisper.
+
+Whisper elabora al massimo 30 secondi per volta: oltre quella durata il
+processor tronca l'audio senza avvisare. Qui l'audio viene diviso in finestre
+sovrapposte, le finestre vengono trascritte a gruppi con una sola chiamata a
+generate (con i timestamp dei segmenti) e i testi vengono ricuciti usando i
+tempi assoluti: ogni finestra "possiede" la propria parte centrale e metà di
+ciascuna sovrapposizione, così le frasi ripetute nelle due finestre vicine
+vengono tenute una sola volta.
+
+Le finestre sono viste sull'array originale e le feature vengono calcolate
+solo per il gruppo corrente, quindi la memoria usata dal modello non dipende
+dalla durata della registrazione. I segmenti vengono restituiti man mano che
+i gruppi terminano, senza aspettare la fine del file.
+
+Uso:
+    python whisper_longform.py -a riunione.mp3 -o trascrizione.txt [--chunk_length 30] [--overlap 5] [--batch_size 4]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import torch
+
+from test_whisper import WHISPER_SAMPLE_RATE, load_whisper_model
+
+# Rende importabili i moduli condivisi in component_test/common
+COMMON_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from audio_loader import load_audio
+from inference_profile import PROFILES, model_dtype
+
+logger = logging.getLogger(__name__)
+
+# Durata massima della finestra di Whisper in secondi
+WHISPER_WINDOW = 30.0
+
+
+def chunk_audio(audio_data, chunk_length=WHISPER_WINDOW, overlap=5.0, sampling_rate=WHISPER_SAMPLE_RATE):
+    """
+    Divide l'audio in finestre sovrapposte.
+
+    Args:
+        audio_data (numpy.ndarray): Campioni audio mono
+        chunk_length (float): Durata di ogni finestra in secondi (al massimo 30)
+        overlap (float): Sovrapposizione tra finestre consecutive in secondi
+        sampling_rate (int): Frequenza di campionamento dell'audio
+
+    Returns:
+        list: Tuple (inizio in secondi, vista sui campioni della finestra)
+    """
+    if not 0 < chunk_length <= WHISPER_WINDOW:
+        raise ValueError(f"chunk_length deve essere compreso tra 0 e {WHISPER_WINDOW:.0f} secondi")
+    if not 0 <= overlap < chunk_length:
+        raise ValueError("overlap deve essere non negativo e minore di chunk_length")
+
+    chunk_samples = int(round(chunk_length * sampling_rate))
+    step = chunk_samples - int(round(overlap * sampling_rate))
+
+    chunks = []
+    start = 0
+    while True:
+        chunks.append((start / sampling_rate, audio_data[start:start + chunk_samples]))
+        if start + chunk_samples >= len(audio_data):
+            break
+        start += step
+    return chunks
+
+
+def _owned_range(index, chunks, overlap):
+    """Intervallo di tempo assoluto di cui la finestra index è responsabile"""
+    chunk_start, samples = chunks[index]
+    chunk_end = chunk_start + len(samples) / WHISPER_SAMPLE_RATE
+    owned_start = chunk_start + overlap / 2 if index > 0 else float("-inf")
+    owned_end = chunk_end - overlap / 2 if index < len(chunks) - 1 else float("inf")
+    return owned_start, owned_end
+
+
+def stitch_segments(chunk_segments, index, chunks, overlap, previous=None):
+    """
+    Converte i segmenti di una finestra in tempi assoluti e tiene solo quelli
+    che cadono nella sua parte di competenza.
+
+    Args:
+        chunk_segments (list): Segmenti {"text", "start", "end"} relativi alla finestra
+        index (int): Indice della finestra in chunks
+        chunks (list): Finestre restituite da chunk_audio()
+        overlap (float): Sovrapposizione usata da chunk_audio()
+        previous (dict, optional): Ultimo segmento già accettato, per scartare i duplicati
+
+    Returns:
+        list: Segmenti {"text", "start", "end"} con tempi assoluti
+    """
+    chunk_start, samples = chunks[index]
+    chunk_duration = len(samples) / WHISPER_SAMPLE_RATE
+    owned_start, owned_end = _owned_range(index, chunks, overlap)
+
+    stitched = []
+    for segment in chunk_segments:
+        text = segment["text"].strip()
+        if not text:
+            continue
+        # Whisper può omettere il timestamp finale o superare la durata reale della finestra
+        end = segment["end"] if segment["end"] is not None else chunk_duration
+        start = chunk_start + min(segment["start"], chunk_duration)
+        end = chunk_start + min(max(end, segment["start"]), chunk_duration)
+
+        midpoint = (start + end) / 2
+        if not owned_start <= midpoint < owned_end:
+            continue
+
+        # Stesso testo già accettato a cavallo della sovrapposizione
+        if previous and text == previous["text"] and start < previous["end"]:
+            continue
+
+        previous = {"text": text, "start": round(start, 2), "end": round(end, 2)}
+        stitched.append(previous)
+    return stitched
+
+
+def _transcribe_chunks(chunk_arrays, processor, model, device):
+    """Trascrive un gruppo di finestre con timestamp, restituendo i segmenti di ciascuna"""
+    input_features = processor(list(chunk_arrays), sampling_rate=WHISPER_SAMPLE_RATE,
+                               return_tensors="pt").input_features.to(device, dtype=model_dtype(model))
+
+    with torch.no_grad():
+        predicted_ids = model.generate(input_features, return_timestamps=True)
+
+    decoded = processor.batch_decode(predicted_ids, skip_special_tokens=True, output_offsets=True)
+    results = []
+    for item in decoded:
+        offsets = item.get("offsets") or []
+        if offsets:
+            results.append([
+                {"text": offset["text"], "start": offset["timestamp"][0], "end": offset["timestamp"][1]}
+                for offset in offsets
+            ])
+        else:
+            # Nessun timestamp generato: il testo vale per tutta la finestra
+            results.append([{"text": item["text"], "start": 0.0, "end": None}])
+    return results
+
+
+def iter_transcribe_long(audio_data, processor, model, device, chunk_length=WHISPER_WINDOW, overlap=5.0,
+                         batch_size=4):
+    """
+    Trascrive un array audio di qualsiasi durata, restituendo i segmenti man mano.
+
+    Args:
+        audio_data (numpy.ndarray): Campioni float32 a 16 kHz
+        processor, model, device: Modello caricato con load_whisper_model()
+        chunk_length (float): Durata delle finestre in secondi
+        overlap (float): Sovrapposizione tra finestre in secondi
+        batch_size (int): Numero di finestre trascritte con una sola chiamata a generate
+
+    Yields:
+        dict: Segmenti {"text", "start", "end"} in ordine, con tempi assoluti in secondi
+    """
+    chunks = chunk_audio(audio_data, chunk_length, overlap)
+    logger.info(f"Audio di {len(audio_data) / WHISPER_SAMPLE_RATE:.1f} secondi diviso in {len(chunks)} finestre")
+
+    previous = None
+    for batch_start in range(0, len(chunks), batch_size):
+        batch = chunks[batch_start:batch_start + batch_size]
+        start_time = time.time()
+        batch_segments = _transcribe_chunks([samples for _, samples in batch], processor, model, device)
+        logger.debug(f"Finestre {batch_start}-{batch_start + len(batch) - 1} trascritte "
+                     f"in {time.time() - start_time:.2f} secondi")
+
+        for offset, chunk_segments in enumerate(batch_segments):
+            for segment in stitch_segments(chunk_segments, batch_start + offset, chunks, overlap, previous):
+                previous = segment
+                yield segment
+
+
+def transcribe_long(audio_data, processor, model, device, chunk_length=WHISPER_WINDOW, overlap=5.0,
+                    batch_size=4, on_segment=None):
+    """
+    Trascrive un array audio di qualsiasi durata e restituisce testo e segmenti.
+
+    Args:
+        on_segment (callable, optional): Chiamata con ogni segmento appena disponibile
+        (gli altri argomenti come in iter_transcribe_long)
+
+    Returns:
+        tuple: (testo completo, lista dei segmenti)
+    """
+    segments = []
+    for segment in iter_transcribe_long(audio_data, processor, model, device, chunk_length, overlap, batch_size):
+        segments.append(segment)
+        if on_segment:
+            on_segment(segment)
+    return " ".join(segment["text"] for segment in segments), segments
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Trascrizione di registrazioni lunghe con Whisper')
+    parser.add_argument('-a', '--audio', type=str, required=True, help='Percorso del file audio da trascrivere')
+    parser.add_argument('-o', '--output', type=str, default='whisper_transcript.txt',
+                        help='File di output per la trascrizione (default: whisper_transcript.txt)')
+    parser.add_argument('-m', '--model', type=str, default="small",
+                        choices=["tiny", "base", "small", "medium", "large"],
+                        help='Dimensione del modello Whisper da utilizzare (default: small)')
+    parser.add_argument('--chunk_length', type=float, default=WHISPER_WINDOW,
+                        help='Durata delle finestre in secondi (default: 30)')
+    parser.add_argument('--overlap', type=float, default=5.0,
+                        help='Sovrapposizione tra finestre in secondi (default: 5)')
+    parser.add_argument('--batch_size', type=int, default=4,
+                        help='Finestre trascritte insieme (default: 4)')
+    parser.add_argument('--profile', choices=PROFILES, default="fp32",
+                        help='Profilo di inferenza: fp32, int8, bf16, fp16 su GPU (default: fp32)')
+    parser.add_argument('--threads', type=int, help='Numero di thread di PyTorch (default: automatico)')
+
+    args = parser.parse_args()
+
+    processor, model, device = load_whisper_model(args.model, profile=args.profile, num_threads=args.threads)
+    audio_data, _ = load_audio(args.audio, sr=WHISPER_SAMPLE_RATE)
+
+    start_time = time.time()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        # Le righe vengono scritte appena disponibili, così il file cresce durante la trascrizione
+        def write_segment(segment):
+            logger.info(f"[{segment['start']:7.2f} - {segment['end']:7.2f}] {segment['text']}")
+            f.write(segment["text"] + "\n")
+            f.flush()
+
+        _, segments = transcribe_long(audio_data, processor, model, device, args.chunk_length,
+                                      args.overlap, args.batch_size, on_segment=write_segment)
+
+    elapsed = time.time() - start_time
+    duration = len(audio_data) / WHISPER_SAMPLE_RATE
+    logger.info(f"{len(segments)} segmenti trascritti in {elapsed:.2f} secondi "
+                f"(RTF {elapsed / duration if duration else 0:.2f})")
+    logger.info(f"Trascrizione salvata in '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Servizio di trascrizione Whisper residente.
+
+Il modello viene caricato una sola volta all'avvio e "scaldato" con una
+trascrizione di silenzio; le richieste HTTP vengono messe in coda e servite
+da un worker dedicato, così il costo di avvio si paga una volta per processo
+e non a ogni frase. Ogni risposta riporta separatamente tempo di attesa in
+coda e tempo di inferenza; /health riporta il tempo di caricamento.
+
+Il worker applica un micro-batching dinamico: dopo la prima richiesta
+attende al massimo max_wait_ms millisecondi (o fino a max_batch richieste)
+e trascrive tutte quelle arrivate con una sola chiamata a generate.
+max_wait_ms=0 e max_batch=1 equivalgono a servire una richiesta alla volta;
+valori più alti aumentano il throughput con utenti concorrenti al costo di
+una latenza aggiuntiva limitata da max_wait_ms. Gli audio più lunghi di 30 s
+non entrano nel batch ma vengono trascritti a finestre (whisper_longform.py),
+così non vengono troncati.
+
+Endpoint:
+    POST /transcribe   corpo: file audio (WAV, FLAC, MP3 o altri formati leggibili da ffmpeg),
+                       oppure JSON {"path": "..."} per un file locale al server,
+                       oppure PCM float32 mono a 16 kHz con Content-Type audio/pcm-f32
+    GET  /health       stato del servizio, tempi di caricamento e statistiche
+
+Uso:
+    python whisper_server.py [--model small] [--port 8090] [--max_queue 32] [--max_batch 8] [--max_wait_ms 20]
+"""
+
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# test_whisper aggiunge COMMON_DIR (component_test/common) a sys.path
+from test_whisper import COMMON_DIR, WHISPER_SAMPLE_RATE, load_whisper_model, transcribe_arrays
+from whisper_longform import WHISPER_WINDOW, transcribe_long
+
+from audio_loader import load_audio
+from feature_cache import enable_feature_cache
+from http_client import INFERENCE_TIMEOUT, get_session, json_response
+from inference_profile import PROFILES
+
+logger = logging.getLogger(__name__)
+
+# Content-Type per l'invio diretto di campioni float32 a 16 kHz
+PCM_CONTENT_TYPE = "audio/pcm-f32"
+
+
+class TranscriptionJob:
+    """Una richiesta di trascrizione in attesa del worker"""
+
+    def __init__(self, audio_data):
+        self.audio_data = audio_data
+        self.enqueued_at = time.time()
+        self.done = threading.Event()
+        self.text = None
+        self.error = None
+        self.queue_time = 0.0
+        self.inference_time = 0.0
+        self.batch_size = 0
+
+
+class WhisperService:
+    def __init__(self, model_size="small", device=None, max_queue=32, max_batch=8, max_wait_ms=20,
+                 profile="fp32", num_threads=None, compile_model=False, feature_cache_dir=None):
+        """
+        Carica il modello Whisper e avvia il worker che serve la coda delle richieste.
+
+        Args:
+            model_size (str): Dimensione del modello Whisper
+            device (str, optional): Dispositivo da usare (default: cuda se disponibile)
+            max_queue (int): Numero massimo di richieste in attesa
+            max_batch (int): Numero massimo di richieste trascritte in un unico batch
+            max_wait_ms (float): Attesa massima in millisecondi per riempire un batch
+            profile (str): Profilo di inferenza (fp32, int8, bf16, fp16)
+            num_threads (int, optional): Thread di PyTorch per l'inferenza su CPU
+            compile_model (bool): Se True compila il forward con torch.compile
+            feature_cache_dir (str, optional): Directory della cache delle feature audio
+        """
+        self.model_size = model_size
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.requests_served = 0
+        self.batches_served = 0
+        self.total_inference_time = 0.0
+
+        start_time = time.time()
+        self.processor, self.model, self.device = load_whisper_model(model_size, device, profile,
+                                                                     num_threads, compile_model)
+        self.profile = profile
+        self.load_time = time.time() - start_time
+        logger.info(f"Modello caricato in {self.load_time:.2f} secondi")
+        self.feature_cache = enable_feature_cache(self.processor, feature_cache_dir) if feature_cache_dir else None
+
+        # La prima inferenza è più lenta (allocazioni, kernel): la si paga all'avvio
+        start_time = time.time()
+        self.transcribe_batch([np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32)])
+        self.warmup_time = time.time() - start_time
+        logger.info(f"Warm-up completato in {self.warmup_time:.2f} secondi")
+
+        self.worker = threading.Thread(target=self._worker_loop, name="whisper-worker", daemon=True)
+        self.worker.start()
+
+    def transcribe_batch(self, audio_arrays):
+        """
+        Trascrive una lista di array audio con il modello residente. Gli audio entro
+        la finestra di Whisper sono trascritti in un unico batch; quelli più lunghi,
+        che il processor troncherebbe a 30 s, vengono trascritti a finestre.
+        """
+        max_samples = int(WHISPER_WINDOW * WHISPER_SAMPLE_RATE)
+        short = [i for i, audio_data in enumerate(audio_arrays) if len(audio_data) <= max_samples]
+        texts = [None] * len(audio_arrays)
+        short_texts = transcribe_arrays([audio_arrays[i] for i in short], self.processor, self.model, self.device)
+        for i, text in zip(short, short_texts):
+            texts[i] = text
+
+        for i, audio_data in enumerate(audio_arrays):
+            if len(audio_data) > max_samples:
+                texts[i], _ = transcribe_long(audio_data, self.processor, self.model, self.device)
+        return texts
+
+    def _collect_batch(self):
+        """Attende la prima richiesta e raccoglie le successive fino a max_batch o max_wait"""
+        batch = [self.jobs.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    batch.append(self.jobs.get(timeout=remaining))
+                else:
+                    # Tempo scaduto: prende comunque ciò che è già in coda, senza attendere
+                    batch.append(self.jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker_loop(self):
+        while True:
+            self._run_jobs(self._collect_batch())
+
+    def _run_jobs(self, jobs):
+        """Esegue l'inferenza su un gruppo di richieste e sveglia i chiamanti"""
+        start_time = time.time()
+        for job in jobs:
+            job.queue_time = start_time - job.enqueued_at
+        try:
+            texts = self.transcribe_batch([job.audio_data for job in jobs])
+        except Exception as e:
+            logger.error(f"Errore durante la trascrizione: {str(e)}")
+            texts = [None] * len(jobs)
+            for job in jobs:
+                job.error = str(e)
+        inference_time = time.time() - start_time
+
+        self.requests_served += len(jobs)
+        self.batches_served += 1
+        self.total_inference_time += inference_time
+        for job, text in zip(jobs, texts):
+            job.text = text
+            job.inference_time = inference_time
+            job.batch_size = len(jobs)
+            job.done.set()
+
+    def submit(self, audio_data, timeout=None):
+        """
+        Accoda un array audio e attende la trascrizione.
+
+        Raises:
+            queue.Full: Se la coda è piena
+        """
+        job = TranscriptionJob(audio_data)
+        self.jobs.put_nowait(job)
+        job.done.wait(timeout)
+        return job
+
+    def health(self):
+        return {
+            "status": "ok",
+            "model": f"openai/whisper-{self.model_size}",
+            "device": self.device,
+            "profile": self.profile,
+            "load_time": self.load_time,
+            "warmup_time": self.warmup_time,
+            "queue_size": self.jobs.qsize(),
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "requests_served": self.requests_served,
+            "batches_served": self.batches_served,
+            "avg_batch_size": self.requests_served / self.batches_served if self.batches_served else None,
+            "avg_inference_time": self.total_inference_time / self.batches_served if self.batches_served else None,
+            "feature_cache": self.feature_cache.stats() if self.feature_cache else None
+        }
+
+
+def decode_request_audio(content_type, body):
+    """Converte il corpo della richiesta in un array float32 mono a 16 kHz"""
+    if content_type.startswith(PCM_CONTENT_TYPE):
+        return np.frombuffer(body, dtype=np.float32)
+
+    if content_type.startswith("application/json"):
+        path = json.loads(body.decode("utf-8"))["path"]
+        audio_data, _ = load_audio(path, sr=WHISPER_SAMPLE_RATE)
+        return audio_data
+
+    # File audio codificato: decodificato direttamente dai byte, senza file temporaneo
+    audio_data, _ = load_audio(body, sr=WHISPER_SAMPLE_RATE)
+    return audio_data
+
+
+def make_handler(service):
+    class WhisperRequestHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(service.health())
+            else:
+                self._send_json({"error": "Endpoint non trovato"}, status=404)
+
+        def do_POST(self):
+            if self.path != "/transcribe":
+                self._send_json({"error": "Endpoint non trovato"}, status=404)
+                return
+
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                decode_start = time.time()
+                audio_data = decode_request_audio(self.headers.get("Content-Type", ""), body)
+                decode_time = time.time() - decode_start
+            except Exception as e:
+                self._send_json({"error": f"Audio non valido: {e}"}, status=400)
+                return
+
+            try:
+                job = service.submit(audio_data)
+            except queue.Full:
+                self._send_json({"error": "Coda piena, riprovare più tardi"}, status=503)
+                return
+
+            if job.error:
+                self._send_json({"error": job.error}, status=500)
+                return
+
+            self._send_json({
+                "text": job.text,
+                "audio_duration": len(audio_data) / WHISPER_SAMPLE_RATE,
+                "decode_time": decode_time,
+                "queue_time": job.queue_time,
+                "inference_time": job.inference_time,
+                "batch_size": job.batch_size
+            })
+
+    return WhisperRequestHandler
+
+
+def transcribe_remote(url, audio, session=None, timeout=INFERENCE_TIMEOUT):
+    """
+    Invia un file audio (o un array float32 a 16 kHz) al servizio residente.
+
+    Args:
+        url (str): URL base del servizio, es. http://localhost:8090
+        audio (str or numpy.ndarray): Percorso del file audio oppure campioni float32 a 16 kHz
+        session (requests.Session, optional): Sessione HTTP da usare
+        timeout (float or tuple): Timeout (connessione, lettura); la trascrizione di audio lunghi richiede minuti
+
+    Returns:
+        dict: Risposta del servizio (text, queue_time, inference_time, ...)
+    """
+    session = session or get_session()
+    if isinstance(audio, np.ndarray):
+        data = np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+        headers = {"Content-Type": PCM_CONTENT_TYPE}
+    else:
+        with open(audio, 'rb') as f:
+            data = f.read()
+        headers = {"Content-Type": "application/octet-stream"}
+
+    response = session.post(f"{url.rstrip('/')}/transcribe", data=data, headers=headers, timeout=timeout)
+    return json_response(response, "servizio di trascrizione")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Servizio di trascrizione Whisper residente')
+    parser.add_argument('-m', '--model', type=str, default="small",
+                        choices=["tiny", "base", "small", "medium", "large"],
+                        help='Dimensione del modello Whisper da utilizzare (default: small)')
+    parser.add_argument('--host', default="127.0.0.1", help='Indirizzo di ascolto (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8090, help='Porta di ascolto (default: 8090)')
+    parser.add_argument('--max_queue', type=int, default=32, help='Numero massimo di richieste in coda (default: 32)')
+    parser.add_argument('--max_batch', type=int, default=8,
+                        help='Numero massimo di richieste trascritte insieme (default: 8, 1 disattiva il batching)')
+    parser.add_argument('--max_wait_ms', type=float, default=20,
+                        help='Attesa massima in ms per riempire un batch (default: 20)')
+    parser.add_argument('--profile', choices=PROFILES, default="fp32",
+                        help='Profilo di inferenza: fp32, int8, bf16, fp16 su GPU (default: fp32)')
+    parser.add_argument('--threads', type=int, help='Numero di thread di PyTorch (default: automatico)')
+    parser.add_argument('--compile', action='store_true', help='Compila il modello con torch.compile')
+    parser.add_argument('--feature_cache', type=str, help='Directory della cache delle feature audio (opzionale)')
+
+    args = parser.parse_args()
+
+    service = WhisperService(args.model, max_queue=args.max_queue,
+                             max_batch=args.max_batch, max_wait_ms=args.max_wait_ms,
+                             profile=args.profile, num_threads=args.threads, compile_model=args.compile,
+                             feature_cache_dir=args.feature_cache)
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    logger.info(f"Servizio Whisper in ascolto su http://{args.host}:{args.port}")
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Servizio interrotto dall'utente")
+    finally:
+        httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()